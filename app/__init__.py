@@ -3,9 +3,15 @@ import sys
 import json
 from flask import Flask
 from werkzeug.security import generate_password_hash
-# [NEW] Thêm migrate vào import
-from .extensions import db, login_manager, oauth, csrf, migrate
-from .models import User, Product, AICache
+# Bộ đo khởi động phải được nạp đầu tiên để đo được chi phí import của toàn bộ phần còn lại
+from .startup_profiler import get_startup_profiler
+
+startup_profiler = get_startup_profiler()  # Bật bằng biến môi trường STARTUP_PROFILE
+
+with startup_profiler.phase('import_extensions_models'):
+    # [NEW] Thêm migrate vào import
+    from .extensions import db, login_manager, oauth, csrf, migrate
+    from .models import User, Product, AICache
 
 # =========================================================================
 # [FIX WINDOWS ERROR] Ép Terminal của Windows đọc được Emoji UTF-8
@@ -29,24 +35,28 @@ def create_app(test_config=None):
     """
     app = Flask(__name__)
     # 1. Import file lỗi và file task
-    from .errors import errors_bp
+    with startup_profiler.phase('import_errors'):
+        from .errors import errors_bp
 
     # 1. Cấu hình App & Load .env
     # (Load thủ công vì file này nằm trong thư mục con app/)
-    env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-    if os.path.exists(env_path):
-        # [FIX] Thêm encoding='utf-8' để đọc được tiếng Việt trong file .env
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#') or '=' not in line: continue
-                key, val = line.split('=', 1)
-                os.environ[key.strip()] = val.strip()
+    with startup_profiler.phase('env_parsing'):
+        env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
+        if os.path.exists(env_path):
+            # [FIX] Thêm encoding='utf-8' để đọc được tiếng Việt trong file .env
+            with open(env_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#') or '=' not in line: continue
+                    key, val = line.split('=', 1)
+                    os.environ[key.strip()] = val.strip()
 
     # Sử dụng config từ app.py cũ của bạn
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'super-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///mobilestore.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Chế độ phân tích ý định tìm kiếm: local_first (mặc định) | llm_first | local_only
+    app.config['SEARCH_INTENT_MODE'] = os.environ.get('SEARCH_INTENT_MODE', 'local_first')
 
     # [NEW] Cấu hình Upload File
     # Tạo thư mục static/uploads nếu chưa có
@@ -56,27 +66,29 @@ def create_app(test_config=None):
     app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # Giới hạn file tối đa 2MB
 
     # 2. Khởi tạo Extensions
-    db.init_app(app)
-    csrf.init_app(app)
-    login_manager.init_app(app)
-    login_manager.login_view = 'auth.login'
-    oauth.init_app(app)
+    with startup_profiler.phase('extension_init'):
+        db.init_app(app)
+        csrf.init_app(app)
+        login_manager.init_app(app)
+        login_manager.login_view = 'auth.login'
+        oauth.init_app(app)
 
-    # [TEST] Áp dụng config test nếu có (QUAN TRỌNG ĐỂ FIX LỖI TEST)
-    if test_config:
-        app.config.update(test_config)
+        # [TEST] Áp dụng config test nếu có (QUAN TRỌNG ĐỂ FIX LỖI TEST)
+        if test_config:
+            app.config.update(test_config)
 
-    # [NEW] Khởi tạo Flask-Migrate
-    migrate.init_app(app, db)
+        # [NEW] Khởi tạo Flask-Migrate
+        migrate.init_app(app, db)
 
     # Đăng ký Google OAuth (Logic từ app.py cũ)
-    oauth.register(
-        name='google',
-        client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-        client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_kwargs={'scope': 'openid email profile'}
-    )
+    with startup_profiler.phase('oauth_registration'):
+        oauth.register(
+            name='google',
+            client_id=os.environ.get('GOOGLE_CLIENT_ID'),
+            client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
+            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            client_kwargs={'scope': 'openid email profile'}
+        )
 
     # 3. Đăng ký Filter Tiền tệ
     @app.template_filter('vnd')
@@ -94,19 +106,33 @@ def create_app(test_config=None):
         return "{:,.0f} đ".format(value).replace(",", ".")
 
     # 4. Đăng ký Blueprints (Routes)
-    from .routes.main import main_bp
-    from .routes.auth import auth_bp
-    from .routes.admin import admin_bp
+    # Tách riêng routes.main vì nó kéo theo các import nặng (app.utils, Search Engine, AI...)
+    with startup_profiler.phase('import_routes_main'):
+        from .routes.main import main_bp
+    with startup_profiler.phase('import_routes_auth_admin'):
+        from .routes.auth import auth_bp
+        from .routes.admin import admin_bp
 
-    app.register_blueprint(main_bp)
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(admin_bp)
+    with startup_profiler.phase('register_blueprints'):
+        app.register_blueprint(main_bp)
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(admin_bp)
 
-    app.register_blueprint(errors_bp)
+        app.register_blueprint(errors_bp)
 
     # 5. Kích hoạt các hệ thống chạy ngầm (Chỉ khi không chạy Test)
     if not app.config.get('TESTING'):
-
+        with startup_profiler.phase('background_services'):
+            # Luồng nền Bộ đệm AI: Ghi Bảng AICache theo lô + Dọn dẹp bản ghi hết hạn định kỳ
+            from .ai_cache import get_ai_response_cache
+            with app.app_context():
+                get_ai_response_cache().start_background()
+
+            # Nạp sẵn CLIP / MiniLM / ChromaDB ở luồng nền (Tùy chọn, VD: Worker chuyên Visual Search)
+            # Mặc định các Model chỉ được nạp ở request đầu tiên cần đến chúng
+            if os.environ.get('AI_WARM_UP', '').lower() in ('1', 'true', 'yes'):
+                from .ai_resources import start_background_warm_up
+                start_background_warm_up()
 
         # ---> [HOTFIX BẢO MẬT WINDOWS] <---
         # Ép tất cả các file stream ghi log phải dùng chuẩn UTF-8
@@ -120,6 +146,8 @@ def create_app(test_config=None):
 
         # --------------------------------------------------------------
 
+    # Ghi báo cáo khởi động (chỉ khi bật STARTUP_PROFILE, và chỉ ở lần create_app() đầu tiên)
+    startup_profiler.finish()
     return app
 
 
@@ -335,26 +363,29 @@ def initialize_database():
 
         db.session.commit() # Commit lưu vào DB để sinh ra ID cho sản phẩm
 
+        # Dữ liệu mẫu được bơm thẳng vào DB -> Đánh dấu Chỉ mục tìm kiếm RAM cần nạp lại
+        from .search_engine import get_catalog_index
+        get_catalog_index().invalidate()
+
         # [ĐỒNG BỘ TRƯỜNG HỢP 2] - Quét những dữ liệu mới được thêm vào DB ở vòng lặp trên
-        from .utils import sync_product_to_vector_db, sync_product_image_to_vector_db
-        for p in new_products:
-            sync_product_to_vector_db(p)
-            sync_product_image_to_vector_db(p)
+        from .text_indexer import bulk_sync_products_to_vector_db
+        from .visual_indexer import bulk_sync_product_images
+        bulk_sync_products_to_vector_db(new_products)
+        # Vector Ảnh: tải song song + CLIP theo lô thay vì từng sản phẩm
+        bulk_sync_product_images(new_products)
 
 
     # ---> [ĐỒNG BỘ TRƯỜNG HỢP 1]: Quét và đồng bộ Ảnh cho những sản phẩm ĐÃ TỒN TẠI TỪ TRƯỚC
     # Luôn chạy đoạn này ở cuối hàm initialize_database() để đảm bảo nếu ChromaDB bị trống thì tự phục hồi lại.
     try:
-        from .utils import product_image_collection, sync_product_image_to_vector_db
+        from .utils import get_product_image_collection
+        from .visual_indexer import bulk_sync_product_images
+        product_image_collection = get_product_image_collection()
         if product_image_collection and product_image_collection.count() == 0:
             print("🔄 Kho AI Visual Search đang trống. Bắt đầu nạp Vector Ảnh từ kho hàng cũ...")
-            all_prods = Product.query.all()
-            count = 0
-            for p in all_prods:
-                if p.image_url:
-                    sync_product_image_to_vector_db(p)
-                    count += 1
-            print(f"✅ Đã phân tích & đồng bộ thành công {count} ảnh vào hệ thống tìm kiếm AI!")
+            result = bulk_sync_product_images(Product.query.all())
+            print(f"✅ Đã phân tích & đồng bộ thành công {result['indexed']} ảnh vào hệ thống tìm kiếm AI! "
+                  f"(Lỗi: {result['failed']}, {result['seconds']}s)")
     except Exception as e:
         print(f"⚠️ Lỗi nạp Vector Ảnh hàng loạt: {e}")
 
@@ -0,0 +1,402 @@
+"""
+Module Bộ đệm Phản hồi AI 2 tầng (Two-tier AI Response Cache) của MobileStore.
+Tầng 1: LRU trong RAM giới hạn theo byte, lưu sẵn đối tượng Python đã giải mã (Hit tốn vài micro-giây).
+Tầng 2: Bảng `AICache` trong Database, được ghi theo lô ở luồng nền (Write-behind)
+để request của khách không phải chờ lệnh COMMIT.
+Vòng đời bản ghi: TTL theo từng hàm AI, Namespace theo phiên bản Prompt, và luồng dọn dẹp
+(Sweeper) xóa bản ghi hết hạn / lỗi thời / lâu không dùng khi vượt ngân sách dung lượng.
+"""
+
+import re
+import json
+import time
+import types
+import queue
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import func as sql_func
+
+from app.extensions import db
+from app.models import AICache
+from app.constants import (
+    AI_CACHE_MEMORY_MAX_BYTES,
+    AI_CACHE_WRITE_BATCH_SIZE,
+    AI_CACHE_WRITE_FLUSH_INTERVAL_SECONDS,
+    AI_CACHE_TTL_SECONDS,
+    AI_CACHE_DEFAULT_TTL_SECONDS,
+    AI_CACHE_MAX_ROWS,
+    AI_CACHE_MAX_DB_BYTES,
+    AI_CACHE_SWEEP_INTERVAL_SECONDS
+)
+
+_MISSING = object()
+DEFAULT_NAMESPACE = 'default'
+
+
+def _utcnow():
+    # SQLite lưu DateTime dạng naive -> so sánh thống nhất bằng giờ UTC không kèm tzinfo
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _fingerprint_code(code, digest):
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _fingerprint_code(const, digest)
+        else:
+            digest.update(repr(const).encode('utf-8'))
+
+
+@functools.lru_cache(maxsize=256)
+def ai_cache_namespace(func):
+    """
+    Namespace phiên bản hóa của một hàm AI: "<tên hàm>:<mã băm Bytecode + hằng số>".
+    Prompt / System Instruction là hằng số trong thân hàm, nên chỉ cần sửa Prompt
+    là Namespace đổi và toàn bộ Cache cũ của hàm đó tự mất hiệu lực (thay cho hậu tố `_v239_final`).
+    Bytecode không đổi suốt vòng đời tiến trình -> Chỉ băm 1 lần cho mỗi hàm (nhớ theo đối tượng hàm),
+    lượt Hit Cache không phải duyệt lại Bytecode.
+    """
+    name = getattr(func, '__name__', 'ai_call')
+    code = getattr(func, '__code__', None)
+    if not isinstance(code, types.CodeType):
+        return name
+    digest = hashlib.md5()
+    _fingerprint_code(code, digest)
+    return f"{name}:{digest.hexdigest()[:10]}"
+
+
+def ai_cache_ttl(func):
+    """Thời gian sống (giây) của phản hồi theo tên hàm AI (cấu hình tại `AI_CACHE_TTL_SECONDS`)."""
+    return AI_CACHE_TTL_SECONDS.get(getattr(func, '__name__', ''), AI_CACHE_DEFAULT_TTL_SECONDS)
+
+
+def serialize_ai_response(value):
+    """Chuẩn hóa phản hồi AI thành chuỗi để lưu vào cột `response_text`."""
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def deserialize_ai_response(text):
+    """Giải mã chuỗi trong Database về dict / list / str như lúc AI trả về."""
+    try:
+        # ---> [HOTFIX] Bóc tách rác Markdown bảo vệ Cache an toàn tuyệt đối
+        text_data = re.sub(r"```json|```", "", text).strip()
+        if text_data.startswith('{') and text_data.endswith('}'):
+            return json.loads(text_data)
+        elif text_data.startswith('[') and text_data.endswith(']'):
+            return json.loads(text_data)
+        return text_data
+    except Exception:
+        return text
+
+
+class ByteBoundedLRU:
+    """LRU an toàn đa luồng, giới hạn tổng dung lượng (byte) thay vì số phần tử."""
+
+    def __init__(self, max_bytes=AI_CACHE_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        # Phần tử lớn hơn cả ngân sách thì không giữ trong RAM (vẫn còn ở Tầng 2)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class AIResponseCache:
+    """
+    Bộ đệm phản hồi AI gắn với 1 Flask App.
+    - get(): RAM -> Database -> Miss (kết quả từ Database được đưa ngược lên RAM).
+    - set(): Ghi RAM ngay lập tức, xếp hàng ghi Database theo lô ở luồng nền.
+      Khi chạy Unit Test (TESTING=True) ghi đồng bộ để dữ liệu có mặt ngay trong DB.
+    - Lượt Hit được gom lại và cập nhật `last_hit_at` / `hit_count` theo lô (phục vụ LRU Eviction).
+    """
+
+    def __init__(self, app, max_bytes=AI_CACHE_MEMORY_MAX_BYTES):
+        self.app = app
+        self.memory = ByteBoundedLRU(max_bytes)
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._touches = {}
+        self._namespaces = {}
+        self._last_sweep = time.monotonic()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.db_writes = 0
+        self.write_batches = 0
+        self.sweeps = 0
+        self.swept_rows = 0
+
+    def get(self, key, default=None):
+        now = _utcnow()
+        entry = self.memory.get(key)
+        if entry is not _MISSING:
+            value, expires_at = entry
+            if expires_at is None or expires_at > now:
+                self._count('memory_hits')
+                self._touch(key)
+                return value
+            self.memory.pop(key)
+
+        try:
+            row = AICache.query.filter(
+                AICache.prompt_hash == key,
+                db.or_(AICache.expires_at.is_(None), AICache.expires_at > now)
+            ).first()
+        except Exception as e:
+            print(f"Cache Error: {e}")
+            row = None
+
+        if row is None:
+            self._count('misses')
+            return default
+
+        value = deserialize_ai_response(row.response_text)
+        self.memory.set(key, (value, row.expires_at), row.size_bytes or len(row.response_text.encode('utf-8')))
+        self._count('db_hits')
+        self._touch(key)
+        return value
+
+    def set(self, key, value, namespace=DEFAULT_NAMESPACE, ttl=AI_CACHE_DEFAULT_TTL_SECONDS):
+        text = serialize_ai_response(value)
+        size = len(text.encode('utf-8'))
+        expires_at = _utcnow() + timedelta(seconds=ttl) if ttl else None
+        self.memory.set(key, (value, expires_at), size)
+
+        # Ghi nhớ phiên bản hiện hành của từng hàm AI để Sweeper dọn các phiên bản cũ
+        with self._stats_lock:
+            self._namespaces[namespace.split(':', 1)[0]] = namespace
+
+        item = (key, text, namespace, expires_at, size)
+        if self.app.config.get('TESTING'):
+            self._write_batch([item])
+        else:
+            self._queue.put(item)
+            self._ensure_worker()
+
+    def flush(self):
+        """Ghi ngay toàn bộ hàng đợi + lượt Hit xuống Database (dùng khi Shutdown / Unit Test)."""
+        batch = self._drain()
+        while batch:
+            with self.app.app_context():
+                self._write_batch(batch)
+            batch = self._drain()
+        with self.app.app_context():
+            self._flush_touches()
+
+    def sweep(self):
+        """
+        Dọn dẹp Bảng AICache, theo thứ tự:
+        1. Bản ghi đã hết hạn (expires_at).
+        2. Bản ghi của phiên bản Prompt cũ (Namespace khác phiên bản hiện hành) và bản ghi kiểu cũ không có Namespace.
+        3. Nếu vẫn vượt `AI_CACHE_MAX_ROWS` / `AI_CACHE_MAX_DB_BYTES`: xóa bản ghi lâu không được dùng nhất (LRU).
+        """
+        removed = {'expired': 0, 'stale_namespace': 0, 'evicted': 0}
+        now = _utcnow()
+        try:
+            removed['expired'] = AICache.query.filter(
+                AICache.expires_at.isnot(None), AICache.expires_at <= now).delete(synchronize_session=False)
+
+            with self._stats_lock:
+                namespaces = dict(self._namespaces)
+            stale = AICache.query.filter(AICache.namespace.is_(None)).delete(synchronize_session=False)
+            for name, current in namespaces.items():
+                stale += AICache.query.filter(
+                    AICache.namespace.like(f"{name}:%"), AICache.namespace != current
+                ).delete(synchronize_session=False)
+            removed['stale_namespace'] = stale
+
+            total_rows, total_bytes = db.session.query(
+                sql_func.count(AICache.id), sql_func.coalesce(sql_func.sum(AICache.size_bytes), 0)).one()
+            if total_rows > AI_CACHE_MAX_ROWS or total_bytes > AI_CACHE_MAX_DB_BYTES:
+                victims = []
+                oldest_first = db.session.query(AICache.id, AICache.size_bytes).order_by(
+                    sql_func.coalesce(AICache.last_hit_at, AICache.created_at).asc())
+                for row_id, size in oldest_first:
+                    if total_rows <= AI_CACHE_MAX_ROWS and total_bytes <= AI_CACHE_MAX_DB_BYTES:
+                        break
+                    victims.append(row_id)
+                    total_rows -= 1
+                    total_bytes -= size or 0
+                for i in range(0, len(victims), 500):
+                    AICache.query.filter(AICache.id.in_(victims[i:i + 500])).delete(synchronize_session=False)
+                removed['evicted'] = len(victims)
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ AI Cache Sweeper Error: {e}")
+            return removed
+
+        total = sum(removed.values())
+        with self._stats_lock:
+            self.sweeps += 1
+            self.swept_rows += total
+        if total:
+            print(f"🧹 AI Cache Sweeper: Đã dọn {total} bản ghi {removed}")
+        return removed
+
+    def start_background(self):
+        """Khởi động luồng nền (Write-behind + Sweeper) ngay khi App chạy thật, dọn dẹp 1 lượt đầu tiên."""
+        self._last_sweep = float('-inf')
+        self._ensure_worker()
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            ratio = (lambda n: round(n / lookups, 4) if lookups else 0.0)
+            return {
+                'memory_entries': len(self.memory),
+                'memory_bytes': self.memory.current_bytes,
+                'memory_max_bytes': self.memory.max_bytes,
+                'memory_evictions': self.memory.evictions,
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'memory_hit_ratio': ratio(self.memory_hits),
+                'db_hit_ratio': ratio(self.db_hits),
+                'overall_hit_ratio': ratio(self.memory_hits + self.db_hits),
+                'pending_writes': self._queue.qsize(),
+                'db_writes': self.db_writes,
+                'write_batches': self.write_batches,
+                'sweeps': self.sweeps,
+                'swept_rows': self.swept_rows
+            }
+
+    # ------------------------------------------------------------------
+    # Nội bộ
+    # ------------------------------------------------------------------
+    def _count(self, field, amount=1):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def _touch(self, key):
+        with self._stats_lock:
+            self._touches[key] = self._touches.get(key, 0) + 1
+
+    def _flush_touches(self):
+        """Cập nhật `last_hit_at` / `hit_count` cho các khóa vừa được đọc (gom theo số lượt Hit)."""
+        with self._stats_lock:
+            touches, self._touches = self._touches, {}
+        if not touches:
+            return
+
+        by_count = {}
+        for key, count in touches.items():
+            by_count.setdefault(count, []).append(key)
+        now = _utcnow()
+        try:
+            for count, keys in by_count.items():
+                AICache.query.filter(AICache.prompt_hash.in_(keys)).update({
+                    AICache.last_hit_at: now,
+                    AICache.hit_count: sql_func.coalesce(AICache.hit_count, 0) + count
+                }, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ AI Cache Touch Error: {e}")
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < AI_CACHE_WRITE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """Chèn 1 lô bản ghi: 1 truy vấn `IN` lọc khóa đã tồn tại + 1 lệnh COMMIT."""
+        pending = {item[0]: item for item in batch}
+        try:
+            existing = {row.prompt_hash for row in
+                        AICache.query.filter(AICache.prompt_hash.in_(list(pending))).all()}
+            now = _utcnow()
+            new_rows = [
+                AICache(prompt_hash=key, response_text=text, namespace=namespace,
+                        expires_at=expires_at, size_bytes=size, last_hit_at=now, hit_count=0)
+                for key, text, namespace, expires_at, size in pending.values() if key not in existing
+            ]
+            if new_rows:
+                db.session.add_all(new_rows)
+                db.session.commit()
+            self._count('db_writes', len(new_rows))
+            self._count('write_batches')
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ AI Cache Write-behind Error: {e}")
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name='ai-cache-writer', daemon=True)
+                self._worker.start()
+
+    def _run_worker(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=AI_CACHE_WRITE_FLUSH_INTERVAL_SECONDS)
+            except queue.Empty:
+                first = None
+
+            with self.app.app_context():
+                batch = self._drain(first) if first is not None else []
+                if batch:
+                    self._write_batch(batch)
+                self._flush_touches()
+                if time.monotonic() - self._last_sweep >= AI_CACHE_SWEEP_INTERVAL_SECONDS:
+                    self._last_sweep = time.monotonic()
+                    self.sweep()
+                db.session.remove()
+
+
+def get_ai_response_cache():
+    """Lấy bộ đệm phản hồi AI gắn với Flask App hiện tại (Lazy Init trong `app.extensions`)."""
+    app = current_app._get_current_object()
+    cache = app.extensions.get('ai_response_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('ai_response_cache', AIResponseCache(app))
+    return cache
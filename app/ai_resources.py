@@ -0,0 +1,340 @@
+"""
+Module Quản lý Tài nguyên AI nặng (Lazy AI Resources) của MobileStore.
+Torch + CLIP, ChromaDB và Model MiniLM chỉ được nạp ở lần đầu tiên thực sự cần dùng (an toàn đa luồng),
+thay vì ngay khi `import app.utils`. Nhờ vậy Worker Web, bộ Test và các Script CLI
+(data_warehouse_exporter, api_doc_builder...) khởi động gần như tức thì.
+Worker phục vụ Visual Search có thể gọi `warm_up()` để nạp sẵn trước khi nhận request.
+"""
+
+import os
+import time
+import threading
+from collections import namedtuple
+
+CHROMA_DB_PATH = "./chroma_db"
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+CLIP_EMBEDDING_DIM = 512
+# Backend suy luận CLIP (biến môi trường CLIP_BACKEND):
+# - torch: PyTorch fp32 (mặc định, dùng GPU nếu có)
+# - int8 : PyTorch lượng tử hóa động int8 các lớp Linear (chỉ CPU, nhẹ RAM + nhanh hơn ~2 lần)
+# - onnx : Đồ thị ONNX Runtime (CPU), không cần nạp torch sau lần Export đầu tiên
+CLIP_BACKENDS = ('torch', 'int8', 'onnx')
+CLIP_ONNX_PATH = os.path.join("instance", "onnx", CLIP_MODEL_NAME.replace('/', '__') + "-vision.onnx")
+# Kho Vector Ảnh theo nội dung (mỗi Model 1 thư mục riêng vì Vector của các Model không dùng lẫn được)
+IMAGE_EMBEDDING_STORE_DIR = os.path.join("instance", "embedding_cache")
+# Thư mục của Backend Vector NumPy (VECTOR_BACKEND=numpy, xem app/vector_backends.py)
+NUMPY_VECTOR_STORE_DIR = os.path.join("instance", "vector_store")
+TEXT_EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+TEXT_EMBEDDING_DIM = 384
+
+# Bộ công cụ CLIP đã nạp: tên Backend, Processor tiền xử lý ảnh, hàm `encode(pixel_values NumPy) -> NumPy (N x 512)`
+# (chưa chuẩn hóa L2) và thiết bị chạy
+ClipRuntime = namedtuple('ClipRuntime', ['backend', 'processor', 'encode', 'device'])
+
+
+class LazyResource:
+    """
+    Tài nguyên được khởi tạo đúng 1 lần, ở lần gọi `get()` đầu tiên (Double-checked Locking).
+    Nạp thất bại -> Ghi nhớ kết quả None để các request sau không thử nạp lại tốn thời gian.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self.load_seconds = None
+        self.error = None
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    print(f"⚠️ Không thể nạp tài nguyên AI [{self.name}]: {e}")
+                    self._value = None
+                    self.error = str(e)[:200]
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                self._loaded = True
+        return self._value
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def reset(self):
+        """Bỏ tài nguyên đã nạp (VD: Unit Test muốn nạp lại với cấu hình khác)."""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+            self.load_seconds = None
+            self.error = None
+
+    def stats(self):
+        return {
+            'loaded': self._loaded,
+            'available': self._value is not None,
+            'load_seconds': self.load_seconds,
+            'error': self.error
+        }
+
+
+def _load_text_embedder():
+    # 1 bản Model MiniLM duy nhất cho cả tiến trình (xem app/text_embedding.py)
+    from app.text_embedding import TextEmbeddingService
+    return TextEmbeddingService.from_model_name(TEXT_EMBEDDING_MODEL_NAME, dim=TEXT_EMBEDDING_DIM)
+
+
+def clip_backend_name():
+    backend = os.environ.get('CLIP_BACKEND', 'torch').strip().lower()
+    return backend if backend in CLIP_BACKENDS else 'torch'
+
+
+def torch_image_features(model, pixel_values):
+    """Vector đặc trưng ảnh (chưa chuẩn hóa) từ CLIP PyTorch, dùng chung cho Backend torch/int8 và khi Export ONNX."""
+    # ---> [FIX MATRIX LỖI NHÂN MA TRẬN]: Tự tay bóc tách Vector bỏ qua hàm có sẵn
+    vision_outputs = model.vision_model(pixel_values=pixel_values)
+
+    # Trích xuất Pooler Output (Thường là 768 chiều)
+    if hasattr(vision_outputs, 'pooler_output') and vision_outputs.pooler_output is not None:
+        image_features = vision_outputs.pooler_output
+    elif hasattr(vision_outputs, 'last_hidden_state'):
+        image_features = vision_outputs.last_hidden_state[:, 0, :]
+    else:
+        image_features = vision_outputs[1] if isinstance(vision_outputs, tuple) else vision_outputs
+
+    # Bức tường Lửa chặn Lỗi Nhân Ma Trận (1x512 and 768x512)
+    # CHỈ được đẩy qua màn lọc Projection khi và chỉ khi Vector bị sai chiều (khác 512)
+    if hasattr(model, 'visual_projection'):
+        target_dim = model.visual_projection.out_features
+        if image_features.shape[-1] != target_dim:
+            image_features = model.visual_projection(image_features)
+    return image_features
+
+
+def _load_torch_clip_model(device):
+    from transformers import CLIPModel
+    # Mô hình CLIP của OpenAI (Siêu nhẹ, cực nhạy với chi tiết FGVC)
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+    return model.to(device).eval()
+
+
+def _build_torch_runtime(processor, quantized=False):
+    import torch
+
+    if quantized:
+        # Lượng tử hóa động: trọng số các lớp Linear lưu int8, tính toán trên CPU
+        device = torch.device("cpu")
+        model = torch.quantization.quantize_dynamic(_load_torch_clip_model(device), {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        if torch.cuda.is_available():
+            device = torch.device("cuda")
+        elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
+            device = torch.device("mps")
+        else:
+            device = torch.device("cpu")
+        # Đẩy mô hình lên GPU và thiết lập chế độ dự đoán (tốn khoảng ~1.5GB VRAM)
+        model = _load_torch_clip_model(device)
+
+    def encode(pixel_values):
+        with torch.no_grad():
+            features = torch_image_features(model, torch.from_numpy(pixel_values).to(device))
+        # Kéo dữ liệu từ GPU về lại CPU
+        return features.float().cpu().numpy()
+
+    return ClipRuntime('int8' if quantized else 'torch', processor, encode, str(device))
+
+
+def export_clip_onnx(path=CLIP_ONNX_PATH):
+    """Export nhánh thị giác của CLIP (kèm Projection) sang ONNX. Chỉ cần torch ở bước này."""
+    import torch
+
+    class _VisionEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return torch_image_features(self.model, pixel_values)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wrapper = _VisionEncoder(_load_torch_clip_model(torch.device("cpu")))
+    torch.onnx.export(
+        wrapper, torch.zeros(1, 3, 224, 224), path,
+        input_names=['pixel_values'], output_names=['image_embeds'],
+        dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+        opset_version=17
+    )
+    print(f"📦 Đã Export CLIP Vision sang ONNX: {path}")
+    return path
+
+
+def _build_onnx_runtime(processor):
+    import numpy as np
+    import onnxruntime as ort
+
+    if not os.path.exists(CLIP_ONNX_PATH):
+        export_clip_onnx(CLIP_ONNX_PATH)
+    session = ort.InferenceSession(CLIP_ONNX_PATH, providers=['CPUExecutionProvider'])
+
+    def encode(pixel_values):
+        return session.run(None, {'pixel_values': pixel_values.astype(np.float32)})[0]
+
+    return ClipRuntime('onnx', processor, encode, 'cpu')
+
+
+def build_clip_runtime(backend):
+    """Dựng CLIP theo Backend chỉ định (dùng cho `_load_clip` và Script đo Parity / Benchmark)."""
+    from transformers import CLIPProcessor
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    if backend == 'onnx':
+        return _build_onnx_runtime(processor)
+    return _build_torch_runtime(processor, quantized=(backend == 'int8'))
+
+
+def _load_clip():
+    backend = clip_backend_name()
+    try:
+        runtime = build_clip_runtime(backend)
+    except Exception as e:
+        if backend == 'torch':
+            if not isinstance(e, ImportError):
+                raise
+            print("⚠️ Thư viện xử lý ảnh chưa đủ. Chạy lệnh: pip install torch torchvision transformers")
+            return None
+        # Thiếu onnxruntime / Export ONNX lỗi / lượng tử hóa lỗi (RuntimeError, OSError...) -> Quay về PyTorch fp32,
+        # không để 1 lỗi của Backend tối ưu vô hiệu hóa Visual Search suốt vòng đời tiến trình
+        print(f"⚠️ Không dùng được CLIP Backend '{backend}' ({type(e).__name__}: {e}). Quay về PyTorch fp32.")
+        try:
+            runtime = build_clip_runtime('torch')
+        except ImportError:
+            print("⚠️ Thư viện xử lý ảnh chưa đủ. Chạy lệnh: pip install torch torchvision transformers")
+            return None
+
+    print(f"🚀 Visual Search Engine (CLIP Model) initialized: backend={runtime.backend}, device={runtime.device}")
+    return runtime
+
+
+def _load_chroma_client():
+    # Tắt cảnh báo Telemetry của ChromaDB để giao diện Console sạch sẽ
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"
+    import chromadb
+    try:
+        # [HOTFIX] Khóa mõm lỗi rác Telemetry của ChromaDB 0.4.22 (nuốt sạch mọi tham số)
+        from chromadb.telemetry.posthog import Posthog  # type: ignore
+        Posthog.capture = lambda *args, **kwargs: None
+    except Exception:
+        pass
+    return chromadb.PersistentClient(path=CHROMA_DB_PATH)
+
+
+def _load_product_collection():
+    from app.vector_backends import vector_backend_name, ChromaVectorBackend, NumpyVectorBackend
+    embedder = text_embedder.get()
+    if embedder is None:
+        return None
+    if vector_backend_name() == 'numpy':
+        return NumpyVectorBackend(os.path.join(NUMPY_VECTOR_STORE_DIR, "mobile_store_products"),
+                                  dim=TEXT_EMBEDDING_DIM, embedding_function=embedder)
+    client = chroma_client.get()
+    if client is None:
+        return None
+    return ChromaVectorBackend(
+        client.get_or_create_collection(name="mobile_store_products", embedding_function=embedder)
+    )
+
+
+def _load_product_image_collection():
+    from app.vector_backends import vector_backend_name, ChromaVectorBackend, NumpyVectorBackend
+    if vector_backend_name() == 'numpy':
+        return NumpyVectorBackend(os.path.join(NUMPY_VECTOR_STORE_DIR, "product_images"), dim=CLIP_EMBEDDING_DIM)
+    client = chroma_client.get()
+    if client is None:
+        return None
+    return ChromaVectorBackend(
+        client.get_or_create_collection(name="product_images", metadata={"hnsw:space": "cosine"})
+    )
+
+
+def _load_image_embedding_store():
+    from app.embedding_store import EmbeddingStore
+    # Mỗi Backend cho Vector lệch nhau chút ít -> Tách Kho theo Backend để không trộn lẫn
+    store_name = f"{CLIP_MODEL_NAME.replace('/', '__')}__{clip_backend_name()}"
+    return EmbeddingStore(os.path.join(IMAGE_EMBEDDING_STORE_DIR, store_name), dim=CLIP_EMBEDDING_DIM)
+
+
+clip_runtime = LazyResource('clip', _load_clip)
+chroma_client = LazyResource('chroma', _load_chroma_client)
+text_embedder = LazyResource('text_embedder', _load_text_embedder)
+product_collection = LazyResource('product_collection', _load_product_collection)
+product_image_collection = LazyResource('product_image_collection', _load_product_image_collection)
+image_embedding_store = LazyResource('image_embedding_store', _load_image_embedding_store)
+
+AI_RESOURCES = {r.name: r for r in (clip_runtime, chroma_client, text_embedder,
+                                    product_collection, product_image_collection, image_embedding_store)}
+
+
+def get_clip_runtime():
+    return clip_runtime.get()
+
+
+def get_chroma_client():
+    return chroma_client.get()
+
+
+def get_text_embedder():
+    """
+    Dịch vụ nhúng MiniLM dùng chung (Vector DB sản phẩm, AIVectorManager, Semantic Cache).
+    None nếu không tải được.
+    """
+    return text_embedder.get()
+
+
+def get_product_collection():
+    return product_collection.get()
+
+
+def get_product_image_collection():
+    return product_image_collection.get()
+
+
+def get_image_embedding_store():
+    """Kho Vector CLIP trên đĩa, khóa theo SHA-256 của file ảnh (xem app/embedding_store.py)."""
+    return image_embedding_store.get()
+
+
+def warm_up(names=None):
+    """
+    Nạp trước các tài nguyên AI (mặc định: tất cả) để request đầu tiên không phải chờ.
+    Trả về {tên: True/False} cho biết tài nguyên nào đã sẵn sàng.
+    """
+    selected = names or list(AI_RESOURCES)
+    return {name: AI_RESOURCES[name].get() is not None for name in selected}
+
+
+def start_background_warm_up(names=None):
+    """Chạy `warm_up()` trên luồng nền để không chặn quá trình khởi động Worker."""
+    thread = threading.Thread(target=warm_up, args=(names,), name='ai-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def get_ai_resource_stats():
+    """Trạng thái nạp của từng tài nguyên AI (phục vụ API giám sát của Admin)."""
+    stats = {name: resource.stats() for name, resource in AI_RESOURCES.items()}
+    embedder = text_embedder.get() if text_embedder.is_loaded else None
+    if embedder is not None and hasattr(embedder, 'stats'):
+        stats['text_embedder']['service'] = embedder.stats()
+    for resource in (product_collection, product_image_collection):
+        backend = resource.get() if resource.is_loaded else None
+        if backend is not None:
+            try:
+                stats[resource.name]['backend'] = backend.stats()
+            except Exception as e:
+                stats[resource.name]['backend'] = {'error': str(e)[:200]}
+    return stats
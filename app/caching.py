@@ -0,0 +1,170 @@
+"""
+Module Bộ nhớ đệm dùng chung (In-Process Caching Primitives) của MobileStore.
+Cung cấp bộ đệm LRU có hạn sử dụng (TTL) an toàn đa luồng, kèm bộ đếm Hit/Miss
+để Quản trị viên theo dõi và tinh chỉnh kích thước Cache, và bộ gộp lời gọi trùng lặp (Single-flight).
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from app.constants import SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS
+
+
+class TTLLRUCache:
+    """
+    Bộ đệm LRU (Least Recently Used) giới hạn số phần tử, mỗi phần tử có hạn sử dụng (TTL).
+    - Khi đầy: đẩy phần tử lâu không dùng nhất ra ngoài (Eviction).
+    - Khi hết hạn: phần tử bị coi như không tồn tại (Expiration) ở lần đọc kế tiếp.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Đọc giá trị theo khóa, tự động ghi nhận Hit/Miss và làm mới vị trí LRU."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Đọc giá trị còn hạn mà không tính vào thống kê Hit/Miss và không đổi thứ tự LRU."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                return default
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Ghi giá trị vào Cache, `ttl` riêng (giây) sẽ ghi đè TTL mặc định nếu được truyền vào."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Trả về bảng thống kê phục vụ giám sát (Monitoring) và định cỡ Cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi trùng lặp đang chạy đồng thời (Request Coalescing / Single-flight).
+    Với cùng 1 khóa, chỉ luồng đến đầu tiên (Leader) thực thi hàm; các luồng đến sau (Follower)
+    chờ và nhận chung kết quả (hoặc chung Exception) của Leader.
+    Follower chỉ chờ tối đa `wait_timeout` giây: quá hạn thì tự thực thi hàm (không kẹt theo Leader bị treo).
+    """
+
+    def __init__(self, name='default', wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.wait_timeouts = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                is_leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                is_leader = True
+
+        if not is_leader:
+            if not call.event.wait(self.wait_timeout):
+                with self._lock:
+                    self.wait_timeouts += 1
+                    self.executed += 1
+                print(f"⚠️ Single-flight '{self.name}': chờ Leader quá {self.wait_timeout} giây, tự thực thi lời gọi.")
+                return fn(*args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'wait_timeouts': self.wait_timeouts
+            }
+
+
+# Gộp các lời gọi AI giống hệt nhau (cùng mã băm Prompt) trong toàn tiến trình
+ai_call_flight = SingleFlight('ai_call')
@@ -0,0 +1,105 @@
+"""
+Module Cầu dao tự ngắt (Circuit Breaker) bảo vệ các dịch vụ bên ngoài (Gemini API...).
+Khi dịch vụ lỗi liên tục, cầu dao "nhảy" (OPEN) để mọi lời gọi rơi thẳng xuống phương án
+dự phòng nội bộ với độ trễ gần bằng 0, thay vì chờ Timeout ở từng request.
+"""
+
+import time
+import threading
+
+STATE_CLOSED = 'closed'        # Hoạt động bình thường
+STATE_OPEN = 'open'            # Đã ngắt: từ chối mọi lời gọi
+STATE_HALF_OPEN = 'half_open'  # Thăm dò: cho đúng 1 lời gọi đi thử khả năng hồi phục
+
+
+class CircuitBreaker:
+    """
+    Cầu dao 3 trạng thái CLOSED -> OPEN -> HALF_OPEN -> (CLOSED | OPEN).
+    - CLOSED: đếm lỗi liên tiếp, chạm `failure_threshold` thì chuyển OPEN.
+    - OPEN: sau `reset_timeout` giây, lời gọi kế tiếp trở thành Probe (HALF_OPEN).
+    - HALF_OPEN: Probe thành công -> CLOSED, thất bại -> OPEN lại từ đầu.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Đưa cầu dao về trạng thái ban đầu (dùng khi khởi động lại / Unit Test)."""
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+            self._probe_started_at = None
+            self.rejected = 0
+            self.transitions = {}
+
+    def allow_request(self):
+        """Trả về True nếu lời gọi được phép đi tiếp, False nếu phải dùng phương án dự phòng ngay."""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+
+            if self.state == STATE_OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+                self._transition(STATE_HALF_OPEN)
+
+            # Probe "mất tích" quá `reset_timeout` (nơi gọi không báo kết quả) -> cho Probe mới
+            if self.state == STATE_HALF_OPEN and (
+                    not self._probe_in_flight or self._clock() - self._probe_started_at >= self.reset_timeout):
+                self._probe_in_flight = True
+                self._probe_started_at = self._clock()
+                return True
+
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        """Kiểm tra nhanh (không chiếm lượt Probe) xem lời gọi lúc này có chắc chắn bị từ chối không."""
+        with self._lock:
+            if self.state == STATE_OPEN:
+                return self._clock() - self.opened_at < self.reset_timeout
+            return self.state == STATE_HALF_OPEN and self._probe_in_flight and \
+                self._clock() - self._probe_started_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != STATE_CLOSED:
+                self._transition(STATE_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == STATE_HALF_OPEN or (
+                    self.state == STATE_CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.opened_at = self._clock()
+                self._transition(STATE_OPEN)
+
+    def stats(self):
+        with self._lock:
+            retry_in = None
+            if self.state == STATE_OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (self._clock() - self.opened_at)), 1)
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'rejected': self.rejected,
+                'retry_in': retry_in,
+                'transitions': dict(self.transitions)
+            }
+
+    def _transition(self, new_state):
+        old_state = self.state
+        self.state = new_state
+        edge = f"{old_state}->{new_state}"
+        self.transitions[edge] = self.transitions.get(edge, 0) + 1
+        icon = {STATE_OPEN: '🔴', STATE_HALF_OPEN: '🟡', STATE_CLOSED: '🟢'}[new_state]
+        print(f"{icon} Circuit Breaker [{self.name}]: {old_state.upper()} -> {new_state.upper()}")
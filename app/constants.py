@@ -71,7 +71,14 @@ BRAND_MAPPING = {
     'vivo': 'Vivo',
     'realme': 'Realme',
     'asus': 'Asus',
-    'google': 'Google'
+    'google': 'Google',
+    # Tên dòng máy chỉ thuộc về 1 hãng (khách thường gọi "galaxy s24", "pixel 8" mà không nêu hãng)
+    'galaxy': 'Samsung',
+    'pixel': 'Google',
+    'redmi': 'Xiaomi',
+    'poco': 'Xiaomi',
+    'zenfone': 'Asus',
+    'rog': 'Asus'
 }
 
 # ==========================================
@@ -116,4 +123,198 @@ class SystemMessages:
 
     # Cảnh báo AI
     AI_ERROR = 'Hệ thống AI đang quá tải hoặc lỗi kết nối. Vui lòng thử lại sau.'
-    AI_BUSY = 'AI đang nghỉ Tết (Hết quota), bạn thử lại sau hoặc dùng tìm kiếm nhé! 🧧'
\ No newline at end of file
+    AI_BUSY = 'AI đang nghỉ Tết (Hết quota), bạn thử lại sau hoặc dùng tìm kiếm nhé! 🧧'
+
+# ==========================================
+# 8. CẤU HÌNH ĐỘNG CƠ XẾP HẠNG TÌM KIẾM (BM25 + RRF)
+# ==========================================
+# Trọng số từng trường khi chấm điểm BM25 (Tên máy quan trọng nhất)
+SEARCH_FIELD_WEIGHTS = {
+    'name': 3.0,
+    'brand': 1.5,
+    'description': 1.0
+}
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+
+# Hệ số thưởng khi khớp nguyên cụm từ khóa liên tiếp trong Tên máy
+SEARCH_PHRASE_BOOST = 1.5
+
+# Reciprocal Rank Fusion: score = Σ weight / (k + rank)
+# Trọng số Vector < 1 để máy gõ đúng tên luôn đứng trên máy chỉ "giống ngữ nghĩa"
+SEARCH_RRF_K = 60
+SEARCH_RRF_WEIGHTS = {
+    'lexical': 1.0,
+    'vector': 0.5
+}
+
+# Số kết quả tối đa trả về cho 1 lượt tìm kiếm (Top-K qua Heap)
+SEARCH_TOP_K = 60
+
+# ==========================================
+# 9. CẤU HÌNH BỘ ĐỆM KẾT QUẢ TÌM KIẾM (SEARCH RESULT CACHE)
+# ==========================================
+# Số lượng câu truy vấn (q + hãng + sắp xếp) tối đa được giữ trong RAM
+SEARCH_CACHE_MAX_ENTRIES = 512
+# Thời gian sống của 1 kết quả (giây), hết hạn sẽ chạy lại toàn bộ Pipeline AI
+SEARCH_CACHE_TTL_SECONDS = 600
+
+# ==========================================
+# 10. CẤU HÌNH PHÂN TÍCH Ý ĐỊNH TÌM KIẾM (LOCAL-FIRST INTENT)
+# ==========================================
+# Chế độ mặc định (ghi đè bằng biến môi trường SEARCH_INTENT_MODE):
+# - 'local_first': Regex nội bộ trả lời ngay, Gemini chỉ làm giàu ngầm cho câu hỏi khó
+# - 'llm_first'  : Gọi Gemini trước (chặn request), Regex chỉ là phương án dự phòng
+# - 'local_only' : Không bao giờ gọi Gemini
+SEARCH_INTENT_MODES = ('local_first', 'llm_first', 'local_only')
+SEARCH_INTENT_MODE_DEFAULT = 'local_first'
+
+# Dưới ngưỡng tự tin này, câu hỏi sẽ được gửi cho Gemini phân tích ngầm (Background)
+SEARCH_INTENT_CONFIDENCE_THRESHOLD = 0.6
+SEARCH_INTENT_WORKERS = 2
+SEARCH_INTENT_CACHE_MAX_ENTRIES = 1024
+SEARCH_INTENT_CACHE_TTL_SECONDS = 3600
+
+# ==========================================
+# 11. CẤU HÌNH BỂ KẾT NỐI GEMINI (API KEY POOL)
+# ==========================================
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+# Thời gian "cách ly" Key khi hết Quota (429) nếu Google không trả về thời điểm Reset
+GEMINI_QUOTA_COOLDOWN_SECONDS = 60
+# Key sai / bị khóa (400 INVALID) bị cách ly lâu hơn
+GEMINI_INVALID_KEY_COOLDOWN_SECONDS = 900
+# Hệ số làm mượt EWMA cho Độ trễ và Tỉ lệ lỗi (càng lớn càng nhạy với biến động gần nhất)
+GEMINI_HEALTH_EWMA_ALPHA = 0.3
+# Cầu dao Gemini: số lượt gọi thất bại liên tiếp để ngắt, và thời gian chờ trước khi thăm dò lại
+GEMINI_BREAKER_FAILURE_THRESHOLD = 3
+GEMINI_BREAKER_RESET_TIMEOUT_SECONDS = 30
+
+# ==========================================
+# 12. CẤU HÌNH BỘ ĐỆM PHẢN HỒI AI 2 TẦNG (RAM LRU + BẢNG AICache)
+# ==========================================
+# Ngân sách RAM cho Tầng 1 (tính theo byte của dữ liệu đã tuần tự hóa)
+AI_CACHE_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+# Ghi Tầng 2 (Database) theo lô ở luồng nền (Write-behind)
+AI_CACHE_WRITE_BATCH_SIZE = 50
+AI_CACHE_WRITE_FLUSH_INTERVAL_SECONDS = 2.0
+
+# Thời gian sống (giây) của phản hồi AI theo từng hàm gọi (Bảng so sánh sống lâu, Ý định tìm kiếm ngắn hơn)
+AI_CACHE_TTL_SECONDS = {
+    'get_comparison_result': 7 * 24 * 3600,
+    'analyze_search_intents': 6 * 3600,
+    'analyze_sentiment': 30 * 24 * 3600,
+    'generate_chatbot_response': 3600
+}
+AI_CACHE_DEFAULT_TTL_SECONDS = 24 * 3600
+# Ngân sách của Bảng AICache: vượt 1 trong 2 ngưỡng sẽ xóa bản ghi lâu không được dùng nhất (LRU)
+AI_CACHE_MAX_ROWS = 5000
+AI_CACHE_MAX_DB_BYTES = 64 * 1024 * 1024
+# Chu kỳ chạy luồng dọn dẹp (Sweeper) Bảng AICache
+AI_CACHE_SWEEP_INTERVAL_SECONDS = 600
+# Thời gian tối đa (giây) 1 Follower chờ lời gọi AI trùng lặp của Leader (Single-flight).
+# Quá hạn (Leader treo / Gemini không phản hồi) -> Follower tự gọi, không kẹt Worker vô thời hạn
+SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS = 60
+
+# ==========================================
+# 13. CẤU HÌNH BỘ ĐỆM NGỮ NGHĨA (SEMANTIC CACHE) CHO CHATBOT & Ý ĐỊNH TÌM KIẾM
+# ==========================================
+# Ngưỡng Cosine để coi 2 câu hỏi là "cùng 1 câu" (VD: "giá ip15" ~ "iphone 15 giá bao nhiêu")
+SEMANTIC_CACHE_THRESHOLD = 0.92
+# Số câu hỏi tối đa giữ trong chỉ mục Vector của mỗi bộ đệm (vượt thì ghi đè câu cũ nhất)
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+
+# ==========================================
+# 14. CẤU HÌNH ĐỒNG BỘ HÀNG LOẠT VECTOR ẢNH (BULK CLIP INDEXER)
+# ==========================================
+# Số luồng tải + giải mã ảnh song song (I/O-bound -> có thể cao hơn số nhân CPU)
+VISUAL_SYNC_DOWNLOAD_WORKERS = 8
+# Số ảnh mỗi lượt Forward CLIP / mỗi lệnh Upsert ChromaDB
+VISUAL_SYNC_BATCH_SIZE = 32
+
+# ==========================================
+# 15. CẤU HÌNH DỊCH VỤ NHÚNG VĂN BẢN DÙNG CHUNG (MiniLM TEXT EMBEDDER)
+# ==========================================
+# Số câu truy vấn đã nhúng giữ trong Cache LRU (384 float/câu -> ~6MB cho 4096 câu)
+TEXT_EMBEDDING_CACHE_SIZE = 4096
+# Gom lô vi mô: tối đa bao nhiêu truy vấn đồng thời / chờ tối đa bao lâu (ms) trước khi chạy Model
+TEXT_EMBEDDING_MICRO_BATCH_MAX = 32
+TEXT_EMBEDDING_MICRO_BATCH_WAIT_MS = 5
+# Số văn bản mỗi lượt Forward khi đồng bộ hàng loạt sản phẩm vào Vector DB
+TEXT_EMBEDDING_DOCUMENT_BATCH_SIZE = 64
+# Số sản phẩm mỗi lệnh Upsert ChromaDB khi đồng bộ hàng loạt Vector văn bản
+TEXT_VECTOR_SYNC_BATCH_SIZE = 256
+# Số Metadata đọc mỗi trang khi quét Vector DB để so dấu vân tay nội dung (đồng bộ tăng dần)
+TEXT_VECTOR_SCAN_PAGE_SIZE = 1000
+
+# ==========================================
+# 16. CẤU HÌNH TÌM KIẾM VECTOR CÓ LỌC TRƯỚC (PRE-FILTERED VECTOR SEARCH)
+# ==========================================
+# Số kết quả ngữ nghĩa dùng để cộng điểm (RRF) cho Hybrid Search trang chủ
+SEARCH_VECTOR_RESULTS = 10
+# Kết quả Vector lọt ra ngoài tập ứng viên SQL quá nhiều (Metadata cũ, sản phẩm ngừng bán...)
+# -> Hỏi lại Vector DB với n_results lớn gấp N lần, tối đa tới mức trần này
+VECTOR_PREFILTER_OVERFETCH_FACTOR = 4
+VECTOR_PREFILTER_MAX_FETCH = 160
+
+# ==========================================
+# 17. CẤU HÌNH TÌM KIẾM BẰNG HÌNH ẢNH SONG SONG (GEMINI VISION + CLIP)
+# ==========================================
+# Hạn chót chung (giây) cho cả 2 tầng nhận diện ảnh; ghi đè qua app.config['VISUAL_SEARCH_DEADLINE_SECONDS']
+VISUAL_SEARCH_DEADLINE_SECONDS = 12
+# Số luồng chạy nền cho các tầng nhận diện ảnh (mỗi lượt tìm kiếm dùng 2 luồng)
+VISUAL_SEARCH_WORKERS = 8
+# Ngưỡng tự tin tối thiểu (%) để tin vào tên máy Gemini đọc được
+VISUAL_SEARCH_MIN_CONFIDENCE = 50
+
+# ==========================================
+# 18. CẤU HÌNH BỘ ĐỆM KẾT QUẢ TÌM KIẾM BẰNG HÌNH ẢNH (UPLOAD-HASH CACHE)
+# ==========================================
+# Số ảnh tải lên giữ kết quả nhận diện (Gemini JSON + ID láng giềng CLIP) trong RAM
+IMAGE_SEARCH_CACHE_MAX_ENTRIES = 2048
+# Hạn sử dụng kết quả nhận diện của 1 ảnh (giây)
+IMAGE_SEARCH_CACHE_TTL_SECONDS = 24 * 60 * 60
+# Khoảng cách Hamming tối đa giữa 2 dHash 64-bit để coi là "cùng 1 ảnh" (nén lại, đổi kích thước...).
+# Phải nhỏ hơn số dải chỉ mục (4 dải x 16 bit) để nguyên lý Dirichlet đảm bảo tra cứu không bỏ sót
+IMAGE_SEARCH_DHASH_MAX_DISTANCE = 3
+
+# ==========================================
+# 19. CẤU HÌNH TIỀN XỬ LÝ ẢNH TẢI LÊN (SINGLE-DECODE UPLOAD PIPELINE)
+# ==========================================
+# Định dạng ảnh được nhận (theo Header thực của file, không tin phần mở rộng).
+# Khớp với thông báo lỗi "Chỉ nhận: JPG, PNG, WEBP." và thuộc tính `accept` của ô tải ảnh Visual Search
+UPLOAD_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+# Tổng số điểm ảnh tối đa (đọc từ Header): chặn "bom giải nén" - file vài KB nhưng khai báo hàng trăm Megapixel
+UPLOAD_IMAGE_MAX_PIXELS = 40_000_000
+# Cạnh dài tối đa của ảnh sau khi giải mã (đủ cho Gemini đọc chữ, CLIP chỉ cần 224px)
+UPLOAD_IMAGE_DECODE_MAX_SIDE = 1024
+# Chất lượng JPEG gửi cho Gemini Vision
+GEMINI_IMAGE_JPEG_QUALITY = 85
+
+# ==========================================
+# 20. CẤU HÌNH TẢI ẢNH SẢN PHẨM TỪ XA (REMOTE IMAGE FETCHER) & ĐỒNG BỘ VECTOR CHẠY NỀN
+# ==========================================
+# Số kết nối Keep-alive giữ lại cho mỗi máy chủ ảnh trong Session dùng chung
+REMOTE_IMAGE_POOL_SIZE = 16
+# Số lượt tải ảnh đồng thời tối đa: toàn hệ thống / trên cùng 1 máy chủ (CDN)
+REMOTE_IMAGE_MAX_CONCURRENCY = 16
+REMOTE_IMAGE_PER_HOST_CONCURRENCY = 6
+# Dung lượng tối đa 1 ảnh tải về (kiểm tra Content-Length và cả trong lúc Stream)
+REMOTE_IMAGE_MAX_BYTES = 8 * 1024 * 1024
+# Timeout (giây): kết nối / chờ giữa 2 gói dữ liệu
+REMOTE_IMAGE_CONNECT_TIMEOUT_SECONDS = 3.05
+REMOTE_IMAGE_READ_TIMEOUT_SECONDS = 10
+# Tổng thời gian tối đa (giây) cho 1 lượt tải, tính cả lúc Stream: chặn CDN nhỏ giọt từng byte
+# (mỗi gói đều về kịp trước Read Timeout nên Timeout của requests không bao giờ kích hoạt)
+REMOTE_IMAGE_TOTAL_TIMEOUT_SECONDS = 20
+# Thử lại khi lỗi mạng / 429 / 5xx: số lần thử lại, thời gian chờ gốc (nhân đôi sau mỗi lần, có Jitter)
+REMOTE_IMAGE_RETRIES = 2
+REMOTE_IMAGE_BACKOFF_SECONDS = 0.5
+# Số luồng nền đồng bộ Vector (Văn bản + Ảnh) sau khi Admin Thêm/Sửa sản phẩm
+PRODUCT_VECTOR_SYNC_WORKERS = 2
+
+# ==========================================
+# 21. PHIÊN BẢN KHO HÀNG DÙNG CHUNG GIỮA CÁC WORKER (SHARED CATALOG VERSION)
+# ==========================================
+# Chu kỳ (giây) mỗi Worker đọc lại số đếm Phiên bản Kho hàng trong DB.
+# Cũng là độ trễ tối đa để Worker này thấy thay đổi kho (giá, tồn kho, sản phẩm mới) do Worker khác ghi
+CATALOG_VERSION_CHECK_INTERVAL_SECONDS = 2
@@ -53,4 +53,14 @@ class InvalidTradeInImageError(MobileStoreBaseException):
     """Văng lỗi khi file Upload thu cũ không hợp lệ (Dung lượng cao, sai định dạng)"""
     def __init__(self):
         msg = "Ảnh thiết bị thu cũ không hợp lệ. Vui lòng tải lên ảnh JPG/PNG dưới 2MB."
-        super().__init__(msg)
\ No newline at end of file
+        super().__init__(msg)
+
+class InvalidUploadImageError(MobileStoreBaseException):
+    """Văng lỗi khi ảnh tải lên để tìm kiếm không giải mã được hoặc có kích thước (Megapixel) vượt giới hạn"""
+    def __init__(self, reason="Ảnh tải lên không hợp lệ."):
+        super().__init__(reason)
+
+class RemoteImageFetchError(MobileStoreBaseException):
+    """Văng lỗi khi tải ảnh sản phẩm từ xa thất bại (HTTP lỗi, vượt dung lượng, hết lượt thử lại)"""
+    def __init__(self, url, reason):
+        super().__init__(f"Không tải được ảnh {url[:80]}: {reason}")
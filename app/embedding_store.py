@@ -0,0 +1,189 @@
+"""
+Module Kho Vector Ảnh định địa chỉ theo nội dung (Content-addressed Embedding Store) của MobileStore.
+Mỗi Vector CLIP được lưu theo mã băm SHA-256 của chính file ảnh: ảnh không đổi -> không chạy lại CLIP,
+kể cả khi cùng 1 ảnh xuất hiện dưới nhiều URL khác nhau.
+Kèm bảng ánh xạ URL -> (SHA-256, ETag, Last-Modified) để hỏi lại máy chủ ảnh bằng Request có điều kiện
+(304 Not Modified) thay vì tải lại toàn bộ file.
+
+Định dạng trên đĩa (gọn, mở lại gần như tức thì sau khi khởi động lại):
+- `vectors.f32` : Ma trận float32 (N x dim), mỗi Vector ghi đúng vị trí `số_dòng * dim * 4`, đọc bằng `numpy.memmap`.
+- `index.json`  : {"dim", "rows": {sha256: số_dòng}, "urls": {url: {...}}}.
+- `index.lock`  : Khóa ghi giữa các tiến trình (nhiều Worker Gunicorn + Script CLI nhúng ảnh hàng loạt).
+"""
+
+import os
+import json
+import threading
+import numpy as np
+
+from app.file_lock import interprocess_lock, file_stamp
+
+INDEX_FILENAME = 'index.json'
+VECTORS_FILENAME = 'vectors.f32'
+LOCK_FILENAME = 'index.lock'
+
+
+class EmbeddingStore:
+    """
+    Kho Vector bền vững, an toàn đa luồng và đa tiến trình.
+    Chỉ mục được ghi xuống đĩa theo lô (mỗi `autosave_every` lần ghi, hoặc khi gọi `save()`).
+    Nếu tiến trình tắt đột ngột, các dòng Vector chưa có trong chỉ mục chỉ bị bỏ qua (không hỏng dữ liệu).
+
+    Nhiều tiến trình cùng ghi: cấp dòng mới + ghi Vector + ghi chỉ mục đều giữ `index.lock`.
+    - Dòng mới = số dòng đang có trên đĩa (làm tròn lên, bỏ qua dòng ghi dở của lần tắt đột ngột), đọc
+      khi đang giữ khóa -> 2 tiến trình không bao giờ nhận trùng 1 dòng, Vector sau không bị lệch hàng.
+    - Trước khi ghi, nạp lại `index.json` nếu tiến trình khác vừa ghi và gộp với các thay đổi chưa lưu
+      của tiến trình này -> Không bản ghi nào bị mất vì "ai ghi sau thắng".
+    """
+
+    def __init__(self, directory, dim, autosave_every=64):
+        self.directory = directory
+        self.dim = dim
+        self.autosave_every = autosave_every
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, INDEX_FILENAME)
+        self._vectors_path = os.path.join(directory, VECTORS_FILENAME)
+        self._lock_path = os.path.join(directory, LOCK_FILENAME)
+        self._row_bytes = dim * 4
+        self._mmap = None
+        self._unsaved = 0
+        # Thay đổi chưa lưu của tiến trình này (giữ lại khi gộp với chỉ mục tiến trình khác vừa ghi)
+        self._pending_rows = {}
+        self._pending_urls = {}
+        self._index_stamp = None
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with interprocess_lock(self._lock_path):
+            self._index_stamp = file_stamp(self._index_path)
+            self.rows, self.urls = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        # Model đổi số chiều -> Vector cũ vô giá trị, bắt đầu lại từ đầu
+        if data.get('dim') != self.dim:
+            print(f"⚠️ Embedding Store ({self.directory}) khác số chiều, bỏ qua dữ liệu cũ.")
+            for path in (self._index_path, self._vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return {}, {}
+        return data.get('rows', {}), data.get('urls', {})
+
+    def _refresh_locked(self):
+        """Tiến trình khác vừa ghi `index.json` -> Nạp lại rồi phủ các thay đổi chưa lưu của mình lên trên."""
+        stamp = file_stamp(self._index_path)
+        if stamp == self._index_stamp:
+            return
+        self._index_stamp = stamp
+        rows, urls = self._load_index()
+        rows.update(self._pending_rows)
+        urls.update(self._pending_urls)
+        self.rows, self.urls = rows, urls
+
+    def _row_count_on_disk(self):
+        try:
+            return os.path.getsize(self._vectors_path) // self._row_bytes
+        except OSError:
+            return 0
+
+    def _read_row(self, row):
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            rows_on_disk = self._row_count_on_disk()
+            if row >= rows_on_disk:
+                return None
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows_on_disk, self.dim))
+        return self._mmap[row].tolist()
+
+    def get(self, digest):
+        """Vector của ảnh có mã băm `digest`, hoặc None nếu chưa từng nhúng."""
+        with self._lock:
+            if digest not in self.rows:
+                # Có thể tiến trình khác vừa nhúng ảnh này (`index.json` được thay thế nguyên tử, đọc không cần khóa)
+                self._refresh_locked()
+            row = self.rows.get(digest)
+            vector = self._read_row(row) if row is not None else None
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return vector
+
+    def put(self, digest, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            return
+        with self._lock:
+            if digest in self.rows:
+                return
+            with interprocess_lock(self._lock_path):
+                self._refresh_locked()
+                if digest in self.rows:
+                    return
+                # Dòng mới luôn nằm cuối file; dòng ghi dở (tắt đột ngột) được bỏ qua thay vì làm lệch hàng
+                size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+                row = -(-size // self._row_bytes)
+                with open(self._vectors_path, 'r+b' if size else 'wb') as f:
+                    f.seek(row * self._row_bytes)
+                    f.write(vector.tobytes())
+                self.rows[digest] = self._pending_rows[digest] = row
+            self._mark_dirty()
+
+    def lookup_url(self, url):
+        """Thông tin lần tải trước của URL: {'sha256', 'etag', 'last_modified'} hoặc None."""
+        with self._lock:
+            if url not in self.urls:
+                self._refresh_locked()
+            entry = self.urls.get(url)
+            return dict(entry) if entry else None
+
+    def remember_url(self, url, digest, etag=None, last_modified=None):
+        entry = {'sha256': digest, 'etag': etag, 'last_modified': last_modified}
+        with self._lock:
+            if self.urls.get(url) != entry:
+                self.urls[url] = self._pending_urls[url] = entry
+                self._mark_dirty()
+
+    def record_revalidation(self):
+        with self._lock:
+            self.revalidated += 1
+
+    def _mark_dirty(self):
+        self._unsaved += 1
+        if self._unsaved >= self.autosave_every:
+            self._save_locked()
+
+    def _save_locked(self):
+        with interprocess_lock(self._lock_path):
+            # Gộp với chỉ mục tiến trình khác vừa ghi trước khi ghi đè
+            self._refresh_locked()
+            # Ghi ra file tạm rồi đổi tên (Atomic) để chỉ mục không bao giờ bị ghi dở dang
+            tmp_path = self._index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim, 'rows': self.rows, 'urls': self.urls}, f)
+            os.replace(tmp_path, self._index_path)
+            self._index_stamp = file_stamp(self._index_path)
+        self._pending_rows.clear()
+        self._pending_urls.clear()
+        self._unsaved = 0
+
+    def save(self):
+        with self._lock:
+            if self._unsaved:
+                self._save_locked()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'vectors': len(self.rows),
+                'urls': len(self.urls),
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidated': self.revalidated,
+                'disk_bytes': self._row_count_on_disk() * self._row_bytes
+            }
@@ -0,0 +1,45 @@
+"""
+Module Khóa file giữa các tiến trình (Interprocess File Lock) của MobileStore.
+Dùng chung cho các kho dữ liệu trên đĩa (NumpyVectorBackend, EmbeddingStore) khi nhiều Worker Gunicorn
+và Script CLI cùng ghi 1 thư mục: `threading.Lock` chỉ bảo vệ các luồng trong cùng 1 tiến trình.
+"""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def interprocess_lock(path):
+    """Khóa độc quyền trên file `path`, giữ giữa các tiến trình (fcntl trên POSIX, msvcrt trên Windows)."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_stamp(path):
+    """
+    Dấu hiệu phiên bản của 1 file (inode, mtime, kích thước), None nếu chưa có.
+    File được ghi bằng `os.replace` nên mỗi lần ghi đổi ít nhất inode -> So dấu để biết tiến trình khác vừa ghi.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
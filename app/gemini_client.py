@@ -0,0 +1,262 @@
+"""
+Module Bể kết nối Google Gemini (Gemini Key Pool) của MobileStore.
+Mỗi API Key giữ đúng 1 `genai.Client` dùng lại suốt vòng đời tiến trình (tái sử dụng kết nối HTTP),
+kèm hồ sơ sức khỏe: thời gian cách ly khi hết Quota, tỉ lệ lỗi và độ trễ (EWMA).
+Key được chọn theo Weighted Round-Robin mượt (Smooth WRR) giữa các Key còn khỏe.
+Toàn bộ tầng Gemini được bảo vệ bởi 1 Cầu dao (Circuit Breaker) dùng chung.
+"""
+
+import os
+import re
+import time
+import threading
+
+from app.constants import (
+    GEMINI_MODEL_NAME,
+    GEMINI_QUOTA_COOLDOWN_SECONDS,
+    GEMINI_INVALID_KEY_COOLDOWN_SECONDS,
+    GEMINI_HEALTH_EWMA_ALPHA,
+    GEMINI_BREAKER_FAILURE_THRESHOLD,
+    GEMINI_BREAKER_RESET_TIMEOUT_SECONDS
+)
+from app.circuit_breaker import CircuitBreaker
+
+_RETRY_DELAY_PATTERN = re.compile(r"retry(?:[ _-]?delay)?['\"]?\s*(?:in|:)?\s*['\"]?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+# Mã HTTP đứng đầu thông điệp lỗi của SDK (VD: "400 INVALID_ARGUMENT. {...}")
+_LEADING_STATUS_PATTERN = re.compile(r"^\s*(\d{3})\b")
+# Dấu hiệu Key thật sự hỏng / không có quyền (kể cả khi Google trả về kèm mã 400)
+_INVALID_KEY_MARKERS = ("api_key_invalid", "api key not valid", "api key expired", "permission_denied", "unauthenticated")
+# Lỗi do chính Request (Prompt / ảnh không hợp lệ...), Key vẫn khỏe
+_REQUEST_ERROR_MARKERS = ("invalid_argument", "failed_precondition", "out_of_range", "not_found")
+
+
+def _gemini_error_status(error):
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    match = _LEADING_STATUS_PATTERN.match(str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify_gemini_error(error):
+    """
+    Phân loại lỗi trả về từ Gemini:
+    - 'quota'  : 429 / RESOURCE_EXHAUSTED                          -> Cách ly Key tới khi Quota hồi lại.
+    - 'invalid': 401 / 403 / API_KEY_INVALID / PERMISSION_DENIED   -> Cách ly Key dài hạn.
+    - 'request': 4xx còn lại (VD: 400 INVALID_ARGUMENT do Prompt / ảnh hỏng) -> Lỗi của Request,
+                 không phạt Key, không trượt sang Key khác (Key nào cũng sẽ trả về đúng lỗi đó).
+    - 'other'  : Lỗi mạng, 5xx...                                  -> Chỉ tăng tỉ lệ lỗi.
+    """
+    error_str = str(error).lower()
+    status = _gemini_error_status(error)
+    if status == 429 or "quota" in error_str or "exhausted" in error_str:
+        return 'quota'
+    if status in (401, 403) or any(marker in error_str for marker in _INVALID_KEY_MARKERS):
+        return 'invalid'
+    if (status is not None and 400 <= status < 500) or any(marker in error_str for marker in _REQUEST_ERROR_MARKERS):
+        return 'request'
+    return 'other'
+
+
+def parse_retry_delay(error, default=GEMINI_QUOTA_COOLDOWN_SECONDS):
+    """Đọc số giây chờ Reset Quota từ thông điệp lỗi của Google (VD: "retryDelay': '37s'")."""
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+    return default
+
+
+def mask_key(key):
+    return f"...{key[-4:]}" if len(key) > 4 else "UNKNOWN"
+
+
+class GeminiKeyHealth:
+    """Hồ sơ sức khỏe + Client dùng lại của một API Key."""
+
+    def __init__(self, key):
+        self.key = key
+        self.label = mask_key(key)
+        self._client = None
+        self.cooldown_until = 0.0
+        self.error_rate = 0.0
+        self.latency_ewma = None
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.current_weight = 0.0
+
+    @property
+    def client(self):
+        # Khởi tạo 1 lần duy nhất, các lượt gọi sau dùng lại Connection Pool của Client
+        if self._client is None:
+            # SDK google-genai nạp mất ~1.5 giây -> Chỉ import ở lần gọi Gemini đầu tiên
+            from google import genai
+            self._client = genai.Client(api_key=self.key)
+        return self._client
+
+    def is_available(self, now):
+        return now >= self.cooldown_until
+
+    @property
+    def weight(self):
+        """Key càng ít lỗi, càng nhanh thì trọng số càng cao (tối thiểu 1)."""
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return max(1.0, 100.0 * (1.0 - self.error_rate) / (1.0 + latency))
+
+    def record(self, ok, latency):
+        alpha = GEMINI_HEALTH_EWMA_ALPHA
+        self.requests += 1
+        self.error_rate = alpha * (0.0 if ok else 1.0) + (1 - alpha) * self.error_rate
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else \
+                alpha * latency + (1 - alpha) * self.latency_ewma
+
+    def snapshot(self, now):
+        return {
+            'key': self.label,
+            'available': self.is_available(now),
+            'cooldown_remaining': round(max(0.0, self.cooldown_until - now), 1),
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_rate': round(self.error_rate, 4),
+            'latency_ewma': round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            'weight': round(self.weight, 2),
+            'last_error': self.last_error
+        }
+
+
+class GeminiKeyPool:
+    """Bể Key dùng chung toàn tiến trình, an toàn đa luồng."""
+
+    def __init__(self, api_keys):
+        self._lock = threading.Lock()
+        self.keys = [GeminiKeyHealth(k) for k in api_keys]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self):
+        """
+        Thứ tự thử Key cho 1 lượt gọi: Key được Smooth WRR chọn đứng đầu,
+        các Key khỏe còn lại xếp theo trọng số giảm dần. Key đang cách ly bị bỏ qua.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [k for k in self.keys if k.is_available(now)]
+            if not healthy:
+                return []
+
+            total = sum(k.weight for k in healthy)
+            for k in healthy:
+                k.current_weight += k.weight
+            chosen = max(healthy, key=lambda k: k.current_weight)
+            chosen.current_weight -= total
+
+            rest = sorted((k for k in healthy if k is not chosen), key=lambda k: k.weight, reverse=True)
+            return [chosen] + rest
+
+    def report_success(self, entry, latency):
+        with self._lock:
+            entry.record(True, latency)
+
+    def report_failure(self, entry, error, latency=None):
+        """Ghi nhận lỗi và trả về loại lỗi (quota / invalid / request / other) cho nơi gọi quyết định."""
+        kind = classify_gemini_error(error)
+        if kind == 'request':
+            # Key vẫn phục vụ bình thường -> Không tính vào sức khỏe của Key
+            return kind
+        with self._lock:
+            entry.record(False, latency)
+            entry.failures += 1
+            entry.last_error = str(error)[:120]
+            if kind == 'quota':
+                entry.cooldown_until = time.monotonic() + parse_retry_delay(error)
+            elif kind == 'invalid':
+                entry.cooldown_until = time.monotonic() + GEMINI_INVALID_KEY_COOLDOWN_SECONDS
+        return kind
+
+    def generate_content(self, contents, config=None, model=GEMINI_MODEL_NAME, failover_on_any_error=False):
+        """
+        Gọi `models.generate_content` qua bể Key.
+        - Lỗi Quota / Key sai: tự động trượt sang Key khỏe kế tiếp.
+        - Lỗi của Request (4xx khác): dừng ngay với lý do 'rejected', kể cả khi `failover_on_any_error=True`.
+        - Lỗi khác: dừng ngay (trừ khi `failover_on_any_error=True`).
+        Trả về (response, None) khi thành công, (None, lý_do) khi thất bại.
+        """
+        candidates = self.candidates()
+        if not candidates:
+            return None, 'exhausted'
+
+        for entry in candidates:
+            started = time.perf_counter()
+            try:
+                response = entry.client.models.generate_content(model=model, contents=contents, config=config)
+                self.report_success(entry, time.perf_counter() - started)
+                return response, None
+            except Exception as e:
+                kind = self.report_failure(entry, e, time.perf_counter() - started)
+                if kind in ('quota', 'invalid'):
+                    print(f"⚠️ Key ({entry.label}) gặp lỗi ({str(e).lower()[:30]}...). Đang thử Key tiếp theo...")
+                    continue
+                if kind == 'request':
+                    print(f"Gemini từ chối Request: {e}")
+                    return None, 'rejected'
+                if failover_on_any_error:
+                    continue
+                print(f"Gemini API Error: {e}")
+                return None, 'error'
+
+        return None, 'exhausted'
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            keys = [k.snapshot(now) for k in self.keys]
+        return {
+            'total_keys': len(keys),
+            'available_keys': sum(1 for k in keys if k['available']),
+            'keys': keys
+        }
+
+
+# Cầu dao dùng chung cho mọi lời gọi Gemini (Text + Vision)
+gemini_breaker = CircuitBreaker(
+    'gemini',
+    failure_threshold=GEMINI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=GEMINI_BREAKER_RESET_TIMEOUT_SECONDS
+)
+
+_pool = None
+_pool_source = None
+_pool_lock = threading.Lock()
+
+
+def get_gemini_pool():
+    """
+    Lấy bể Key dùng chung (Module-level Singleton).
+    Tự dựng lại khi biến môi trường `GEMINI_API_KEY` thay đổi (VD: Admin xoay vòng Key mới).
+    """
+    global _pool, _pool_source
+    raw_keys = os.environ.get("GEMINI_API_KEY", "")
+    if _pool is not None and raw_keys == _pool_source:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or raw_keys != _pool_source:
+            # Xử lý chuỗi key an toàn: Cắt theo dấu phẩy, loại bỏ khoảng trắng, lọc bỏ key rỗng
+            api_keys = [k.strip() for k in raw_keys.split(",") if k.strip()]
+            _pool = GeminiKeyPool(api_keys)
+            _pool_source = raw_keys
+        return _pool
+
+
+def is_gemini_available():
+    """False khi Cầu dao đang ngắt -> nơi gọi nên dùng ngay phương án dự phòng nội bộ."""
+    return not gemini_breaker.is_open()
+
+
+def get_gemini_pool_stats():
+    """Bảng thống kê sức khỏe từng Key và trạng thái Cầu dao (phục vụ API giám sát của Admin)."""
+    data = get_gemini_pool().stats()
+    data['breaker'] = gemini_breaker.stats()
+    return data
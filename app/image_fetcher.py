@@ -0,0 +1,180 @@
+"""
+Module Tải ảnh sản phẩm từ xa (Remote Image Fetcher) của MobileStore.
+Thay cho `requests.get` rời rạc (mỗi lần 1 kết nối TCP/TLS mới, Timeout cố định 5 giây, không giới hạn dung lượng):
+- 1 `requests.Session` dùng chung với Connection Pool (Keep-alive) cho mọi lượt tải ảnh.
+- Giới hạn số lượt tải đồng thời trên toàn hệ thống VÀ trên từng máy chủ (CDN),
+  để 1 CDN chậm không chiếm hết luồng và không bị CDN chặn vì gửi quá nhiều Request.
+- Stream nội dung theo khối, cắt ngay khi vượt REMOTE_IMAGE_MAX_BYTES (không tin mỗi Content-Length)
+  hoặc khi lượt tải kéo dài quá REMOTE_IMAGE_TOTAL_TIMEOUT_SECONDS (CDN nhỏ giọt).
+- Tự thử lại khi lỗi mạng / 429 / 5xx với thời gian chờ tăng dần (Exponential Backoff + Jitter).
+  Hạn chót tính 1 lần cho cả `fetch()` (gồm mọi lượt thử lại và thời gian chờ), không cộng dồn theo từng lượt.
+"""
+
+import time
+import random
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.constants import (
+    REMOTE_IMAGE_POOL_SIZE,
+    REMOTE_IMAGE_MAX_CONCURRENCY,
+    REMOTE_IMAGE_PER_HOST_CONCURRENCY,
+    REMOTE_IMAGE_MAX_BYTES,
+    REMOTE_IMAGE_CONNECT_TIMEOUT_SECONDS,
+    REMOTE_IMAGE_READ_TIMEOUT_SECONDS,
+    REMOTE_IMAGE_TOTAL_TIMEOUT_SECONDS,
+    REMOTE_IMAGE_RETRIES,
+    REMOTE_IMAGE_BACKOFF_SECONDS
+)
+from app.custom_exceptions import RemoteImageFetchError
+
+IMAGE_DOWNLOAD_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Kết quả 1 lượt tải: nội dung chỉ có với mã 2xx (304 / 404 trả về b'')
+FetchResult = namedtuple('FetchResult', ['status_code', 'content', 'headers'])
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class ImageFetcher:
+    """
+    Bộ tải ảnh an toàn đa luồng, dùng chung cho Visual Indexer, đồng bộ ảnh khi Admin sửa sản phẩm và Script CLI.
+    `fetch()` trả về FetchResult cho mã 2xx / 304 / 404, văng RemoteImageFetchError cho mọi lỗi còn lại.
+    """
+
+    def __init__(self, pool_size=REMOTE_IMAGE_POOL_SIZE, max_concurrency=REMOTE_IMAGE_MAX_CONCURRENCY,
+                 per_host_concurrency=REMOTE_IMAGE_PER_HOST_CONCURRENCY, max_bytes=REMOTE_IMAGE_MAX_BYTES,
+                 retries=REMOTE_IMAGE_RETRIES, backoff=REMOTE_IMAGE_BACKOFF_SECONDS,
+                 timeout=(REMOTE_IMAGE_CONNECT_TIMEOUT_SECONDS, REMOTE_IMAGE_READ_TIMEOUT_SECONDS),
+                 total_timeout=REMOTE_IMAGE_TOTAL_TIMEOUT_SECONDS):
+        self.session = requests.Session()
+        self.session.headers.update(IMAGE_DOWNLOAD_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self._global_slots = threading.BoundedSemaphore(max_concurrency)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'too_large': 0, 'too_slow': 0,
+                         'bytes_downloaded': 0}
+
+    def fetch(self, url, headers=None):
+        host_slot = self._host_slot(url)
+        # Hạn chót của CẢ lượt tải (mọi lượt thử lại + thời gian chờ Backoff), không phải của từng lượt
+        deadline = time.monotonic() + self.total_timeout
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                if time.monotonic() + delay >= deadline:
+                    # Không còn đủ thời gian cho 1 lượt nữa -> Dừng thử lại
+                    self._record('too_slow')
+                    self._record('failures')
+                    raise RemoteImageFetchError(url, f"tải quá {self.total_timeout} giây ({last_error})")
+                self._record('retries')
+                # Chờ NGOÀI vùng giới hạn đồng thời để nhường lượt cho ảnh khác
+                time.sleep(delay)
+            try:
+                # Giữ lượt của máy chủ trước rồi mới tới lượt toàn hệ thống: ảnh đang xếp hàng chờ 1 CDN chậm
+                # không chiếm chỗ của ảnh từ CDN khác
+                with host_slot, self._global_slots:
+                    return self._fetch_once(url, headers, deadline)
+            except _RetryableError as e:
+                last_error = e
+            except RemoteImageFetchError:
+                self._record('failures')
+                raise
+
+        self._record('failures')
+        raise RemoteImageFetchError(url, f"hết {self.retries} lượt thử lại ({last_error})")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, hosts=len(self._host_slots), max_concurrency=self.max_concurrency,
+                        per_host_concurrency=self.per_host_concurrency, max_bytes=self.max_bytes)
+
+    # ------------------------------------------------------------------
+    # Nội bộ
+    # ------------------------------------------------------------------
+    def _record(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_concurrency)
+            return slot
+
+    def _fetch_once(self, url, headers, deadline):
+        # Timeout của requests chỉ tính từng gói -> Tự theo dõi hạn chót của cả lượt tải,
+        # và không cho Connect / Read Timeout vượt quá phần thời gian còn lại
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._record('too_slow')
+            raise RemoteImageFetchError(url, f"tải quá {self.total_timeout} giây")
+        timeout = tuple(min(t, remaining) for t in self.timeout)
+        self._record('requests')
+        try:
+            with self.session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                status = response.status_code
+                if status in RETRYABLE_STATUSES:
+                    raise _RetryableError(f"HTTP {status}")
+                if status >= 400 and status != 404:
+                    raise RemoteImageFetchError(url, f"HTTP {status}")
+                content = self._read_body(url, response, deadline) if 200 <= status < 300 else b''
+                return FetchResult(status, content, response.headers)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            raise _RetryableError(e)
+
+    def _read_body(self, url, response, deadline):
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            self._record('too_large')
+            raise RemoteImageFetchError(url, f"dung lượng {declared} byte vượt giới hạn {self.max_bytes} byte")
+
+        chunks, size = [], 0
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+            size += len(chunk)
+            if size > self.max_bytes:
+                self._record('too_large')
+                raise RemoteImageFetchError(url, f"nội dung vượt giới hạn {self.max_bytes} byte")
+            if time.monotonic() > deadline:
+                self._record('too_slow')
+                raise RemoteImageFetchError(url, f"tải quá {self.total_timeout} giây")
+            chunks.append(chunk)
+        self._record('bytes_downloaded', size)
+        return b''.join(chunks)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_image_fetcher():
+    """Lấy bộ tải ảnh dùng chung (Module-level Singleton, 1 Connection Pool cho cả tiến trình)."""
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = ImageFetcher()
+    return _fetcher
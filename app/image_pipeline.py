@@ -0,0 +1,88 @@
+"""
+Module Tiền xử lý ảnh tải lên 1 lần giải mã (Single-decode Upload Pipeline) của MobileStore.
+Trước đây 1 ảnh Visual Search bị giải mã nhiều lần: PIL trong `identify_phone_by_gemini` (nén lại JPEG),
+rồi giải mã lại ở độ phân giải gốc trong `get_image_embedding` để CLIPProcessor tự thu nhỏ xuống 224px.
+Pipeline này:
+1. Đọc Header (chưa giải mã điểm ảnh) -> Từ chối ảnh sai định dạng / vượt số Megapixel ngay lập tức.
+2. Giải mã ĐÚNG 1 lần; JPEG dùng `Image.draft` để bộ giải mã DCT thu nhỏ luôn (1/2, 1/4, 1/8)
+   thay vì dựng đủ 12MP rồi mới Resize.
+3. Từ 1 ảnh RGB <= UPLOAD_IMAGE_DECODE_MAX_SIDE dùng chung: byte JPEG cho Gemini (nén lười, chỉ khi cần),
+   ảnh đầu vào cho CLIPProcessor và dHash cho Bộ đệm ảnh.
+"""
+
+import io
+import threading
+from PIL import Image
+
+from app.constants import (
+    UPLOAD_IMAGE_FORMATS,
+    UPLOAD_IMAGE_MAX_PIXELS,
+    UPLOAD_IMAGE_DECODE_MAX_SIDE,
+    GEMINI_IMAGE_JPEG_QUALITY
+)
+from app.custom_exceptions import InvalidUploadImageError
+
+
+class PreparedImage:
+    """
+    Ảnh tải lên đã giải mã sẵn, dùng chung (chỉ đọc) cho mọi Tầng nhận diện chạy song song.
+    - `raw_bytes`: Byte gốc của file (băm SHA-256 cho Bộ đệm ảnh).
+    - `image`: Ảnh PIL RGB đã thu nhỏ, đã nạp điểm ảnh xong.
+    - `gemini_jpeg`: Byte JPEG gửi Gemini Vision (nén ở lần đọc đầu tiên).
+    """
+
+    __slots__ = ('raw_bytes', 'format', 'original_size', 'image', '_gemini_jpeg', '_lock')
+
+    def __init__(self, raw_bytes, image_format, original_size, image):
+        self.raw_bytes = raw_bytes
+        self.format = image_format
+        self.original_size = original_size
+        self.image = image
+        self._gemini_jpeg = None
+        self._lock = threading.Lock()
+
+    @property
+    def gemini_jpeg(self):
+        if self._gemini_jpeg is None:
+            with self._lock:
+                if self._gemini_jpeg is None:
+                    buffer = io.BytesIO()
+                    self.image.save(buffer, format='JPEG', quality=GEMINI_IMAGE_JPEG_QUALITY)
+                    self._gemini_jpeg = buffer.getvalue()
+        return self._gemini_jpeg
+
+
+def probe_image_header(image_bytes):
+    """
+    Đọc định dạng + kích thước từ Header của ảnh (PIL chỉ giải mã điểm ảnh khi gọi `load()`).
+    Trả về (format, (rộng, cao)), văng InvalidUploadImageError nếu không hợp lệ.
+    """
+    too_large = f"Ảnh quá lớn. Vui lòng tải ảnh dưới {UPLOAD_IMAGE_MAX_PIXELS // 1_000_000} Megapixel."
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image_format, size = img.format, img.size
+    except Image.DecompressionBombError:
+        # PIL tự chặn ảnh vượt gấp đôi `Image.MAX_IMAGE_PIXELS` ngay lúc đọc Header
+        raise InvalidUploadImageError(too_large)
+    except Exception:
+        raise InvalidUploadImageError("File tải lên không phải ảnh hợp lệ.")
+
+    if image_format not in UPLOAD_IMAGE_FORMATS:
+        raise InvalidUploadImageError("Chỉ nhận: JPG, PNG, WEBP.")
+    if size[0] * size[1] > UPLOAD_IMAGE_MAX_PIXELS:
+        raise InvalidUploadImageError(too_large)
+    return image_format, size
+
+
+def prepare_upload(image_bytes, max_side=UPLOAD_IMAGE_DECODE_MAX_SIDE):
+    """Kiểm tra Header rồi giải mã ảnh tải lên đúng 1 lần thành PreparedImage."""
+    image_format, size = probe_image_header(image_bytes)
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # JPEG: chọn tỉ lệ giải mã DCT lớn nhất mà ảnh vẫn >= max_side (các định dạng khác bỏ qua)
+        img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side))
+    except Exception:
+        raise InvalidUploadImageError("Ảnh bị hỏng, không thể giải mã.")
+    return PreparedImage(image_bytes, image_format, size, img)
@@ -0,0 +1,200 @@
+"""
+Module Bộ đệm kết quả Tìm kiếm bằng Hình ảnh (Upload-hash Cache) của MobileStore.
+Khách thường gửi lại cùng 1 ảnh chụp màn hình, và ảnh quảng cáo của hãng được lan truyền rất rộng.
+Thay vì nén lại JPEG + gọi Gemini Vision + chạy CLIP cho mỗi lần tải lên, bộ đệm này lưu:
+- JSON nhận diện của Gemini (gắn Namespace phiên bản Prompt, xem `ai_cache_namespace`).
+- Danh sách ID láng giềng CLIP (gắn Phiên bản Kho hàng, tự mất hiệu lực khi Admin sửa kho).
+Khóa tra cứu 2 lớp:
+1. SHA-256 của byte tải lên -> Trùng khớp tuyệt đối.
+2. dHash 64-bit (Perceptual Hash) -> Cùng 1 ảnh nhưng đã bị nén lại / đổi kích thước / đổi định dạng.
+   dHash được chia 4 dải 16 bit làm chỉ mục: 2 mã cách nhau <= 3 bit chắc chắn trùng ít nhất 1 dải,
+   nên chỉ cần so Hamming với vài ứng viên thay vì quét toàn bộ bộ đệm.
+"""
+
+import io
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from PIL import Image
+
+from app.constants import (
+    IMAGE_SEARCH_CACHE_MAX_ENTRIES,
+    IMAGE_SEARCH_CACHE_TTL_SECONDS,
+    IMAGE_SEARCH_DHASH_MAX_DISTANCE
+)
+
+DHASH_BANDS = 4
+DHASH_BAND_BITS = 16
+_DHASH_BAND_MASK = (1 << DHASH_BAND_BITS) - 1
+# Ảnh 1 màu / gần như trơn cho dHash toàn 0 hoặc toàn 1 -> Không đủ thông tin để so khớp cảm quan
+_DEGENERATE_DHASHES = (0, (1 << (DHASH_BANDS * DHASH_BAND_BITS)) - 1)
+
+ImageFingerprint = namedtuple('ImageFingerprint', ['digest', 'dhash'])
+ImageCacheHit = namedtuple('ImageCacheHit', ['kind', 'gemini', 'clip_ids'])
+
+
+def image_dhash(image):
+    """
+    dHash 64-bit: Ảnh xám 9x8, mỗi bit = điểm ảnh sáng hơn điểm bên phải.
+    Nhận ảnh PIL đã giải mã (dùng lại kết quả của Pipeline tải lên), hoặc byte ảnh thô:
+    khi đó JPEG được giải mã thẳng ở độ phân giải thấp (`draft`) nên tốn vài mili-giây kể cả ảnh 12MP.
+    Trả về None nếu không giải mã được ảnh.
+    """
+    try:
+        if not isinstance(image, Image.Image):
+            image = Image.open(io.BytesIO(image))
+            image.draft('L', (64, 64))
+        pixels = image.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def image_fingerprint(image_bytes, image=None):
+    """Dấu vân tay của ảnh tải lên: (SHA-256 hex của byte gốc, dHash hoặc None)."""
+    return ImageFingerprint(hashlib.sha256(image_bytes).hexdigest(),
+                            image_dhash(image if image is not None else image_bytes))
+
+
+def _bands(dhash):
+    return [(i, (dhash >> (i * DHASH_BAND_BITS)) & _DHASH_BAND_MASK) for i in range(DHASH_BANDS)]
+
+
+class ImageSearchCache:
+    """
+    Bộ đệm LRU + TTL an toàn đa luồng, mỗi bản ghi (theo SHA-256) giữ 2 phần độc lập:
+    - 'gemini': (JSON nhận diện, Namespace Prompt, hạn sử dụng)
+    - 'clip':   (ID láng giềng, Phiên bản Kho hàng, số kết quả đã hỏi, hạn sử dụng)
+    Phần Gemini không phụ thuộc kho hàng nên vẫn dùng được sau khi Admin sửa kho,
+    chỉ phần CLIP bị bỏ qua và tính lại.
+    """
+
+    def __init__(self, maxsize=IMAGE_SEARCH_CACHE_MAX_ENTRIES, ttl=IMAGE_SEARCH_CACHE_TTL_SECONDS,
+                 max_distance=IMAGE_SEARCH_DHASH_MAX_DISTANCE):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = min(max_distance, DHASH_BANDS - 1)
+        self._entries = OrderedDict()
+        self._band_index = [{} for _ in range(DHASH_BANDS)]
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.gemini_hits = 0
+        self.clip_hits = 0
+        self.evictions = 0
+
+    def lookup(self, fingerprint, gemini_namespace, catalog_version, n_results):
+        """
+        Tra cứu theo SHA-256, rồi theo dHash gần nhất. Trả về ImageCacheHit
+        (phần nào hết hạn / lệch phiên bản thì là None) hoặc None nếu không có gì dùng được.
+        """
+        now = time.monotonic()
+        with self._lock:
+            kind = 'exact'
+            entry = self._entries.get(fingerprint.digest)
+            if entry is None:
+                kind = 'perceptual'
+                entry = self._nearest(fingerprint.dhash)
+
+            gemini = clip_ids = None
+            if entry is not None:
+                cached = entry.get('gemini')
+                if cached and cached[1] == gemini_namespace and cached[2] > now:
+                    gemini = copy.deepcopy(cached[0])
+                cached = entry.get('clip')
+                if cached and cached[1] == catalog_version and cached[2] >= n_results and cached[3] > now:
+                    clip_ids = list(cached[0][:n_results])
+
+            if gemini is None and clip_ids is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry['digest'])
+            setattr(self, f'{kind}_hits', getattr(self, f'{kind}_hits') + 1)
+            self.gemini_hits += gemini is not None
+            self.clip_hits += clip_ids is not None
+            return ImageCacheHit(kind, gemini, clip_ids)
+
+    def store_gemini(self, fingerprint, namespace, result):
+        with self._lock:
+            self._entry(fingerprint)['gemini'] = (copy.deepcopy(result), namespace, time.monotonic() + self.ttl)
+
+    def store_clip(self, fingerprint, ids, catalog_version, n_results):
+        with self._lock:
+            self._entry(fingerprint)['clip'] = (list(ids), catalog_version, n_results, time.monotonic() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._band_index = [{} for _ in range(DHASH_BANDS)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.perceptual_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'exact_hits': self.exact_hits,
+                'perceptual_hits': self.perceptual_hits,
+                'misses': self.misses,
+                'gemini_hits': self.gemini_hits,
+                'clip_hits': self.clip_hits,
+                'evictions': self.evictions,
+                'hit_ratio': round((lookups - self.misses) / lookups, 4) if lookups else 0.0
+            }
+
+    # ------------------------------------------------------------------
+    # Nội bộ (gọi khi đang giữ khóa)
+    # ------------------------------------------------------------------
+    def _nearest(self, dhash):
+        if dhash is None or dhash in _DEGENERATE_DHASHES:
+            return None
+        candidates = set()
+        for band, value in _bands(dhash):
+            candidates.update(self._band_index[band].get(value, ()))
+
+        best, best_distance = None, self.max_distance + 1
+        for digest in candidates:
+            entry = self._entries[digest]
+            distance = bin(entry['dhash'] ^ dhash).count('1')
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def _entry(self, fingerprint):
+        entry = self._entries.get(fingerprint.digest)
+        if entry is not None:
+            self._entries.move_to_end(fingerprint.digest)
+            return entry
+
+        entry = {'digest': fingerprint.digest, 'dhash': fingerprint.dhash}
+        self._entries[fingerprint.digest] = entry
+        if fingerprint.dhash is not None and fingerprint.dhash not in _DEGENERATE_DHASHES:
+            for band, value in _bands(fingerprint.dhash):
+                self._band_index[band].setdefault(value, set()).add(fingerprint.digest)
+
+        while len(self._entries) > self.maxsize:
+            _, evicted = self._entries.popitem(last=False)
+            self._unindex(evicted)
+            self.evictions += 1
+        return entry
+
+    def _unindex(self, entry):
+        if entry['dhash'] is None or entry['dhash'] in _DEGENERATE_DHASHES:
+            return
+        for band, value in _bands(entry['dhash']):
+            bucket = self._band_index[band].get(value)
+            if bucket is not None:
+                bucket.discard(entry['digest'])
+                if not bucket:
+                    del self._band_index[band][value]
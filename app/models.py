@@ -107,6 +107,18 @@ class AICache(db.Model):
     prompt_hash = db.Column(db.String(500), unique=True, nullable=False)
     response_text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # ---> [NEW: Vòng đời Cache] Phiên bản Prompt, Hạn sử dụng và dấu vết truy cập cho LRU Eviction
+    namespace = db.Column(db.String(120), index=True)
+    expires_at = db.Column(db.DateTime, index=True)
+    last_hit_at = db.Column(db.DateTime, index=True)
+    hit_count = db.Column(db.Integer, default=0)
+    size_bytes = db.Column(db.Integer, default=0)
+
+
+class CatalogVersion(db.Model):
+    """Số đếm Phiên bản Kho hàng dùng chung cho mọi Worker (chỉ có 1 dòng, id = 1)."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
 
 class TradeInRequest(db.Model):
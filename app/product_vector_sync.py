@@ -0,0 +1,122 @@
+"""
+Module Đồng bộ Vector sản phẩm chạy nền (Background Product Vector Sync) của MobileStore.
+Sau khi Admin Thêm/Sửa sản phẩm, việc nhúng MiniLM + tải ảnh từ CDN + chạy CLIP trước đây chạy ngay trong
+request, nên 1 CDN chậm làm trang Admin treo theo. Nay Route chỉ xếp hàng ID sản phẩm và trả về ngay:
+- Luồng nền đọc lại sản phẩm từ Database (luôn đồng bộ dữ liệu mới nhất) rồi cập nhật Vector Văn bản + Ảnh
+  (sản phẩm đã xóa / bị ẩn thì gỡ Vector khỏi kho).
+- Admin lưu cùng 1 sản phẩm nhiều lần liên tiếp -> Gộp lại, không chạy trùng; nếu đang đồng bộ dở thì chạy thêm
+  đúng 1 lượt sau khi xong để lấy bản sửa cuối cùng.
+Khi chạy Unit Test (TESTING=True) đồng bộ ngay trong request, trừ khi cấu hình `PRODUCT_VECTOR_SYNC_INLINE=False`.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+from app.extensions import db
+from app.models import Product
+from app.constants import PRODUCT_VECTOR_SYNC_WORKERS
+from app.utils import sync_product_to_vector_db, sync_product_image_to_vector_db, remove_product_from_vector_db
+
+
+class ProductVectorSyncQueue:
+    """Hàng đợi đồng bộ Vector theo ID sản phẩm, gắn với 1 Flask App."""
+
+    def __init__(self, app, max_workers=PRODUCT_VECTOR_SYNC_WORKERS):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='product-vector-sync')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._running = set()
+        self._dirty = set()
+        self.synced = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    @property
+    def inline(self):
+        return bool(self.app.config.get('PRODUCT_VECTOR_SYNC_INLINE', self.app.config.get('TESTING')))
+
+    def schedule(self, product_id):
+        """Xếp hàng đồng bộ Vector cho 1 sản phẩm (gọi sau khi đã COMMIT)."""
+        if self.inline:
+            self._sync(product_id)
+            return
+
+        with self._lock:
+            if product_id in self._inflight:
+                self.coalesced += 1
+                # Đang chạy dở với dữ liệu cũ -> Đánh dấu để chạy lại 1 lượt; còn trong hàng đợi thì không cần làm gì
+                if product_id in self._running:
+                    self._dirty.add(product_id)
+                return
+            self._inflight[product_id] = self._executor.submit(self._run, product_id)
+
+    def wait_pending(self, timeout=None):
+        """Chờ toàn bộ lượt đồng bộ đang xếp hàng kết thúc (dùng cho Unit Test / Shutdown)."""
+        while True:
+            with self._lock:
+                futures = list(self._inflight.values())
+            if not futures:
+                return
+            for future in futures:
+                future.result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._inflight),
+                'running': len(self._running),
+                'synced': self.synced,
+                'coalesced': self.coalesced,
+                'failures': self.failures,
+                'inline': self.inline
+            }
+
+    # ------------------------------------------------------------------
+    # Nội bộ
+    # ------------------------------------------------------------------
+    def _run(self, product_id):
+        while True:
+            with self._lock:
+                self._running.add(product_id)
+                self._dirty.discard(product_id)
+            with self.app.app_context():
+                try:
+                    self._sync(product_id)
+                finally:
+                    db.session.remove()
+            with self._lock:
+                self._running.discard(product_id)
+                if product_id not in self._dirty:
+                    self._inflight.pop(product_id, None)
+                    return
+
+    def _sync(self, product_id):
+        try:
+            product = db.session.get(Product, product_id)
+            if product is None:
+                # Sản phẩm đã bị xóa trong lúc chờ -> Đảm bảo không còn Vector mồ côi
+                remove_product_from_vector_db(product_id)
+                return
+            if not product.is_active:
+                # Sản phẩm bị ẩn -> Gỡ Vector để AI / Visual Search không gợi ý sản phẩm không còn bán
+                remove_product_from_vector_db(product_id)
+                return
+            sync_product_to_vector_db(product)
+            sync_product_image_to_vector_db(product)
+            with self._lock:
+                self.synced += 1
+        except Exception as e:
+            print(f"⚠️ Lỗi đồng bộ Vector chạy nền cho sản phẩm #{product_id}: {e}")
+            with self._lock:
+                self.failures += 1
+
+
+def get_product_vector_sync():
+    """Lấy hàng đợi đồng bộ Vector gắn với Flask App hiện tại (Lazy Init trong `app.extensions`)."""
+    app = current_app._get_current_object()
+    sync_queue = app.extensions.get('product_vector_sync')
+    if sync_queue is None:
+        sync_queue = app.extensions.setdefault('product_vector_sync', ProductVectorSyncQueue(app))
+    return sync_queue
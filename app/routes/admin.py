@@ -4,7 +4,7 @@ Chứa toàn bộ nghiệp vụ quản lý hệ thống: Xem báo cáo Data Scie
 Duyệt thu cũ đổi mới, Kiểm duyệt bình luận và Quản lý/Phát hành các chiến dịch Voucher.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, send_file, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func, desc
@@ -18,7 +18,22 @@ from app.extensions import db
 from app.models import Product, User, Order, TradeInRequest, OrderDetail, Comment, Voucher
 
 # Import Lõi tiện ích
-from app.utils import sync_product_to_vector_db, sync_product_image_to_vector_db # ---> [NEW]
+from app.utils import remove_product_from_vector_db
+from app.search_engine import (
+    sync_product_to_search_index,
+    remove_product_from_search_index,
+    get_search_result_cache,
+    bump_catalog_version
+)
+from app.search_intent import get_search_intent_resolver
+from app.gemini_client import get_gemini_pool_stats
+from app.caching import ai_call_flight
+from app.ai_cache import get_ai_response_cache
+from app.semantic_cache import get_semantic_cache_stats
+from app.ai_resources import get_ai_resource_stats
+from app.visual_search import get_visual_search_runner
+from app.image_fetcher import get_image_fetcher
+from app.product_vector_sync import get_product_vector_sync
 
 # Import Hằng số hệ thống
 from app.constants import (
@@ -201,6 +216,8 @@ def update_order_status(id, status):
 
     order.status = status
     db.session.commit()
+    if status == ORDER_STATUS_CANCELLED:
+        bump_catalog_version()  # Hàng đã về kho -> Làm mới Cache tìm kiếm
     flash(f'Cập nhật thành công: {status}', 'success')
     return redirect(url_for('admin.dashboard'))
 
@@ -210,7 +227,7 @@ def add_product():
     """
     Nghiệp vụ thêm mới Sản phẩm vào kho hàng.
     Sau khi lưu vào Relational DB, hệ thống tự kích hoạt Trigger
-    đồng bộ hóa Vector DB để cập nhật bộ não AI ngay lập tức.
+    đồng bộ hóa Vector DB (chạy nền, không bắt Admin chờ tải ảnh từ CDN) để cập nhật bộ não AI.
     """
     try:
         new_p = Product(
@@ -225,8 +242,8 @@ def add_product():
         )
         db.session.add(new_p)
         db.session.commit()
-        sync_product_to_vector_db(new_p)
-        sync_product_image_to_vector_db(new_p)  # ---> [NEW] Cập nhật Vector Ảnh
+        sync_product_to_search_index(new_p)
+        get_product_vector_sync().schedule(new_p.id)  # Vector Văn bản + Ảnh cập nhật ở luồng nền
         flash(SystemMessages.PRODUCT_ADD_SUCCESS, 'success')
     except Exception as e:
         db.session.rollback()
@@ -263,8 +280,8 @@ def edit_product(id):
             if versions_json: product.versions = versions_json
 
             db.session.commit()
-            sync_product_to_vector_db(product)
-            sync_product_image_to_vector_db(product)  # ---> [NEW] Cập nhật Vector Ảnh
+            sync_product_to_search_index(product)
+            get_product_vector_sync().schedule(product.id)  # Vector Văn bản + Ảnh cập nhật ở luồng nền
 
             flash(SystemMessages.PRODUCT_UPDATE_SUCCESS, 'success')
             return redirect(url_for('admin.dashboard'))
@@ -287,10 +304,49 @@ def delete_product(id):
     product = Product.query.get_or_404(id)
     db.session.delete(product)
     db.session.commit()
+    remove_product_from_search_index(id)
+    remove_product_from_vector_db(id)
     flash(SystemMessages.PRODUCT_DELETE_SUCCESS, 'success')
     return redirect(url_for('admin.dashboard'))
 
 
+@admin_bp.route('/admin/api/cache-stats')
+def cache_stats():
+    """
+    API giám sát bộ đệm tìm kiếm (JSON): số lượt Hit/Miss, tỉ lệ Hit, số bản ghi bị đẩy ra
+    và Phiên bản Kho hàng hiện tại. Dùng để định cỡ `SEARCH_CACHE_MAX_ENTRIES` / TTL.
+    Kèm thống kê tầng phân tích ý định (số câu đang chờ / đã được Gemini làm giàu ngầm)
+    và tỉ lệ Hit từng tầng của bộ đệm phản hồi AI (RAM / Database / Ngữ nghĩa).
+    """
+    return jsonify({
+        'search_results': get_search_result_cache().stats(),
+        'search_intents': get_search_intent_resolver().stats(),
+        'ai_responses': get_ai_response_cache().stats(),
+        'semantic': get_semantic_cache_stats()
+    })
+
+
+@admin_bp.route('/admin/api/ai-stats')
+def ai_stats():
+    """
+    API giám sát tầng AI (JSON): sức khỏe từng Gemini API Key trong bể kết nối
+    (thời gian cách ly còn lại, tỉ lệ lỗi, độ trễ EWMA, trọng số Round-Robin)
+    và trạng thái Cầu dao (Circuit Breaker) cùng số lần chuyển trạng thái,
+    kèm số lời gọi AI trùng lặp đã được gộp (Single-flight)
+    và trạng thái nạp lười của các Model nội bộ (CLIP, MiniLM, ChromaDB),
+    cùng số lần Tầng Gemini / CLIP của Visual Search vượt hạn chót và tỉ lệ trúng Bộ đệm ảnh tải lên,
+    bộ tải ảnh sản phẩm từ xa và hàng đợi đồng bộ Vector chạy nền.
+    """
+    return jsonify({
+        'gemini_keys': get_gemini_pool_stats(),
+        'single_flight': ai_call_flight.stats(),
+        'local_models': get_ai_resource_stats(),
+        'visual_search': get_visual_search_runner().stats(),
+        'image_fetcher': get_image_fetcher().stats(),
+        'product_vector_sync': get_product_vector_sync().stats()
+    })
+
+
 @admin_bp.route('/admin/tradein/update', methods=['POST'])
 def update_tradein():
     """
@@ -8,18 +8,17 @@ import os
 import time
 import json
 import hashlib
-import re
 import urllib.parse  # ---> [NEW: Thêm thư viện để encode URL an toàn]
 from datetime import datetime, timedelta, timezone
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, and_, func, desc
+from sqlalchemy import or_, func, desc
 
 # Import Extensions & Models
 from app.extensions import db, csrf
-from app.models import Product, Order, OrderDetail, AICache, TradeInRequest, Comment, Voucher
+from app.models import Product, Order, OrderDetail, TradeInRequest, Comment, Voucher
 
 # Import Hằng số cấu hình hệ thống
 from app.constants import (
@@ -31,7 +30,11 @@ from app.constants import (
     CHATBOT_QUICK_REPLIES,
     SystemMessages,
     PAYMENT_METHOD_COD,
-    PAYMENT_METHOD_BANKING
+    PAYMENT_METHOD_BANKING,
+    SEARCH_VECTOR_RESULTS,
+    VECTOR_PREFILTER_OVERFETCH_FACTOR,
+    VECTOR_PREFILTER_MAX_FETCH,
+    VISUAL_SEARCH_MIN_CONFIDENCE
 )
 
 # Import Thư viện tiện ích & Thuật toán lõi
@@ -53,59 +56,63 @@ from app.utils import (
     identify_phone_by_gemini  # ---> [HOTFIX] Bổ sung Import AI đọc tên máy
 )
 
+# Import Chỉ mục tìm kiếm RAM (In-Memory Catalog Index)
+from app.search_engine import get_catalog_index, hybrid_rank, get_search_result_cache, bump_catalog_version
+from app.search_intent import get_search_intent_resolver, INTENT_TIER_LLM, INTENT_TIER_LOCAL_PENDING
+from app.visual_search import get_visual_search_runner
+from app.image_pipeline import prepare_upload
+from app.custom_exceptions import InvalidUploadImageError
+from app.caching import ai_call_flight
+from app.ai_cache import get_ai_response_cache, ai_cache_namespace, ai_cache_ttl
+
 main_bp = Blueprint('main', __name__)
 
 
 def cached_ai_call(func, *args):
     """
-    Trình bọc (Wrapper) lưu trữ kết quả gọi API AI vào Cache Database.
+    Trình bọc (Wrapper) lưu trữ kết quả gọi API AI vào Cache 2 tầng (RAM LRU + Database).
     Giảm tải API Quota và tăng tốc độ xử lý câu trả lời lên gấp 10 lần nhờ mã băm (MD5).
+    Các request đồng thời cùng mã băm được gộp lại (Single-flight): chỉ 1 lời gọi Gemini thực sự.
     """
-    try:
-        cache_key_content = f"{func.__name__}_{str(args)}_v239_final"
-        key = hashlib.md5(cache_key_content.encode()).hexdigest()
-
-        cached = AICache.query.filter_by(prompt_hash=key).first()
-        if cached:
-            try:
-                # ---> [HOTFIX] Bóc tách rác Markdown bảo vệ Cache an toàn tuyệt đối
-                text_data = re.sub(r"```json|```", "", cached.response_text).strip()
-                if text_data.startswith('{') and text_data.endswith('}'):
-                    return json.loads(text_data)
-                elif text_data.startswith('[') and text_data.endswith(']'):
-                    return json.loads(text_data)
-                return text_data
-            except Exception:
-                return cached.response_text
-    except Exception as e:
-        print(f"Cache Error: {e}")
+    # Namespace tự đổi khi Prompt của hàm AI thay đổi -> Không cần sửa tay hậu tố phiên bản
+    namespace = ai_cache_namespace(func)
+    cache_key_content = f"{namespace}_{str(args)}"
+    key = hashlib.md5(cache_key_content.encode()).hexdigest()
 
-    # Thực thi API thực tế nếu không có Cache
-    res = func(*args)
+    ai_cache = get_ai_response_cache()
+    cached = ai_cache.get(key)
+    if cached:
+        return cached
 
+    # Thực thi API thực tế nếu không có Cache (Leader gọi API + ghi Cache, Follower nhận chung kết quả)
+    return ai_call_flight.do(key, _execute_and_cache_ai_call, ai_cache, key, func, *args)
+
+
+def _execute_and_cache_ai_call(ai_cache, key, func, *args):
+    res = func(*args)
     if res:
-        try:
-            val = json.dumps(res) if isinstance(res, (dict, list)) else str(res)
-            if not AICache.query.filter_by(prompt_hash=key).first():
-                db.session.add(AICache(prompt_hash=key, response_text=val))
-                db.session.commit()
-        except Exception:
-            pass
+        ai_cache.set(key, res, namespace=ai_cache_namespace(func), ttl=ai_cache_ttl(func))
     return res
 
 
-def build_chroma_filter(ai_data):
+def build_chroma_filter(ai_data, brands=None):
     """
     Chuyển đổi dữ liệu phân tích ý định tìm kiếm thành định dạng metadata filter (JSON).
     Phục vụ cho chức năng Hybrid Search của ChromaDB.
+    - brands: Tập tên hãng CHÍNH XÁC lấy từ tập ứng viên đã lọc cứng. Vector DB không hỗ trợ khớp chuỗi con
+      như `ilike %brand%` của SQL -> Dùng `$in` trên các tên hãng thực tế để ra cùng 1 kết quả.
     """
     if not ai_data:
         return None
     conditions = []
     if ai_data.get('category'):
         conditions.append({"category": ai_data['category']})
-    if ai_data.get('brand'):
+    if brands is not None:
+        conditions.append({"brand": {"$in": sorted(brands)}})
+    elif ai_data.get('brand'):
         conditions.append({"brand": ai_data['brand']})
+    if ai_data.get('max_price'):
+        conditions.append({"price": {"$lte": int(ai_data['max_price'])}})
 
     if len(conditions) == 1:
         return conditions[0]
@@ -114,6 +121,25 @@ def build_chroma_filter(ai_data):
     return None
 
 
+def semantic_search_in_pool(semantic_query, pool_ids, vector_filter, n_results=SEARCH_VECTOR_RESULTS):
+    """
+    Tìm kiếm Vector đã đẩy bộ lọc cứng (Hãng / Loại / Giá) xuống Vector DB, chỉ giữ ID nằm trong tập ứng viên.
+    Over-fetch thích ứng: nếu số kết quả hợp lệ còn thiếu (Vector có Metadata cũ, sản phẩm vừa ngừng bán...)
+    thì hỏi lại với n_results lớn hơn, dừng khi đủ, khi Vector DB đã hết kết quả, hoặc chạm mức trần.
+    Người dùng không lọc gì vẫn chỉ tốn đúng 1 truy vấn `n_results` như cũ.
+    """
+    target = min(n_results, len(pool_ids))
+    if target == 0:
+        return []
+    fetch = n_results
+    while True:
+        ids = search_vector_db(semantic_query, n_results=fetch, metadata_filters=vector_filter)
+        hits = [vid for vid in ids if str(vid).isdigit() and int(vid) in pool_ids]
+        if len(hits) >= target or len(ids) < fetch or fetch >= VECTOR_PREFILTER_MAX_FETCH:
+            return hits[:n_results]
+        fetch = min(fetch * VECTOR_PREFILTER_OVERFETCH_FACTOR, VECTOR_PREFILTER_MAX_FETCH)
+
+
 # =======================================================================================
 # ---> [NEW: HELPER CALCULATE USER RANK] <---
 # Khắc phục lỗi bảo mật: Tự động tính hạng thẻ từ Backend để chống thao túng (Spoofing)
@@ -144,6 +170,18 @@ def _calculate_user_rank(user_id):
 # =======================================================================================
 
 
+def _load_products_in_order(product_ids):
+    """
+    Nạp các đối tượng Product theo đúng thứ tự danh sách ID đã xếp hạng.
+    Chỉ truy vấn đúng những ID cần hiển thị (1 câu SQL `IN`), không quét toàn bảng.
+    """
+    if not product_ids:
+        return []
+    rows = Product.query.filter(Product.id.in_(product_ids), Product.is_active == True).all()
+    by_id = {p.id: p for p in rows}
+    return [by_id[pid] for pid in product_ids if pid in by_id]
+
+
 @main_bp.route('/')
 def home():
     q = request.args.get('q', '').strip()
@@ -155,88 +193,78 @@ def home():
 
     base_query = Product.query.filter_by(is_active=True)
     ai_data = None  # Cần lưu lại ai_data để dùng cho lớp Fallback phía dưới
-
-    if q and len(q.split()) >= 1:
+    intent_tier = None
+
+    # BỘ ĐỆM KẾT QUẢ: Câu hỏi lặp lại (cùng q + hãng + sắp xếp) bỏ qua toàn bộ Pipeline AI
+    search_cache = get_search_result_cache()
+    cache_version = search_cache.version
+    intent_resolver = get_search_intent_resolver()
+    cached = search_cache.get(q, brand_arg, sort_arg) if q else None
+    # Kết quả tính bằng ý định Local đang chờ Gemini: khi Gemini đã trả lời thì tính lại
+    if cached is not None and cached.get('intent_tier') == INTENT_TIER_LOCAL_PENDING \
+            and intent_resolver.has_enriched(q):
+        cached = None
+    if cached is not None:
+        products = _load_products_in_order(cached['ids'])
+        ai_msg = cached['ai_msg']
+
+    if cached is None and q and len(q.split()) >= 1:
         # ---> [NÂNG CẤP]: TRUE HYBRID AI SEARCH (Kết hợp Keyword + Vector Semantic)
-        ai_data = analyze_search_intents(q)
+        # Local-First: Regex nội bộ trả lời ngay, Gemini chỉ làm giàu ngầm câu hỏi khó
+        ai_data, intent_tier = intent_resolver.resolve(q, analyze_search_intents, local_analyze_intent)
 
-        if ai_data and (ai_data.get('keyword') or ai_data.get('brand') or ai_data.get('category') or ai_data.get('semantic_query')):
+        if intent_tier == INTENT_TIER_LLM:
             ai_msg = "🧠 Hybrid AI Search (Gemini + Vector)"
         else:
-            ai_data = local_analyze_intent(q)
             ai_msg = "⚡ Smart Search (Tốc độ cao)"
 
-        query = base_query
-
         if brand_arg:
             ai_data['brand'] = brand_arg
 
-        # 1. LỌC CỨNG (HARD FILTERS)
+        # 1. LỌC CỨNG (HARD FILTERS) - Chạy trên Chỉ mục RAM thay vì `query.all()` mỗi request
+        catalog_index = get_catalog_index()
         if ai_data.get('brand'):
-            if ai_data.get('category') == 'accessory':
-                query = query.filter(
-                    or_(Product.brand.ilike(f"%{ai_data['brand']}%"), Product.brand.ilike("%Phụ kiện%")))
-            else:
-                query = query.filter(Product.brand.ilike(f"%{ai_data['brand']}%"))
             ai_msg += f" | Hãng: {ai_data['brand']}"
 
-        if ai_data.get('category'):
-            query = query.filter(Product.category == ai_data['category'])
-
-        if ai_data.get('max_price'):
-            query = query.filter(Product.price <= int(ai_data['max_price']))
-
-        products_pool = query.all()
+        products_pool = catalog_index.filter_candidates(
+            brand=ai_data.get('brand'),
+            category=ai_data.get('category'),
+            max_price=ai_data.get('max_price'),
+            include_accessory_brand=ai_data.get('category') == 'accessory'
+        )
+        pool_ids = {doc.id for doc in products_pool}
 
         # 2. ĐỘNG CƠ TÌM KIẾM LAI ĐA TRỌNG SỐ (HYBRID SCORING ENGINE)
         # Kết hợp chấm điểm Từ khóa (Chính xác) + Điểm Ngữ nghĩa VectorDB (Linh hoạt)
         if ai_data.get('keyword') or ai_data.get('semantic_query'):
-            search_kws = set((ai_data.get('keyword') or q).lower().split())
-            scored_products = []
-
             # --- Gọi Vector DB để lấy Danh sách ID phù hợp ngữ nghĩa nhất ---
             semantic_query = ai_data.get('semantic_query') or ai_data.get('keyword') or q
             # Chú ý: Vector Search rất mạnh trong việc hiểu "nhu cầu" (chụp ảnh đẹp, pin trâu)
-            semantic_ids = search_vector_db(semantic_query, n_results=10)
-
-            for p in products_pool:
-                score = 0
-                name_lower = p.name.lower()
-                desc_lower = (p.description or "").lower()
-
-                # TÍNH ĐIỂM 1: Keyword Match (Đảm bảo gõ đúng tên máy thì phải lên Top 1)
-                match_count = 0
-                for kw in search_kws:
-                    if kw in name_lower:
-                        score += 150  # Khớp tên máy -> Điểm tuyệt đối
-                        match_count += 1
-                    elif kw in desc_lower:
-                        score += 20   # Khớp mô tả -> Điểm phụ
-
-                # Thưởng thêm nếu khớp nguyên cụm từ khóa liên tiếp trong tên
-                if ai_data.get('keyword') and ai_data['keyword'].lower() in name_lower:
-                    score += 300
-
-                # TÍNH ĐIỂM 2: Vector Semantic Boost (Sức mạnh AI thực sự)
-                # Dù không khớp chữ nào, nhưng VectorDB bảo giống -> Vẫn được cộng điểm
-                if str(p.id) in semantic_ids:
-                    rank = semantic_ids.index(str(p.id))
-                    # Top 1 Vector được +100đ, Top 10 được +10đ
-                    score += (10 - rank) * 10
-
-                # Đưa vào list nếu có bất kỳ điểm số nào (Từ khóa hoặc Ngữ nghĩa)
-                if score > 0:
-                    p.match_score = score
-                    scored_products.append(p)
-
-            # Sắp xếp theo tổng điểm giảm dần
-            scored_products.sort(key=lambda x: x.match_score, reverse=True)
-            products = scored_products
+            # Đẩy cùng bộ lọc cứng xuống Vector DB để 10 kết quả ngữ nghĩa không bị loại bỏ hết khi lọc hẹp
+            vector_filter = build_chroma_filter(
+                ai_data, brands={doc.brand for doc in products_pool} if ai_data.get('brand') else None
+            )
+            semantic_ids = semantic_search_in_pool(semantic_query, pool_ids, vector_filter)
+
+            # TÍNH ĐIỂM 1: BM25 đa trường (Tên > Hãng > Mô tả) trên Chỉ mục Đảo ngược,
+            # khớp nguyên cụm từ khóa liên tiếp trong tên được nhân hệ số thưởng.
+            # TÍNH ĐIỂM 2: Hợp nhất với thứ hạng VectorDB qua Reciprocal Rank Fusion (RRF)
+            ranked = hybrid_rank(
+                catalog_index,
+                ai_data.get('keyword') or q,
+                phrase=ai_data.get('keyword'),
+                vector_ids=semantic_ids,
+                candidate_ids=pool_ids
+            )
+            scores = dict(ranked)
+            products = _load_products_in_order([pid for pid, _ in ranked])
+            for p in products:
+                p.match_score = scores[p.id]
         else:
-            products = products_pool
+            products = _load_products_in_order([doc.id for doc in products_pool])
 
     # LỚP FALLBACK (SQL THUẦN) NẾU TÌM KIẾM AI THẤT BẠI
-    if not products and q:
+    if cached is None and not products and q:
         fallback_query = base_query
         if ai_data and ai_data.get('category'):
             fallback_query = fallback_query.filter(Product.category.ilike(f"{ai_data['category']}"))
@@ -278,6 +306,10 @@ def home():
         elif sort_arg == 'price_desc':
             products.sort(key=lambda x: x.sale_price if x.is_sale and x.sale_price else x.price, reverse=True)
 
+    if q and cached is None:
+        search_cache.set(q, brand_arg, sort_arg, [p.id for p in products], ai_msg,
+                         version=cache_version, intent_tier=intent_tier)
+
     brands = [b[0] for b in db.session.query(Product.brand).distinct().all()]
     hot_products = Product.query.filter_by(is_active=True, is_sale=True).limit(4).all()
 
@@ -306,8 +338,20 @@ def search_by_image():
         flash(msg, "danger")
         return redirect(url_for('main.home'))
 
-    # BƯỚC 1: Dùng AI Gemini Đọc và Tách Bạch Cấu Trúc Ảnh
-    ai_data = identify_phone_by_gemini(file)
+    # BƯỚC 0: Kiểm tra Header (chặn ảnh quá nhiều Megapixel) và giải mã ảnh ĐÚNG 1 LẦN cho mọi tầng
+    try:
+        prepared = prepare_upload(file.read())
+    except InvalidUploadImageError as e:
+        flash(e.message, "danger")
+        return redirect(url_for('main.home'))
+
+    # BƯỚC 1: Khởi động SONG SONG Gemini (Đọc và Tách Bạch Cấu Trúc Ảnh) + CLIP (Vector hình dáng)
+    # trên cùng 1 ảnh đã giải mã; chỉ chờ Gemini tới hạn chót chung, CLIP chạy sẵn để dự phòng
+    visual_job = get_visual_search_runner().start(prepared, identify_phone_by_gemini, search_image_vector_db,
+                                                  n_results=5)
+    ai_data = visual_job.gemini_result()
+    if visual_job.gemini_timed_out:
+        flash("AI đọc tên máy quá lâu. Hệ thống chuyển sang kết quả quét hình dáng quang học.", "warning")
     products = []
     ai_message = ""
 
@@ -328,88 +372,21 @@ def search_by_image():
         # ---> [GIẢI QUYẾT LỖI TẠI ĐÂY]: ÁP DỤNG NGƯỠNG CẮT (CONFIDENCE THRESHOLD)
         # Nếu AI không tự tin (< 50%), KHÔNG ĐƯỢC tin vào kết quả đoán bừa của nó.
         # Xóa ngay model để ép hệ thống rơi xuống Tầng 3 (Dùng Vector DB ResNet50 quét bằng hình ảnh).
-        if confidence < 50:
+        if confidence < VISUAL_SEARCH_MIN_CONFIDENCE:
              flash(f"Ảnh mờ, AI không chắc chắn tên máy (Tự tin: {confidence}%). Hệ thống đang chuyển sang quét hình dáng quang học.", "warning")
              brand = None
              model = None
              search_keywords = []
 
-        # Nếu AI tự tin nó biết chữ (model != None), thì mới đi tìm bằng SQL
+        # Nếu AI tự tin nó biết chữ (model != None), thì mới đi tìm trong kho
         if model:
-            base_query = Product.query.filter_by(is_active=True, category='phone')
-
-            # --- [TẦNG 1 MỚI]: TÌM KIẾM LINH HOẠT VỚI LOGIC (AND) ---
-            if brand:
-                base_query = base_query.filter(Product.brand.ilike(f"%{brand}%"))
-
-            if not search_keywords and model:
-                search_keywords = model.split()
-
-            conditions = []
-            for kw in search_keywords:
-                if brand and kw.lower() == brand.lower(): continue  # Bỏ qua chữ hãng vì đã lọc trên
-                if len(kw) == 1 and not kw.isalnum(): continue
-                conditions.append(Product.name.ilike(f"%{kw}%"))
-
-            if conditions:
-                exact_products_raw = base_query.filter(and_(*conditions)).all()
-            else:
-                exact_products_raw = []
-
-            strict_products = []
-            if exact_products_raw:
-                # ---> THUẬT TOÁN FINGERPRINT MATCHING (BAO PHỦ MỌI HÃNG) <---
-                model_lower = model.lower() if model else " ".join([k.lower() for k in search_keywords])
-
-                # Danh sách biến thể (Bắt buộc khớp 2 chiều bằng XOR Logic)
-                word_modifiers = [
-                    'pro', 'max', 'plus', 'ultra', 'ti', 'fe', 'se', 'mini',
-                    'fold', 'flip', 'edge', 'lite', 'classic', 'neo', 'narzo',
-                    'play', 'active', 'zoom', 'note', 'pad', 'tab', 'gt'
-                ]
-                strict_modifiers = set(word_modifiers + list('abcdefghijklmnopqrstuvwxyz'))
-
-                for p in exact_products_raw:
-                    p_name_lower = p.name.lower()
-                    is_valid = True
-
-                    # 1. Đồng bộ dữ liệu đặc thù và loại bỏ hoàn toàn rác RAM/ROM/Mạng
-                    p_name_clean = p_name_lower.replace('promax', 'pro max').replace('+', ' plus ')
-                    model_clean = model_lower.replace('promax', 'pro max').replace('+', ' plus ')
-
-                    # Quét bay mọi con số liên quan đến dung lượng để tránh làm nhiễu số thế hệ máy
-                    storage_pattern = r'\b\d{1,4}\s*(?:gb|tb|mb|g|t)\b|\b(?:5g|4g|ram|rom)\b'
-                    p_name_clean = re.sub(storage_pattern, '', p_name_clean)
-                    model_clean = re.sub(storage_pattern, '', model_clean)
-
-                    # 2. Tách rời chữ và số CẢ 2 CHIỀU (VD: S24 -> S 24, 13T -> 13 T)
-                    db_base = re.sub(r'([a-z])(\d)', r'\1 \2', p_name_clean)
-                    db_base = re.sub(r'(\d)([a-z])', r'\1 \2', db_base)
-
-                    ai_base = re.sub(r'([a-z])(\d)', r'\1 \2', model_clean)
-                    ai_base = re.sub(r'(\d)([a-z])', r'\1 \2', ai_base)
-
-                    db_tokens = set(db_base.split())
-                    ai_tokens = set(ai_base.split())
-
-                    # 3. CHẶN ĐỨNG SAI LỆCH BIẾN THỂ (XOR LOGIC)
-                    for mod in strict_modifiers:
-                        if (mod in ai_tokens) != (mod in db_tokens):
-                            is_valid = False
-                            break
-
-                    if not is_valid:
-                        continue
-
-                    # 4. KHỚP MÃ SỐ THẾ HỆ (SUBSET MATCH)
-                    db_numbers = set(re.findall(r'\b\d+\b', db_base))
-                    ai_numbers = set(re.findall(r'\b\d+\b', ai_base))
-
-                    if not ai_numbers.issubset(db_numbers):
-                        is_valid = False
-
-                    if is_valid:
-                        strict_products.append(p)
+            # --- [TẦNG 1]: THUẬT TOÁN FINGERPRINT MATCHING (BAO PHỦ MỌI HÃNG) ---
+            # Dấu vân tay (token / biến thể / số thế hệ) của từng sản phẩm đã tính sẵn trong Chỉ mục RAM,
+            # tên máy AI đọc được chỉ cần tra Postings thay vì SQL `ilike` + Regex trên từng dòng
+            strict_ids = get_catalog_index().match_model(model, brand=brand, keywords=search_keywords)
+            strict_products = _load_products_in_order(strict_ids)
+            # Đã có tên máy -> Tầng CLIP không còn cần thiết
+            visual_job.discard_clip()
 
             if strict_products:
                 # Nếu tìm thấy chính xác bản máy đó trong shop -> Chỉ hiển thị nó!
@@ -428,8 +405,8 @@ def search_by_image():
     # --- [TẦNG 3]: VISUAL VECTOR FALLBACK CHỈ CHẠY KHI AI MÙ CHỮ, KHÔNG NHẬN DIỆN ĐƯỢC TÊN MÁY ---
     # Nhờ bản vá ở trên (model = None khi tự tin thấp), tầng này nay sẽ được GỌI THÀNH CÔNG cứu vớt người dùng!
     if not products and not model:
-        file.seek(0) # Trả con trỏ file về 0
-        matched_ids = search_image_vector_db(file, n_results=5)
+        # Kết quả CLIP đã được tính song song với Gemini -> Thường có sẵn ngay, không phải chờ thêm
+        matched_ids = visual_job.clip_result()
 
         if matched_ids:
             ids = [int(i) for i in matched_ids if i.isdigit()]
@@ -743,6 +720,7 @@ def checkout():
                                 price=i['price']))
 
             db.session.commit()
+            bump_catalog_version()  # Tồn kho thay đổi -> Làm mới Cache tìm kiếm
             session.pop('cart', None)
 
             if payment_method == PAYMENT_METHOD_BANKING:
@@ -881,6 +859,7 @@ def cancel_order_user(id):
                 p.stock_quantity += d.quantity
         order.status = ORDER_STATUS_CANCELLED
         db.session.commit()
+        bump_catalog_version()
         flash(SystemMessages.ORDER_CANCEL_SUCCESS, 'success')
     return redirect(url_for('main.dashboard'))
 
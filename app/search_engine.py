@@ -0,0 +1,647 @@
+"""
+Module Động cơ Tìm kiếm Nội bộ (In-Memory Catalog Index) của MobileStore.
+Lưu bản chỉ mục của toàn bộ kho hàng ngay trong RAM của tiến trình (Process-local):
+chữ thường hóa sẵn Tên/Mô tả, Postings theo Hãng/Danh mục, giá hiệu lực và
+Chỉ mục Đảo ngược (Inverted Index) theo từng trường để xếp hạng bằng thuật toán BM25.
+Nhiều Worker Gunicorn mỗi Worker giữ 1 bản chỉ mục riêng; Phiên bản Kho hàng dùng chung (1 dòng đếm trong DB)
+cho biết Worker khác vừa sửa kho để tự nạp lại (xem CatalogVersionTracker).
+"""
+
+import re
+import time
+import math
+import heapq
+import threading
+import unicodedata
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.constants import (
+    SEARCH_FIELD_WEIGHTS,
+    SEARCH_BM25_K1,
+    SEARCH_BM25_B,
+    SEARCH_PHRASE_BOOST,
+    SEARCH_RRF_K,
+    SEARCH_RRF_WEIGHTS,
+    SEARCH_TOP_K,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_TTL_SECONDS,
+    CATALOG_VERSION_CHECK_INTERVAL_SECONDS
+)
+from app.caching import TTLLRUCache
+
+_WORD_PATTERN = re.compile(r'\w+')
+_ALNUM_SPLIT_PATTERN = re.compile(r'[^\W\d_]+|\d+')
+
+# Dấu vân tay dòng máy (Model Fingerprint) cho bộ so khớp chính xác của Visual Search
+_STORAGE_PATTERN = re.compile(r'\b\d{1,4}\s*(?:gb|tb|mb|g|t)\b|\b(?:5g|4g|ram|rom)\b')
+_LETTER_DIGIT_PATTERN = re.compile(r'([a-z])(\d)')
+_DIGIT_LETTER_PATTERN = re.compile(r'(\d)([a-z])')
+_NUMBER_PATTERN = re.compile(r'\b\d+\b')
+# Danh sách biến thể (Bắt buộc khớp 2 chiều): từ biến thể + mọi chữ cái đơn (S24 vs A24, 13 vs 13T...)
+MODEL_WORD_MODIFIERS = (
+    'pro', 'max', 'plus', 'ultra', 'ti', 'fe', 'se', 'mini',
+    'fold', 'flip', 'edge', 'lite', 'classic', 'neo', 'narzo',
+    'play', 'active', 'zoom', 'note', 'pad', 'tab', 'gt'
+)
+STRICT_MODEL_MODIFIERS = frozenset(MODEL_WORD_MODIFIERS) | frozenset('abcdefghijklmnopqrstuvwxyz')
+
+ModelFingerprint = namedtuple('ModelFingerprint', ['tokens', 'modifiers', 'numbers'])
+
+
+def normalize_search_text(text):
+    """Chuẩn hóa chuỗi về dạng Unicode NFC chữ thường, gom khoảng trắng để so khớp thống nhất."""
+    text = unicodedata.normalize('NFC', str(text or ""))
+    return " ".join(text.lower().split())
+
+
+def fold_vietnamese(text):
+    """Bỏ dấu tiếng Việt (điện thoại -> dien thoai) để khách gõ không dấu vẫn tìm ra."""
+    decomposed = unicodedata.normalize('NFD', text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != 'Mn')
+    return stripped.replace('đ', 'd').replace('Đ', 'D')
+
+
+def tokenize_vietnamese(text):
+    """
+    Bộ tách từ (Tokenizer) thân thiện tiếng Việt cho chỉ mục BM25. Sinh ra:
+    - Âm tiết gốc có dấu ('điện', 'thoại') và bản không dấu ('dien', 'thoai').
+    - Tách chữ/số dính liền của mã máy ('s24' -> 's', '24'; 'fold5' -> 'fold', '5').
+    - Cặp âm tiết liền kề (Bigram) để giữ nghĩa từ ghép ('tai_nghe', 'điện_thoại').
+    """
+    text = normalize_search_text(text).replace('+', ' plus ')
+    syllables = _WORD_PATTERN.findall(text)
+
+    tokens = []
+    for s in syllables:
+        tokens.append(s)
+        folded = fold_vietnamese(s)
+        if folded != s:
+            tokens.append(folded)
+        parts = _ALNUM_SPLIT_PATTERN.findall(s)
+        if len(parts) > 1:
+            tokens.extend(parts)
+
+    for first, second in zip(syllables, syllables[1:]):
+        tokens.append(f"{first}_{second}")
+
+    return tokens
+
+
+def model_fingerprint(text):
+    """
+    Dấu vân tay của 1 tên máy: (tập token, tập biến thể, tập số thế hệ).
+    1. Đồng bộ dữ liệu đặc thù (promax, +) và loại bỏ rác RAM/ROM/Mạng để không nhiễu số thế hệ máy.
+    2. Tách rời chữ và số CẢ 2 CHIỀU (VD: S24 -> S 24, 13T -> 13 T).
+    """
+    clean = str(text or "").lower().replace('promax', 'pro max').replace('+', ' plus ')
+    clean = _STORAGE_PATTERN.sub('', clean)
+    base = _DIGIT_LETTER_PATTERN.sub(r'\1 \2', _LETTER_DIGIT_PATTERN.sub(r'\1 \2', clean))
+    tokens = frozenset(base.split())
+    return ModelFingerprint(tokens, tokens & STRICT_MODEL_MODIFIERS, frozenset(_NUMBER_PATTERN.findall(base)))
+
+
+class IndexedProduct:
+    """
+    Bản chụp (Snapshot) gọn nhẹ của một Sản phẩm trong chỉ mục.
+    Chỉ giữ các trường phục vụ lọc & chấm điểm, không giữ tham chiếu tới Session SQLAlchemy.
+    """
+    __slots__ = ('id', 'name_lower', 'desc_lower', 'brand', 'brand_lower', 'category',
+                 'price', 'effective_price', 'field_tokens', 'fingerprint')
+
+    def __init__(self, product):
+        self.id = product.id
+        self.name_lower = normalize_search_text(product.name)
+        self.desc_lower = normalize_search_text(product.description)
+        # Tên hãng nguyên gốc: dùng để dựng bộ lọc `$in` chính xác cho Vector DB
+        self.brand = product.brand
+        self.brand_lower = normalize_search_text(product.brand)
+        self.category = product.category
+        self.price = product.price or 0
+        self.effective_price = product.sale_price if product.is_sale and product.sale_price else self.price
+        self.field_tokens = {
+            'name': tokenize_vietnamese(self.name_lower),
+            'brand': tokenize_vietnamese(self.brand_lower),
+            'description': tokenize_vietnamese(self.desc_lower)
+        }
+        # Tính sẵn 1 lần cho Điện thoại (bộ so khớp dòng máy của Visual Search chỉ xét category 'phone')
+        self.fingerprint = model_fingerprint(product.name) if self.category == 'phone' else None
+
+
+class CatalogIndex:
+    """
+    Chỉ mục kho hàng dùng chung cho mọi request của một Flask App.
+    - Được xây dựng 1 lần (Lazy Build) ở lần tìm kiếm đầu tiên.
+    - Được cập nhật tăng dần (Incremental) khi Admin Thêm/Sửa/Xóa sản phẩm.
+    - Chỉ lưu các sản phẩm đang Active (tương đương `filter_by(is_active=True)`).
+    - Gắn với Phiên bản Kho hàng dùng chung: Worker khác sửa kho -> Tự bỏ bản cũ, nạp lại ở lần truy vấn kế tiếp.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._version = None
+        self._reset()
+
+    # ------------------------------------------------------------------
+    # Vòng đời chỉ mục
+    # ------------------------------------------------------------------
+    def ensure_built(self):
+        """Đảm bảo chỉ mục đã được nạp từ Database trước khi truy vấn."""
+        if not self._built:
+            self.rebuild()
+        return self
+
+    def rebuild(self):
+        """Xây dựng lại toàn bộ chỉ mục từ bảng Product (chỉ quét DB đúng 1 lần)."""
+        from app.models import Product
+
+        products = Product.query.filter_by(is_active=True).order_by(Product.id).all()
+        with self._lock:
+            self._reset()
+            for p in products:
+                self._add(IndexedProduct(p))
+            self._built = True
+
+    def invalidate(self):
+        """Đánh dấu chỉ mục đã cũ, lần truy vấn kế tiếp sẽ tự động nạp lại từ DB."""
+        with self._lock:
+            self._reset()
+            self._built = False
+
+    def sync_version(self, version):
+        """Phiên bản Kho hàng dùng chung khác bản chỉ mục đang giữ -> Bỏ chỉ mục cũ (nạp lại lười)."""
+        with self._lock:
+            if version == self._version:
+                return
+            if self._built:
+                self._reset()
+                self._built = False
+            self._version = version
+
+    def advance_version(self, previous, version):
+        """
+        Chính Worker này vừa tăng phiên bản (previous -> version) và đã tự cập nhật chỉ mục tăng dần:
+        chỉ mục vẫn đúng nếu nó đang khớp `previous`, không cần nạp lại toàn bộ.
+        """
+        with self._lock:
+            if self._version == previous:
+                self._version = version
+
+    def upsert(self, product):
+        """Cập nhật (hoặc gỡ bỏ nếu đã ẩn) một sản phẩm ngay sau khi Admin commit."""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(product.id)
+            if product.is_active:
+                self._add(IndexedProduct(product))
+
+    def remove(self, product_id):
+        """Gỡ một sản phẩm khỏi chỉ mục (Admin xóa vĩnh viễn)."""
+        with self._lock:
+            if self._built:
+                self._remove(product_id)
+
+    # ------------------------------------------------------------------
+    # Truy vấn
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return len(self._docs)
+
+    def get(self, product_id):
+        return self._docs.get(product_id)
+
+    def filter_candidates(self, brand=None, category=None, max_price=None, include_accessory_brand=False):
+        """
+        Lọc cứng (Hard Filters) tương đương bộ lọc SQL cũ của route Home:
+        - brand: khớp chuỗi con không phân biệt hoa thường (như `ilike %brand%`).
+        - include_accessory_brand: cho phép thêm các hãng 'Phụ kiện ...' khi tìm phụ kiện.
+        - category: khớp chính xác. max_price: so với giá niêm yết.
+        Trả về danh sách IndexedProduct theo thứ tự ID tăng dần.
+        """
+        self.ensure_built()
+        with self._lock:
+            candidate_ids = None
+
+            if brand:
+                brand_lower = normalize_search_text(brand)
+                matched = set()
+                for key, ids in self._brand_postings.items():
+                    if brand_lower in key or (include_accessory_brand and 'phụ kiện' in key):
+                        matched |= ids
+                candidate_ids = matched
+
+            if category:
+                cat_ids = self._category_postings.get(category, set())
+                candidate_ids = set(cat_ids) if candidate_ids is None else candidate_ids & cat_ids
+
+            if candidate_ids is None:
+                docs = list(self._docs.values())
+            else:
+                docs = [self._docs[i] for i in candidate_ids]
+
+        if max_price:
+            max_price = int(max_price)
+            docs = [d for d in docs if d.price <= max_price]
+
+        docs.sort(key=lambda d: d.id)
+        return docs
+
+    def match_model(self, model, brand=None, keywords=None):
+        """
+        Bộ so khớp CHÍNH XÁC dòng máy (Fingerprint Matching) cho Visual Search, thay cho SQL `ilike` + Regex từng dòng:
+        - Biến thể phải trùng khớp 2 chiều (XOR) -> Tra đúng 1 khóa `tập biến thể` trong Postings.
+        - Số thế hệ của tên máy AI đọc được phải nằm trong tên sản phẩm -> Giao các Postings theo số.
+        - Hãng (khớp chuỗi con) và từ khóa AI gợi ý (tất cả phải có trong tên) lọc trên vài ứng viên còn lại.
+        Chỉ xét Điện thoại đang bán. Trả về danh sách ID theo thứ tự tăng dần.
+        """
+        self.ensure_built()
+        target = model_fingerprint(model)
+        brand_lower = normalize_search_text(brand) if brand else None
+
+        terms = []
+        for kw in keywords or str(model).split():
+            kw_lower = normalize_search_text(kw)
+            if brand_lower and kw_lower == brand_lower: continue  # Bỏ qua chữ hãng vì đã lọc riêng
+            if len(kw_lower) == 1 and not kw_lower.isalnum(): continue
+            if kw_lower:
+                terms.append(kw_lower)
+        if not terms:
+            return []
+
+        with self._lock:
+            ids = self._model_modifier_postings.get(target.modifiers, set())
+            # Giao từ Postings nhỏ nhất trước để tập ứng viên co lại nhanh nhất
+            for number in sorted(target.numbers, key=lambda n: len(self._model_number_postings.get(n, ()))):
+                if not ids:
+                    break
+                ids = ids & self._model_number_postings.get(number, set())
+            docs = [self._docs[i] for i in ids]
+
+        return sorted(d.id for d in docs
+                      if (not brand_lower or brand_lower in d.brand_lower)
+                      and all(term in d.name_lower for term in terms))
+
+    def bm25_scores(self, query_text, candidate_ids=None):
+        """
+        Chấm điểm BM25 đa trường (BM25F rút gọn) cho câu truy vấn.
+        Chỉ duyệt các Postings của từ khóa có trong câu hỏi -> chi phí tỉ lệ với số sản phẩm
+        thực sự khớp, không tỉ lệ với (kích thước kho x số từ khóa) như vòng lặp cũ.
+        """
+        self.ensure_built()
+        query_terms = set(tokenize_vietnamese(query_text))
+        scores = {}
+
+        with self._lock:
+            total_docs = len(self._docs)
+            if not total_docs or not query_terms:
+                return scores
+
+            for field, weight in SEARCH_FIELD_WEIGHTS.items():
+                postings = self._postings[field]
+                doc_lengths = self._doc_lengths[field]
+                avg_len = (self._total_lengths[field] / total_docs) or 1.0
+
+                for term in query_terms:
+                    term_postings = postings.get(term)
+                    if not term_postings:
+                        continue
+                    df = len(term_postings)
+                    idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+                    for pid, tf in term_postings.items():
+                        if candidate_ids is not None and pid not in candidate_ids:
+                            continue
+                        norm = SEARCH_BM25_K1 * (1 - SEARCH_BM25_B + SEARCH_BM25_B * doc_lengths[pid] / avg_len)
+                        scores[pid] = scores.get(pid, 0.0) + weight * idf * tf * (SEARCH_BM25_K1 + 1) / (tf + norm)
+
+        return scores
+
+    def vocabulary_coverage(self, text):
+        """
+        Tỉ lệ âm tiết trong câu hỏi có xuất hiện trong kho hàng (Tên/Hãng/Mô tả).
+        Dùng làm tín hiệu độ tự tin cho bộ phân tích ý định nội bộ: câu hỏi toàn từ "lạ"
+        (VD: "máy cho người già") cần LLM diễn giải, câu gõ đúng tên máy thì không.
+        """
+        self.ensure_built()
+        syllables = _WORD_PATTERN.findall(normalize_search_text(text))
+        if not syllables:
+            return 0.0
+        with self._lock:
+            known = sum(1 for s in syllables
+                        if any(s in self._postings[field] for field in SEARCH_FIELD_WEIGHTS))
+        return known / len(syllables)
+
+    # ------------------------------------------------------------------
+    # Nội bộ
+    # ------------------------------------------------------------------
+    def _reset(self):
+        self._docs = {}
+        self._brand_postings = {}
+        self._category_postings = {}
+        self._model_modifier_postings = {}
+        self._model_number_postings = {}
+        self._postings = {field: {} for field in SEARCH_FIELD_WEIGHTS}
+        self._doc_lengths = {field: {} for field in SEARCH_FIELD_WEIGHTS}
+        self._total_lengths = {field: 0 for field in SEARCH_FIELD_WEIGHTS}
+
+    def _add(self, doc):
+        self._docs[doc.id] = doc
+        self._brand_postings.setdefault(doc.brand_lower, set()).add(doc.id)
+        self._category_postings.setdefault(doc.category, set()).add(doc.id)
+        if doc.fingerprint is not None:
+            self._model_modifier_postings.setdefault(doc.fingerprint.modifiers, set()).add(doc.id)
+            for number in doc.fingerprint.numbers:
+                self._model_number_postings.setdefault(number, set()).add(doc.id)
+
+        for field in SEARCH_FIELD_WEIGHTS:
+            tokens = doc.field_tokens[field]
+            self._doc_lengths[field][doc.id] = len(tokens)
+            self._total_lengths[field] += len(tokens)
+            postings = self._postings[field]
+            for term in tokens:
+                term_postings = postings.setdefault(term, {})
+                term_postings[doc.id] = term_postings.get(doc.id, 0) + 1
+
+    def _remove(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if not doc:
+            return
+        self._discard(self._brand_postings, doc.brand_lower, doc.id)
+        self._discard(self._category_postings, doc.category, doc.id)
+        if doc.fingerprint is not None:
+            self._discard(self._model_modifier_postings, doc.fingerprint.modifiers, doc.id)
+            for number in doc.fingerprint.numbers:
+                self._discard(self._model_number_postings, number, doc.id)
+
+        for field in SEARCH_FIELD_WEIGHTS:
+            self._total_lengths[field] -= self._doc_lengths[field].pop(doc.id, 0)
+            postings = self._postings[field]
+            for term in set(doc.field_tokens[field]):
+                term_postings = postings.get(term)
+                if term_postings is not None:
+                    term_postings.pop(doc.id, None)
+                    if not term_postings:
+                        del postings[term]
+
+    @staticmethod
+    def _discard(postings, key, product_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del postings[key]
+
+
+def reciprocal_rank_fusion(rankings, k=SEARCH_RRF_K):
+    """
+    Hợp nhất nhiều bảng xếp hạng bằng Reciprocal Rank Fusion (RRF).
+    `rankings` là list các cặp (danh sách ID đã xếp hạng, trọng số).
+    Không cần chuẩn hóa thang điểm giữa BM25 và Vector vì chỉ dùng thứ hạng.
+    """
+    fused = {}
+    for ranked_ids, weight in rankings:
+        for rank, pid in enumerate(ranked_ids, start=1):
+            fused[pid] = fused.get(pid, 0.0) + weight / (k + rank)
+    return fused
+
+
+def hybrid_rank(index, query_text, phrase=None, vector_ids=None, candidate_ids=None, top_k=SEARCH_TOP_K):
+    """
+    Động cơ xếp hạng lai (Hybrid Ranking): BM25 đa trường + Vector Semantic qua RRF.
+    - phrase: cụm từ khóa gốc, khớp liên tiếp trong Tên máy sẽ được nhân hệ số thưởng.
+    - vector_ids: danh sách ID (chuỗi hoặc số) do Vector DB trả về theo thứ tự giống nhất.
+    - candidate_ids: tập ID đã qua bộ lọc cứng (Hãng/Danh mục/Giá).
+    Trả về list (product_id, fused_score) dài tối đa top_k, lấy qua Heap thay vì sort toàn bộ.
+    """
+    lexical = index.bm25_scores(query_text, candidate_ids)
+
+    phrase = normalize_search_text(phrase)
+    if phrase:
+        for pid in lexical:
+            if phrase in index.get(pid).name_lower:
+                lexical[pid] *= SEARCH_PHRASE_BOOST
+
+    lexical_ranking = [pid for pid, _ in heapq.nlargest(
+        top_k, lexical.items(), key=lambda item: (item[1], -item[0]))]
+
+    vector_ranking = []
+    seen = set()
+    for vid in vector_ids or []:
+        if not str(vid).isdigit():
+            continue
+        pid = int(vid)
+        if pid in seen or (candidate_ids is not None and pid not in candidate_ids):
+            continue
+        seen.add(pid)
+        vector_ranking.append(pid)
+
+    fused = reciprocal_rank_fusion([
+        (lexical_ranking, SEARCH_RRF_WEIGHTS['lexical']),
+        (vector_ranking, SEARCH_RRF_WEIGHTS['vector'])
+    ])
+    return heapq.nlargest(top_k, fused.items(), key=lambda item: (item[1], -item[0]))
+
+
+class CatalogVersionTracker:
+    """
+    Phiên bản Kho hàng dùng chung giữa các tiến trình (bảng `catalog_version`, 1 dòng đếm).
+    `bump_catalog_version` tăng số đếm trong DB; mỗi Worker đọc lại tối đa mỗi `check_interval` giây,
+    nên chỉ mục / bộ đệm của Worker khác cũ đi không quá `check_interval` giây.
+    """
+
+    def __init__(self, check_interval=CATALOG_VERSION_CHECK_INTERVAL_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked_at = 0.0
+
+    def current(self):
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._value
+        try:
+            from app.models import CatalogVersion
+            value = db.session.execute(
+                select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar() or 0
+        except Exception as e:
+            print(f"⚠️ Catalog Version Read Error: {e}")
+            value = self._value or 0
+        with self._lock:
+            self._value, self._checked_at = value, time.monotonic()
+        return value
+
+    def bump(self):
+        """Tăng số đếm trong DB (nguyên tử). Trả về (phiên bản ngay trước lần tăng này, phiên bản mới)."""
+        from app.models import CatalogVersion
+
+        for _ in range(2):
+            try:
+                result = db.session.execute(update(CatalogVersion).where(CatalogVersion.id == 1)
+                                            .values(version=CatalogVersion.version + 1))
+                if result.rowcount == 0:
+                    # Lần tăng đầu tiên: chưa có dòng đếm
+                    db.session.add(CatalogVersion(id=1, version=1))
+                    db.session.flush()
+                # Đọc trong cùng Transaction -> Đúng giá trị do chính lần tăng này tạo ra
+                value = db.session.execute(
+                    select(CatalogVersion.version).where(CatalogVersion.id == 1)).scalar()
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Worker khác vừa tạo dòng đếm cùng lúc -> Thử lại bằng UPDATE
+                db.session.rollback()
+        else:
+            raise RuntimeError("Không tăng được Phiên bản Kho hàng")
+
+        with self._lock:
+            self._value, self._checked_at = value, time.monotonic()
+        return value - 1, value
+
+
+def get_catalog_version_tracker():
+    app = current_app._get_current_object()
+    tracker = app.extensions.get('catalog_version')
+    if tracker is None:
+        interval = app.config.get('CATALOG_VERSION_CHECK_INTERVAL', CATALOG_VERSION_CHECK_INTERVAL_SECONDS)
+        tracker = app.extensions.setdefault('catalog_version', CatalogVersionTracker(interval))
+    return tracker
+
+
+def _app_catalog_index(app):
+    index = app.extensions.get('catalog_index')
+    if index is None:
+        index = app.extensions.setdefault('catalog_index', CatalogIndex())
+    return index
+
+
+def get_catalog_index():
+    """
+    Lấy chỉ mục kho hàng gắn với Flask App hiện tại.
+    Mỗi App (kể cả App ảo trong Unit Test) sở hữu 1 chỉ mục riêng trong `app.extensions`,
+    được đối chiếu với Phiên bản Kho hàng dùng chung trước khi trả về.
+    """
+    index = _app_catalog_index(current_app._get_current_object())
+    index.sync_version(get_catalog_version_tracker().current())
+    return index
+
+
+class SearchResultCache:
+    """
+    Bộ đệm kết quả tìm kiếm cuối cùng (danh sách ID đã xếp hạng + thông điệp AI).
+    Khóa = (q đã chuẩn hóa, hãng, kiểu sắp xếp). Mỗi bản ghi được gắn Phiên bản Kho hàng dùng chung
+    (Catalog Version) tại thời điểm tính; khi Admin sửa kho hoặc tồn kho thay đổi ở BẤT KỲ Worker nào,
+    phiên bản tăng lên và toàn bộ bản ghi cũ bị xóa khỏi bộ đệm (xem `sync_version`).
+    """
+
+    def __init__(self, maxsize=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL_SECONDS):
+        self._cache = TTLLRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.version = 0
+
+    @staticmethod
+    def make_key(q, brand='', sort=''):
+        return (normalize_search_text(q), normalize_search_text(brand), sort or '')
+
+    def get(self, q, brand='', sort=''):
+        """Trả về dict {'ids', 'ai_msg', 'intent_tier'} nếu còn hiệu lực, ngược lại trả về None."""
+        key = self.make_key(q, brand, sort)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry['version'] != self.version:
+            return None
+        return entry
+
+    def set(self, q, brand, sort, product_ids, ai_msg, version=None, intent_tier=None):
+        """
+        Lưu kết quả; `version` là phiên bản kho lúc bắt đầu tính (tránh ghi đè kết quả cũ).
+        `intent_tier` ghi lại tầng phân tích ý định đã dùng (Local / LLM) cho bản ghi này.
+        """
+        version = self.version if version is None else version
+        if version != self.version:
+            return
+        self._cache.set(self.make_key(q, brand, sort), {
+            'version': version,
+            'ids': list(product_ids),
+            'ai_msg': ai_msg,
+            'intent_tier': intent_tier
+        })
+
+    def sync_version(self, version):
+        """Đối chiếu với Phiên bản Kho hàng dùng chung: khác -> Bỏ toàn bộ kết quả tính theo kho cũ."""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._cache.clear()
+        return self.version
+
+    def bump_version(self, version=None):
+        with self._lock:
+            self.version = self.version + 1 if version is None else version
+            self._cache.clear()
+            return self.version
+
+    def stats(self):
+        data = self._cache.stats()
+        data['catalog_version'] = self.version
+        return data
+
+
+def _app_search_result_cache(app):
+    cache = app.extensions.get('search_result_cache')
+    if cache is None:
+        cache = app.extensions.setdefault('search_result_cache', SearchResultCache())
+    return cache
+
+
+def get_search_result_cache():
+    """
+    Lấy bộ đệm kết quả tìm kiếm gắn với Flask App hiện tại (tương tự Catalog Index),
+    đã đối chiếu với Phiên bản Kho hàng dùng chung giữa các Worker.
+    """
+    cache = _app_search_result_cache(current_app._get_current_object())
+    cache.sync_version(get_catalog_version_tracker().current())
+    return cache
+
+
+def bump_catalog_version():
+    """
+    Tăng Phiên bản Kho hàng dùng chung -> vô hiệu hóa toàn bộ kết quả tìm kiếm đã cache,
+    và báo cho các Worker khác nạp lại chỉ mục ở lượt đọc số đếm kế tiếp.
+    Gọi sau mọi thao tác ghi lên Sản phẩm (Thêm/Sửa/Xóa) và khi Tồn kho thay đổi (sau khi đã COMMIT).
+    """
+    app = current_app._get_current_object()
+    version = None
+    try:
+        previous, version = get_catalog_version_tracker().bump()
+        _app_catalog_index(app).advance_version(previous, version)
+    except Exception as e:
+        print(f"⚠️ Catalog Version Bump Error: {e}")
+    try:
+        # Không tăng được số đếm dùng chung -> Ít nhất vẫn xóa kết quả cũ của Worker này
+        return _app_search_result_cache(app).bump_version(version)
+    except Exception as e:
+        print(f"⚠️ Search Cache Invalidate Error: {e}")
+
+
+def sync_product_to_search_index(product):
+    """Trigger đồng bộ chỉ mục tìm kiếm sau khi Admin Thêm/Sửa sản phẩm."""
+    try:
+        get_catalog_index().upsert(product)
+    except Exception as e:
+        print(f"⚠️ Search Index Sync Error: {e}")
+    bump_catalog_version()
+
+
+def remove_product_from_search_index(product_id):
+    """Trigger gỡ sản phẩm khỏi chỉ mục tìm kiếm sau khi Admin xóa sản phẩm."""
+    try:
+        get_catalog_index().remove(product_id)
+    except Exception as e:
+        print(f"⚠️ Search Index Remove Error: {e}")
+    bump_catalog_version()
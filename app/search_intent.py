@@ -0,0 +1,163 @@
+"""
+Module Phân tích Ý định Tìm kiếm theo tầng (Tiered Search Intent) của MobileStore.
+Tầng 1 (Local): Regex + Heuristics trả lời ngay trong vài micro-giây.
+Tầng 2 (LLM): Gemini chỉ chạy ngầm (Background Thread) cho câu hỏi mà Tầng 1 không tự tin,
+kết quả được ghi vào Cache để lượt tìm kiếm kế tiếp của cùng câu hỏi dùng ngay.
+"""
+
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+from app.caching import TTLLRUCache
+from app.search_engine import get_catalog_index, normalize_search_text
+from app.gemini_client import is_gemini_available
+from app.constants import (
+    SEARCH_INTENT_MODES,
+    SEARCH_INTENT_MODE_DEFAULT,
+    SEARCH_INTENT_CONFIDENCE_THRESHOLD,
+    SEARCH_INTENT_WORKERS,
+    SEARCH_INTENT_CACHE_MAX_ENTRIES,
+    SEARCH_INTENT_CACHE_TTL_SECONDS
+)
+
+# Tầng trả lời của một kết quả phân tích ý định
+INTENT_TIER_LLM = 'llm'
+INTENT_TIER_LOCAL = 'local'
+INTENT_TIER_LOCAL_PENDING = 'local_pending'  # Đang chờ Gemini làm giàu ngầm
+
+
+def is_meaningful_intent(ai_data):
+    """Kết quả AI chỉ được dùng khi bóc tách được ít nhất 1 thông tin hữu ích."""
+    return bool(ai_data) and isinstance(ai_data, dict) and bool(
+        ai_data.get('keyword') or ai_data.get('brand') or ai_data.get('category') or ai_data.get('semantic_query'))
+
+
+def estimate_local_confidence(local_data):
+    """
+    Chấm độ tự tin (0 -> 1) cho kết quả của `local_analyze_intent`.
+    - Từ khóa còn lại sau lọc Stop words càng "quen" với kho hàng thì càng tự tin.
+    - Bóc được Hãng / Giá là tín hiệu có cấu trúc -> cộng thêm điểm.
+    """
+    keyword = (local_data or {}).get('keyword') or ''
+    has_structure = bool(local_data.get('brand') or local_data.get('max_price') or local_data.get('category'))
+
+    if not keyword.strip():
+        return 1.0 if has_structure else 0.0
+
+    confidence = get_catalog_index().vocabulary_coverage(keyword)
+    if has_structure:
+        confidence += 0.2
+    return min(confidence, 1.0)
+
+
+class SearchIntentResolver:
+    """
+    Bộ điều phối phân tích ý định gắn với 1 Flask App.
+    Giữ Cache kết quả LLM, hàng đợi Thread Pool và danh sách câu hỏi đang được làm giàu
+    (In-flight) để mỗi câu hỏi chỉ gửi Gemini đúng 1 lần dù nhiều khách cùng gõ.
+    """
+
+    def __init__(self, app, max_workers=SEARCH_INTENT_WORKERS):
+        self.app = app
+        self._cache = TTLLRUCache(maxsize=SEARCH_INTENT_CACHE_MAX_ENTRIES, ttl=SEARCH_INTENT_CACHE_TTL_SECONDS)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search-intent')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.enriched = 0
+        self.failures = 0
+
+    @property
+    def mode(self):
+        mode = self.app.config.get('SEARCH_INTENT_MODE') or SEARCH_INTENT_MODE_DEFAULT
+        return mode if mode in SEARCH_INTENT_MODES else SEARCH_INTENT_MODE_DEFAULT
+
+    def resolve(self, query, llm_analyzer, local_analyzer):
+        """
+        Trả về (ai_data, tier). `llm_analyzer` / `local_analyzer` được truyền vào từ Route
+        để giữ nguyên điểm Mock của Unit Test (`app.routes.main.analyze_search_intents`).
+        """
+        mode = self.mode
+
+        if mode == 'llm_first':
+            ai_data = llm_analyzer(query)
+            if is_meaningful_intent(ai_data):
+                return ai_data, INTENT_TIER_LLM
+            return local_analyzer(query), INTENT_TIER_LOCAL
+
+        key = normalize_search_text(query)
+        enriched = self._cache.get(key)
+        if enriched is not None:
+            return copy.deepcopy(enriched), INTENT_TIER_LLM
+
+        local_data = local_analyzer(query)
+        if mode == 'local_only':
+            return local_data, INTENT_TIER_LOCAL
+
+        # Câu hỏi đủ rõ, hoặc Cầu dao Gemini đang ngắt -> Không xếp hàng làm giàu ngầm
+        if estimate_local_confidence(local_data) >= SEARCH_INTENT_CONFIDENCE_THRESHOLD \
+                or not is_gemini_available():
+            return local_data, INTENT_TIER_LOCAL
+
+        self._schedule(key, query, llm_analyzer)
+        return local_data, INTENT_TIER_LOCAL_PENDING
+
+    def has_enriched(self, query):
+        """Kiểm tra (không tính vào Hit/Miss) câu hỏi đã có kết quả Gemini trong Cache chưa."""
+        return self._cache.peek(normalize_search_text(query)) is not None
+
+    def wait_pending(self, timeout=None):
+        """Chờ toàn bộ tác vụ làm giàu đang chạy kết thúc (dùng cho Unit Test / Shutdown)."""
+        with self._lock:
+            futures = list(self._inflight.values())
+        for future in futures:
+            future.result(timeout=timeout)
+
+    def stats(self):
+        data = self._cache.stats()
+        with self._lock:
+            data.update({
+                'mode': self.mode,
+                'pending': len(self._inflight),
+                'enriched': self.enriched,
+                'failures': self.failures
+            })
+        return data
+
+    # ------------------------------------------------------------------
+    # Nội bộ
+    # ------------------------------------------------------------------
+    def _schedule(self, key, query, llm_analyzer):
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._inflight[key] = self._executor.submit(self._enrich, key, query, llm_analyzer)
+
+    def _enrich(self, key, query, llm_analyzer):
+        try:
+            with self.app.app_context():
+                ai_data = llm_analyzer(query)
+            if is_meaningful_intent(ai_data):
+                self._cache.set(key, ai_data)
+                with self._lock:
+                    self.enriched += 1
+            else:
+                with self._lock:
+                    self.failures += 1
+        except Exception as e:
+            print(f"⚠️ Background Intent Enrichment Error: {e}")
+            with self._lock:
+                self.failures += 1
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def get_search_intent_resolver():
+    """Lấy bộ phân tích ý định gắn với Flask App hiện tại (Lazy Init trong `app.extensions`)."""
+    app = current_app._get_current_object()
+    resolver = app.extensions.get('search_intent_resolver')
+    if resolver is None:
+        resolver = app.extensions.setdefault('search_intent_resolver', SearchIntentResolver(app))
+    return resolver
@@ -0,0 +1,178 @@
+"""
+Module Bộ đệm Ngữ nghĩa (Semantic Cache) của MobileStore.
+Khách hỏi cùng 1 ý bằng nhiều cách ("iphone 15 giá bao nhiêu", "giá ip15") -> Mã băm MD5 luôn Miss.
+Bộ đệm này nhúng câu hỏi đã chuẩn hóa bằng MiniLM, tìm câu hỏi gần nhất (Cosine) trong chỉ mục
+Vector nhỏ trên RAM và trả lại câu trả lời cũ nếu ngữ cảnh kho hàng không đổi.
+"""
+
+import re
+import time
+import threading
+import numpy as np
+from flask import current_app, has_app_context
+
+from app.search_engine import normalize_search_text, model_fingerprint
+from app.text_embedding import embed_query_text
+from app.constants import (
+    BRAND_MAPPING,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    AI_CACHE_TTL_SECONDS,
+    AI_CACHE_DEFAULT_TTL_SECONDS
+)
+
+_DIGIT_PATTERN = re.compile(r'\d+')
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+_LETTER_RUN_PATTERN = re.compile(r'[^\W\d_]+')
+
+
+def normalize_prompt(prompt):
+    """Chuẩn hóa câu hỏi trước khi nhúng: chữ thường, bỏ dấu câu/emoji, gộp khoảng trắng."""
+    return " ".join(_PUNCTUATION_PATTERN.sub(' ', normalize_search_text(prompt)).split())
+
+
+def numeric_signature(text):
+    """
+    Tập các con số trong câu hỏi ("iphone 15" -> {'15'}).
+    MiniLM coi "iphone 14" và "iphone 15" gần như trùng nhau, nên 2 câu chỉ được coi là 1
+    khi khớp cả Vector lẫn các con số (đời máy, dung lượng, mức giá).
+    """
+    return frozenset(_DIGIT_PATTERN.findall(text))
+
+
+def brand_signature(text):
+    """
+    Tập hãng được nhắc tới trong câu hỏi, quy về tên chuẩn qua BRAND_MAPPING ("galaxy" -> Samsung, "pixel" -> Google).
+    MiniLM coi "realme 12 pro" ~ "redmi 12 pro": cùng con số, cùng biến thể, chỉ khác hãng.
+    """
+    return frozenset(BRAND_MAPPING[word] for word in _LETTER_RUN_PATTERN.findall(text) if word in BRAND_MAPPING)
+
+
+def prompt_signature(prompt):
+    """
+    Chữ ký bắt buộc trùng khớp tuyệt đối để dùng lại câu trả lời: (các con số, các biến thể đời máy, các hãng).
+    Ngoài con số, MiniLM cũng coi "iphone 15" ~ "iphone 15 pro max" và "galaxy s24" ~ "galaxy s24 ultra",
+    nên tập biến thể (pro/max/ultra/plus/chữ cái đời máy...) lấy từ `model_fingerprint` của Bộ máy tìm kiếm.
+    Tính trên câu gốc (chưa bỏ dấu câu) để giữ được "s24+" -> plus.
+    """
+    text = normalize_search_text(prompt)
+    return numeric_signature(text), model_fingerprint(text).modifiers, brand_signature(text)
+
+
+class SemanticCache:
+    """
+    Chỉ mục Vector phẳng (Flat Index) kích thước cố định trên RAM.
+    Vector được chuẩn hóa L2 sẵn nên Cosine = 1 phép nhân ma trận (NumPy), đủ nhanh với vài nghìn câu.
+    Khi đầy, câu hỏi cũ nhất bị ghi đè (vòng tròn - Ring Buffer).
+    """
+
+    def __init__(self, name, embedder, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=None):
+        self.name = name
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else AI_CACHE_TTL_SECONDS.get(name, AI_CACHE_DEFAULT_TTL_SECONDS)
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._meta = [None] * max_entries
+        self._size = 0
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _embed(self, text):
+        try:
+            vector = np.asarray(embed_query_text(self.embedder, text), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Semantic Cache Embedding Error: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        # Vector rỗng (Embedding lỗi trả về toàn 0) thì không dùng được cho Cosine
+        return vector / norm if norm > 0 else None
+
+    def lookup(self, prompt, fingerprint):
+        """
+        Trả về (value, vector). `value` là câu trả lời đã cache nếu có câu hỏi đủ giống
+        (Cosine >= ngưỡng, cùng con số + biến thể đời máy, cùng dấu vân tay ngữ cảnh, chưa hết hạn), ngược lại None.
+        `vector` được trả ra để `store()` dùng lại, không phải nhúng câu hỏi 2 lần.
+        """
+        text = normalize_prompt(prompt)
+        vector = self._embed(text)
+        if vector is None:
+            return None, None
+
+        signature = prompt_signature(prompt)
+        now = time.monotonic()
+        with self._lock:
+            if self._size:
+                sims = self._matrix[:self._size] @ vector
+                for idx in np.argsort(-sims):
+                    if sims[idx] < self.threshold:
+                        break
+                    entry_fingerprint, entry_signature, value, expires_at = self._meta[idx]
+                    if entry_fingerprint == fingerprint and entry_signature == signature and expires_at > now:
+                        self.hits += 1
+                        return value, vector
+            self.misses += 1
+        return None, vector
+
+    def store(self, prompt, fingerprint, value, vector=None):
+        text = normalize_prompt(prompt)
+        if vector is None:
+            vector = self._embed(text)
+        if vector is None:
+            return
+
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._matrix[slot] = vector
+            self._meta[slot] = (fingerprint, prompt_signature(prompt), value, time.monotonic() + self.ttl)
+            self._next = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self._size,
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'stores': self.stores
+            }
+
+
+def get_semantic_cache(name, embedder_factory):
+    """
+    Lấy bộ đệm ngữ nghĩa `name` của Flask App hiện tại.
+    Trả về None (bỏ qua Cache) khi không có App Context, Model Embedding không khả dụng,
+    hoặc bị tắt qua `SEMANTIC_CACHE_ENABLED` (mặc định tắt khi chạy Test để các Mock Gemini độc lập nhau).
+    Ngưỡng Cosine chỉnh được qua `SEMANTIC_CACHE_THRESHOLD` trong cấu hình App.
+    """
+    if not has_app_context():
+        return None
+    app = current_app._get_current_object()
+    if not app.config.get('SEMANTIC_CACHE_ENABLED', not app.testing):
+        return None
+    caches = app.extensions.setdefault('semantic_caches', {})
+    cache = caches.get(name)
+    if cache is None:
+        embedder = embedder_factory()
+        if embedder is None:
+            return None
+        threshold = app.config.get('SEMANTIC_CACHE_THRESHOLD', SEMANTIC_CACHE_THRESHOLD)
+        cache = caches.setdefault(name, SemanticCache(name, embedder, threshold=threshold))
+    return cache
+
+
+def get_semantic_cache_stats():
+    """Thống kê mọi bộ đệm ngữ nghĩa của App hiện tại (phục vụ API giám sát của Admin)."""
+    caches = current_app.extensions.get('semantic_caches', {})
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,251 @@
+"""
+Module Đo thời gian khởi động (Startup Profiler) của MobileStore.
+Bật bằng biến môi trường `STARTUP_PROFILE` ("1" -> ghi báo cáo ra instance/startup_profile.json,
+hoặc truyền thẳng đường dẫn file báo cáo). Khi bật, hệ thống ghi lại:
+- Thời gian + bộ nhớ (RSS) của từng giai đoạn trong `create_app()` (đọc .env, Extensions, OAuth, Blueprints...).
+- Thời gian import của từng Module (tương tự `python -X importtime`), gom nhóm theo phân hệ
+  (flask, sqlalchemy, google, app.routes...) để theo dõi Cold-start qua từng phiên bản.
+Module này chỉ dùng thư viện chuẩn để bản thân nó không làm chậm quá trình khởi động.
+"""
+
+import os
+import sys
+import json
+import time
+import builtins
+import threading
+import platform
+import importlib.util
+import tracemalloc
+from datetime import datetime, timezone
+
+STARTUP_PROFILE_ENV = 'STARTUP_PROFILE'
+# Đo thêm bộ nhớ cấp phát bởi Python (tracemalloc) - chính xác hơn RSS nhưng làm chậm khởi động ~5 lần
+STARTUP_PROFILE_TRACEMALLOC_ENV = 'STARTUP_PROFILE_TRACEMALLOC'
+DEFAULT_REPORT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'instance', 'startup_profile.json')
+SLOWEST_MODULES_LIMIT = 40
+
+
+def _current_rss_kb():
+    """Bộ nhớ thường trú (RSS) của tiến trình, None nếu hệ điều hành không hỗ trợ đọc."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+def module_subsystem(module_name):
+    """Phân hệ của 1 Module: gói gốc (flask, sqlalchemy...), riêng code nội bộ tách tới cấp 2 (app.routes)."""
+    parts = module_name.split('.')
+    if parts[0] == 'app' and len(parts) > 1:
+        return '.'.join(parts[:2])
+    return parts[0]
+
+
+class ImportTimer:
+    """
+    Bọc `builtins.__import__` để đo thời gian nạp các Module MỚI (chưa có trong sys.modules).
+    Thời gian "tự thân" (self) = tổng thời gian trừ đi thời gian của các import lồng bên trong.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._local = threading.local()  # Ngăn xếp import riêng cho từng luồng
+        self._original_import = None
+
+    def install(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _resolve(self, name, globals_, level):
+        if level == 0:
+            return name
+        try:
+            package = (globals_ or {}).get('__package__') or ''
+            return importlib.util.resolve_name('.' * level + name, package)
+        except Exception:
+            return name
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        module_name = self._resolve(name, globals, level)
+        if module_name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if module_name in sys.modules and module_name not in self.records:
+                self.records[module_name] = (max(0.0, elapsed - children), elapsed)
+
+    def summary(self):
+        by_subsystem = {}
+        for module_name, (self_time, _) in self.records.items():
+            group = by_subsystem.setdefault(module_subsystem(module_name), {'seconds': 0.0, 'modules': 0})
+            group['seconds'] += self_time
+            group['modules'] += 1
+
+        slowest = sorted(self.records.items(), key=lambda item: item[1][1], reverse=True)[:SLOWEST_MODULES_LIMIT]
+        return {
+            'module_count': len(self.records),
+            'total_self_seconds': round(sum(r[0] for r in self.records.values()), 4),
+            'by_subsystem': [
+                {'subsystem': name, 'seconds': round(data['seconds'], 4), 'modules': data['modules']}
+                for name, data in sorted(by_subsystem.items(), key=lambda item: item[1]['seconds'], reverse=True)
+            ],
+            'slowest_modules': [
+                {'module': name, 'self_seconds': round(s, 4), 'cumulative_seconds': round(c, 4)}
+                for name, (s, c) in slowest
+            ],
+            # Chi phí import của từng Module nội bộ (VD: app.utils kéo theo bao nhiêu giây)
+            'app_modules': {
+                name: round(c, 4) for name, (_, c) in sorted(self.records.items())
+                if name == 'app' or name.startswith('app.')
+            }
+        }
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.rss_before = _current_rss_kb()
+        if self.profiler.trace_allocations:
+            self.mem_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        rss_after = _current_rss_kb()
+        record = {
+            'name': self.name,
+            'seconds': round(elapsed, 4),
+            'rss_kb': rss_after,
+            'rss_delta_kb': rss_after - self.rss_before if None not in (rss_after, self.rss_before) else None
+        }
+        if self.profiler.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            record['alloc_delta_kb'] = round((current - self.mem_before) / 1024, 1)
+            record['alloc_peak_kb'] = round((peak - self.mem_before) / 1024, 1)
+        self.profiler.phases.append(record)
+        return False
+
+
+class StartupProfiler:
+    """
+    Bộ đo khởi động. Khi tắt, `phase()` trả về Context Manager rỗng nên gần như không tốn chi phí.
+    Các giai đoạn không lồng nhau (mỗi giai đoạn đo đỉnh bộ nhớ riêng).
+    """
+
+    def __init__(self, report_path=None, trace_allocations=False):
+        self.enabled = report_path is not None
+        self.report_path = report_path
+        self.trace_allocations = self.enabled and trace_allocations
+        self.phases = []
+        self.imports = ImportTimer()
+        self.started = time.perf_counter()
+        self.finished = False
+        if self.enabled:
+            if self.trace_allocations and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.imports.install()
+
+    def phase(self, name):
+        if not self.enabled or self.finished:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def build_report(self):
+        return {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'argv': sys.argv[:3],
+            'total_seconds': round(time.perf_counter() - self.started, 4),
+            'trace_allocations': self.trace_allocations,
+            'rss_kb': _current_rss_kb(),
+            'phases': self.phases,
+            'imports': self.imports.summary()
+        }
+
+    def finish(self):
+        """Kết thúc đo (chỉ lần `create_app()` đầu tiên), gỡ Hook import và ghi báo cáo JSON."""
+        if not self.enabled or self.finished:
+            return None
+        self.finished = True
+        self.imports.uninstall()
+        report = self.build_report()
+        if self.trace_allocations:
+            tracemalloc.stop()
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.report_path)), exist_ok=True)
+            with open(self.report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"⚠️ Không thể ghi báo cáo khởi động: {e}")
+
+        print(f"⏱️ Startup Profile: {report['total_seconds']}s -> {self.report_path}")
+        for phase in self.phases:
+            print(f"   - {phase['name']:<28} {phase['seconds']:>8.3f}s  RSS +{phase['rss_delta_kb'] or 0} KB")
+        for group in report['imports']['by_subsystem'][:8]:
+            print(f"   * import {group['subsystem']:<21} {group['seconds']:>8.3f}s  ({group['modules']} modules)")
+        return report
+
+
+def _report_path_from_env():
+    value = os.environ.get(STARTUP_PROFILE_ENV, '').strip()
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return DEFAULT_REPORT_PATH
+    return value
+
+
+_profiler = None
+
+
+def get_startup_profiler():
+    """Bộ đo dùng chung của tiến trình, được tạo ở lần import `app` đầu tiên theo biến môi trường."""
+    global _profiler
+    if _profiler is None:
+        trace_allocations = os.environ.get(STARTUP_PROFILE_TRACEMALLOC_ENV, '').lower() in ('1', 'true', 'yes')
+        _profiler = StartupProfiler(_report_path_from_env(), trace_allocations=trace_allocations)
+    return _profiler
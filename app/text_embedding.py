@@ -0,0 +1,200 @@
+"""
+Module Dịch vụ nhúng văn bản dùng chung (Shared Text Embedding Service) của MobileStore.
+Model MiniLM (~400MB) chỉ được nạp 1 lần cho toàn tiến trình và được dùng chung bởi:
+Vector DB sản phẩm (ChromaDB), `AIVectorManager` và Semantic Cache.
+- Cache LRU cho câu truy vấn: khách tìm lại cùng 1 câu -> Hit trong RAM, không chạy Model.
+- Gom lô vi mô (Micro-batching): các truy vấn đến cùng lúc từ nhiều luồng được nhúng chung 1 lượt Forward.
+  Chỉ áp dụng cho `embed_query` (gọi tường minh, xem `embed_query_text`); Collection gọi `__call__`
+  để nhúng văn bản sản phẩm -> Luôn đi `embed_documents`, không làm bẩn Cache, không phải chờ gom lô.
+- Backend tùy chọn qua biến môi trường TEXT_EMBEDDING_BACKEND: torch (mặc định) | int8 | onnx.
+"""
+
+import os
+import threading
+import numpy as np
+
+from app.caching import TTLLRUCache
+from app.constants import (
+    TEXT_EMBEDDING_CACHE_SIZE,
+    TEXT_EMBEDDING_MICRO_BATCH_MAX,
+    TEXT_EMBEDDING_MICRO_BATCH_WAIT_MS,
+    TEXT_EMBEDDING_DOCUMENT_BATCH_SIZE
+)
+
+TEXT_EMBEDDING_BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def text_embedding_backend_name():
+    backend = os.environ.get('TEXT_EMBEDDING_BACKEND', 'torch').strip().lower()
+    return backend if backend in TEXT_EMBEDDING_BACKENDS else 'torch'
+
+
+def load_sentence_transformer(model_name, backend):
+    """
+    Nạp SentenceTransformer theo Backend. Trả về (model, backend_thực_tế).
+    Backend tối ưu không dùng được (thiếu optimum / onnxruntime...) -> Quay về PyTorch fp32.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'onnx':
+        try:
+            return SentenceTransformer(model_name, backend='onnx'), 'onnx'
+        except Exception as e:
+            print(f"⚠️ Không dùng được Text Embedding Backend 'onnx' ({e}). Quay về PyTorch fp32.")
+    elif backend == 'int8':
+        try:
+            import torch
+            model = SentenceTransformer(model_name, device='cpu')
+            # Lượng tử hóa động các lớp Linear của Transformer (chỉ CPU)
+            model[0].auto_model = torch.quantization.quantize_dynamic(
+                model[0].auto_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            return model, 'int8'
+        except Exception as e:
+            print(f"⚠️ Không dùng được Text Embedding Backend 'int8' ({e}). Quay về PyTorch fp32.")
+    return SentenceTransformer(model_name), 'torch'
+
+
+def embed_query_text(embedder, text):
+    """
+    Nhúng 1 câu truy vấn: đi qua Cache LRU + Micro-batching nếu `embedder` là TextEmbeddingService,
+    còn hàm nhúng thường (EmbeddingFunction bất kỳ, Mock khi Test) thì gọi thẳng với lô 1 phần tử.
+    """
+    embed_query = getattr(embedder, 'embed_query', None)
+    if embed_query is not None:
+        return embed_query(text)
+    return embedder([text])[0]
+
+
+class _PendingQuery:
+    __slots__ = ('text', 'event', 'vector', 'error')
+
+    def __init__(self, text):
+        self.text = text
+        self.event = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+class TextEmbeddingService:
+    """
+    Dịch vụ nhúng văn bản, tương thích giao diện EmbeddingFunction của ChromaDB (`__call__(self, input)`).
+    `encode_fn(list[str]) -> list[vector]` là hàm nhúng thô của Model (tiêm vào được để Unit Test).
+    """
+
+    def __init__(self, encode_fn, backend='torch', dim=384, cache_size=TEXT_EMBEDDING_CACHE_SIZE,
+                 max_batch=TEXT_EMBEDDING_MICRO_BATCH_MAX, max_wait_ms=TEXT_EMBEDDING_MICRO_BATCH_WAIT_MS,
+                 document_batch_size=TEXT_EMBEDDING_DOCUMENT_BATCH_SIZE):
+        self._encode_fn = encode_fn
+        self.backend = backend
+        self.dim = dim
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.document_batch_size = document_batch_size
+        # TTL = 0 -> Không hết hạn (Vector của 1 câu không đổi khi Model không đổi)
+        self.query_cache = TTLLRUCache(maxsize=cache_size, ttl=0)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._leader_active = False
+        self.forward_passes = 0
+        self.batched_queries = 0
+        self.documents_embedded = 0
+
+    @classmethod
+    def from_model_name(cls, model_name, dim=384, backend=None):
+        model, actual_backend = load_sentence_transformer(model_name, backend or text_embedding_backend_name())
+        print(f"🚀 Text Embedding Service ({model_name}) initialized: backend={actual_backend}")
+
+        def encode(texts):
+            # Giữ nguyên cấu hình của ChromaDB (không chuẩn hóa) để Vector cũ trong Collection vẫn dùng được
+            return model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=False).tolist()
+
+        return cls(encode, backend=actual_backend, dim=dim)
+
+    def _encode(self, texts):
+        self.forward_passes += 1
+        return self._encode_fn(texts)
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        try:
+            # Giao diện EmbeddingFunction của Collection (Upsert văn bản sản phẩm) -> Luôn là nhúng văn bản,
+            # kể cả lô 1 phần tử. Truy vấn của khách phải gọi `embed_query` tường minh.
+            return self.embed_documents(input)
+        except Exception as e:
+            print(f"❌ Local Embedding Error: {e}")
+            return [[0.0] * self.dim] * len(input)
+
+    def embed_query(self, text):
+        """Nhúng 1 câu truy vấn: Hit Cache LRU trả về ngay, Miss thì gom lô với các truy vấn đồng thời."""
+        cached = self.query_cache.get(text)
+        if cached is not None:
+            return cached
+
+        request = _PendingQuery(text)
+        with self._cond:
+            self._pending.append(request)
+            is_leader = not self._leader_active
+            if is_leader:
+                self._leader_active = True
+            else:
+                self._cond.notify_all()
+
+        if is_leader:
+            self._lead_batch()
+        else:
+            request.event.wait()
+
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def _lead_batch(self):
+        """Luồng đầu tiên (Leader) chờ tối đa `max_wait` để gom thêm truy vấn, rồi nhúng cả lô 1 lượt."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._pending) >= self.max_batch, timeout=self.max_wait)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            # Còn dư truy vấn (lô đầy) -> Luồng kế tiếp trong hàng chờ tự làm Leader mới
+            self._leader_active = False
+            leftover = self._pending[0] if self._pending else None
+            if leftover is not None:
+                self._leader_active = True
+
+        try:
+            # Các câu trùng nhau trong cùng 1 lô chỉ nhúng 1 lần
+            unique_texts = list(dict.fromkeys(r.text for r in batch))
+            vectors = dict(zip(unique_texts, self._encode(unique_texts)))
+            self.batched_queries += len(batch)
+            for text, vector in vectors.items():
+                self.query_cache.set(text, vector)
+            for r in batch:
+                r.vector = vectors[r.text]
+        except Exception as e:
+            for r in batch:
+                r.error = e
+        finally:
+            for r in batch:
+                r.event.set()
+
+        if leftover is not None:
+            threading.Thread(target=self._lead_batch, name='text-embed-batch', daemon=True).start()
+
+    def embed_documents(self, texts):
+        """Nhúng nhiều văn bản (đồng bộ Vector DB) theo từng lô `document_batch_size`, không đi qua Cache truy vấn."""
+        texts = list(texts)
+        vectors = []
+        for i in range(0, len(texts), self.document_batch_size):
+            vectors.extend(self._encode(texts[i:i + self.document_batch_size]))
+        self.documents_embedded += len(texts)
+        return [np.asarray(v, dtype=np.float32).tolist() for v in vectors]
+
+    def stats(self):
+        cache = self.query_cache.stats()
+        return {
+            'backend': self.backend,
+            'query_cache': cache,
+            'forward_passes': self.forward_passes,
+            'batched_queries': self.batched_queries,
+            'avg_query_batch': round(self.batched_queries / max(1, self.forward_passes), 2),
+            'documents_embedded': self.documents_embedded
+        }
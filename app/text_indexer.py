@@ -0,0 +1,152 @@
+"""
+Module Đồng bộ hàng loạt Vector Văn bản sản phẩm (Bulk Text Indexer) của MobileStore.
+Thay cho việc gọi `sync_product_to_vector_db` lần lượt từng sản phẩm
+(1 lượt nhúng MiniLM + 1 lệnh ghi ChromaDB cho mỗi sản phẩm), pipeline này:
+1. Dựng văn bản ngữ nghĩa cho cả lô sản phẩm.
+2. Nhúng cả lô qua Dịch vụ nhúng dùng chung (tự chia lượt Forward theo TEXT_EMBEDDING_DOCUMENT_BATCH_SIZE).
+3. Upsert cả lô (kèm Vector đã tính sẵn) vào `product_collection` bằng 1 lệnh duy nhất.
+
+Chế độ tăng dần (`incremental_sync_products_to_vector_db`): so dấu vân tay nội dung (`content_hash`
+trong Metadata) với dữ liệu SQL, chỉ nhúng lại sản phẩm đã đổi và xóa Vector của sản phẩm đã bị xóa / ngừng bán.
+"""
+
+import time
+
+from app.constants import TEXT_VECTOR_SYNC_BATCH_SIZE, TEXT_VECTOR_SCAN_PAGE_SIZE
+from app.utils import (
+    get_text_embedder,
+    get_product_collection,
+    product_semantic_text,
+    product_vector_metadata
+)
+
+
+def _flush_batch(collection, embedder, batch):
+    """Nhúng + Upsert 1 lô [(id, văn_bản, metadata)]. Trả về số sản phẩm đã lưu thành công."""
+    try:
+        documents = [item[1] for item in batch]
+        collection.upsert(
+            embeddings=embedder(documents),
+            documents=documents,
+            metadatas=[item[2] for item in batch],
+            ids=[item[0] for item in batch]
+        )
+        return len(batch)
+    except Exception as e:
+        print(f"⚠️ Lỗi lưu lô Vector Văn bản vào ChromaDB: {e}")
+        return 0
+
+
+def bulk_sync_products_to_vector_db(products, batch_size=TEXT_VECTOR_SYNC_BATCH_SIZE):
+    """
+    Đồng bộ Vector Văn bản cho nhiều sản phẩm cùng lúc (nhận mọi Iterable, kể cả Generator).
+    Trả về thống kê {'indexed', 'failed', 'seconds', 'docs_per_second'}.
+    """
+    started = time.perf_counter()
+    stats = {'indexed': 0, 'failed': 0, 'seconds': 0.0, 'docs_per_second': 0.0}
+
+    collection = get_product_collection()
+    embedder = get_text_embedder()
+    if not collection or embedder is None:
+        return stats
+
+    batch = []
+    seen = set()
+    for p in products:
+        if p.id in seen:
+            continue
+        seen.add(p.id)
+        semantic_text = product_semantic_text(p)
+        batch.append((str(p.id), semantic_text, product_vector_metadata(p, semantic_text)))
+        if len(batch) >= batch_size:
+            saved = _flush_batch(collection, embedder, batch)
+            stats['indexed'] += saved
+            stats['failed'] += len(batch) - saved
+            batch = []
+
+    if batch:
+        saved = _flush_batch(collection, embedder, batch)
+        stats['indexed'] += saved
+        stats['failed'] += len(batch) - saved
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    if stats['seconds']:
+        stats['docs_per_second'] = round(stats['indexed'] / stats['seconds'], 1)
+    return stats
+
+
+def _indexed_content_hashes(collection, page_size=TEXT_VECTOR_SCAN_PAGE_SIZE):
+    """Đọc {id: content_hash} của toàn bộ Vector đang có (theo trang, chỉ lấy Metadata, không lấy Vector)."""
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        ids = page.get('ids') or []
+        for vid, meta in zip(ids, page.get('metadatas') or [{}] * len(ids)):
+            hashes[vid] = (meta or {}).get('content_hash')
+        if len(ids) < page_size:
+            return hashes
+        offset += page_size
+
+
+def incremental_sync_products_to_vector_db(products, batch_size=TEXT_VECTOR_SYNC_BATCH_SIZE, force=False):
+    """
+    Đồng bộ tăng dần Vector Văn bản với toàn bộ danh sách sản phẩm trong SQL (truyền vào TẤT CẢ sản phẩm,
+    kể cả đã ngừng bán, để phân biệt "ngừng bán" với "chưa từng đồng bộ").
+    - Sản phẩm mới / nội dung đổi -> Nhúng + Upsert. Nội dung không đổi -> Bỏ qua (không chạy Model).
+    - Sản phẩm ngừng bán hoặc đã bị xóa khỏi SQL -> Xóa Vector.
+    `force=True`: Nhúng lại toàn bộ sản phẩm đang bán (VD: sau khi đổi Model nhúng) nhưng vẫn dọn Vector mồ côi.
+    Trả về thống kê {'added', 'updated', 'deleted', 'skipped', 'failed', 'seconds', 'docs_per_second'}
+    (`docs_per_second`: tốc độ nhúng + ghi của các sản phẩm đã đổi).
+    """
+    started = time.perf_counter()
+    stats = {'added': 0, 'updated': 0, 'deleted': 0, 'skipped': 0, 'failed': 0, 'seconds': 0.0, 'docs_per_second': 0.0}
+
+    collection = get_product_collection()
+    embedder = get_text_embedder()
+    if not collection or embedder is None:
+        return stats
+
+    try:
+        indexed = _indexed_content_hashes(collection)
+    except Exception as e:
+        print(f"⚠️ Không đọc được Metadata Vector DB, chuyển sang đồng bộ toàn bộ: {e}")
+        indexed, force = {}, True
+
+    changed = []
+    live_ids = set()
+    for p in products:
+        product_id = str(p.id)
+        if not p.is_active or product_id in live_ids:
+            continue
+        live_ids.add(product_id)
+        semantic_text = product_semantic_text(p)
+        metadata = product_vector_metadata(p, semantic_text)
+        if not force and indexed.get(product_id) == metadata['content_hash']:
+            stats['skipped'] += 1
+            continue
+        changed.append((product_id, semantic_text, metadata))
+
+    for i in range(0, len(changed), batch_size):
+        batch = changed[i:i + batch_size]
+        saved = _flush_batch(collection, embedder, batch)
+        if saved:
+            for product_id, _, _ in batch:
+                stats['updated' if product_id in indexed else 'added'] += 1
+        else:
+            stats['failed'] += len(batch)
+
+    stale_ids = [vid for vid in indexed if vid not in live_ids]
+    for i in range(0, len(stale_ids), batch_size):
+        chunk = stale_ids[i:i + batch_size]
+        try:
+            collection.delete(ids=chunk)
+            stats['deleted'] += len(chunk)
+        except Exception as e:
+            print(f"⚠️ Lỗi xóa Vector sản phẩm đã ngừng bán khỏi ChromaDB: {e}")
+            stats['failed'] += len(chunk)
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    if stats['seconds']:
+        stats['docs_per_second'] = round((stats['added'] + stats['updated']) / stats['seconds'], 1)
+    return stats
@@ -8,120 +8,34 @@ Tuyệt đối không chứa các module liên quan đến SMTP/Email.
 import os
 import json
 import re
-import chromadb
-from google import genai
-from google.genai import types
-from chromadb.utils import embedding_functions
+import hashlib
+from collections import namedtuple
+import numpy as np
+from app.gemini_client import get_gemini_pool, gemini_breaker, is_gemini_available
+from app.semantic_cache import get_semantic_cache
+from app.text_embedding import embed_query_text
+from app.image_pipeline import PreparedImage, prepare_upload
+from app.image_fetcher import get_image_fetcher
+# Torch/CLIP, ChromaDB và MiniLM được nạp lười qua các hàm get_*() (xem app/ai_resources.py)
+from app.ai_resources import (
+    get_clip_runtime,
+    get_text_embedder,
+    get_product_collection,
+    get_product_image_collection,
+    get_image_embedding_store
+)
 from flask import url_for
 from itsdangerous import URLSafeTimedSerializer
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
-import requests
 from PIL import Image, ImageEnhance # ---> [SỬA LỖI]: Bổ sung ImageEnhance để đeo kính cận cho AI
 import io
 
 
-# [NEW] Khởi tạo thư viện PyTorch cho Visual Search
-try:
-    import torch
-    import torch.nn.functional as F  # ---> [NEW]: Thêm thư viện để chuẩn hóa Vector an toàn
-    # ---> [NÂNG CẤP]: Thay thế torchvision/ResNet bằng thư viện transformers để dùng CLIP Model
-    from transformers import CLIPProcessor, CLIPModel
-except ImportError:
-    torch = None
-    F = None
-    print("⚠️ Thư viện xử lý ảnh chưa đủ. Chạy lệnh: pip install torch torchvision transformers")
-
-# =========================================================================
-# [HOTFIX] Khóa mõm triệt để lỗi rác Telemetry của ChromaDB 0.4.22
-# Sử dụng kỹ thuật Monkey Patching đúng chuẩn Python tránh lỗi Argument Mismatch
-# =========================================================================
-try:
-    from chromadb.telemetry.posthog import Posthog  # type: ignore
-
-    # ---> [HOTFIX]: Dùng lambda để nuốt sạch mọi tham số, diệt tận gốc lỗi crash log
-    Posthog.capture = lambda *args, **kwargs: None
-except Exception:
-    pass
-
-# Tắt cảnh báo Telemetry của ChromaDB để giao diện Console sạch sẽ
-os.environ["ANONYMIZED_TELEMETRY"] = "False"
-
 # --- CẤU HÌNH ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-# Khởi tạo ChromaDB (Lưu file local tại thư mục chroma_db)
-try:
-    chroma_client = chromadb.PersistentClient(path="./chroma_db")
-except Exception as e:
-    print(f"⚠️ ChromaDB Init Warning: {e}")
-    chroma_client = None
-
-# =========================================================================
-# ---> [UPGRADED V4] CLIP Feature Extractor (Semantic Visual Search)
-# Tối ưu hóa tuyệt đối cho phần cứng VRAM 4GB (NVIDIA Quadro P620)
-# Thay thế ResNet50 bằng CLIP ViT-B/32 để hiểu ngữ nghĩa thiết kế hạt mịn (FGVC)
-# =========================================================================
-visual_model = None
-visual_processor = None
-device = None
-
-if torch is not None:
-    try:
-        if torch.cuda.is_available():
-            device = torch.device("cuda")
-        elif hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
-            device = torch.device("mps")
-        else:
-            device = torch.device("cpu")
-
-        print(f"🚀 Visual Search Engine (CLIP Model) initialized on device: {device}")
-
-        # ---> [NÂNG CẤP]: Tải mô hình CLIP của OpenAI (Siêu nhẹ, cực nhạy với chi tiết FGVC)
-        visual_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-        visual_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-        # Đẩy mô hình lên GPU P620 và thiết lập chế độ dự đoán (tốn khoảng ~1.5GB VRAM)
-        visual_model = visual_model.to(device)
-        visual_model.eval()
-
-    except Exception as e:
-        print(f"⚠️ Không thể tải mô hình CLIP: {e}")
-
-
-
-class LocalEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    """Sử dụng Vector Model Offline để miễn phí 100% API Quota"""
-    def __init__(self):
-        self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="paraphrase-multilingual-MiniLM-L12-v2")
-
-    def __call__(self, input: list[str]) -> list[list[float]]:
-        try:
-            return self.ef(input)
-        except Exception as e:
-            print(f"❌ Local Embedding Error: {e}")
-            return [[0.0] * 384] * len(input)
-
-# Khởi tạo Collection lưu trữ
-try:
-    if chroma_client:
-        product_collection = chroma_client.get_or_create_collection(
-            name="mobile_store_products",
-            embedding_function=LocalEmbeddingFunction()
-        )
-        product_image_collection = chroma_client.get_or_create_collection(
-            name="product_images",
-            metadata={"hnsw:space": "cosine"}
-        )
-    else:
-        product_collection = None
-        product_image_collection = None
-except Exception as e:
-    print(f"⚠️ ChromaDB Collection Error: {e}")
-    product_collection = None
-    product_image_collection = None
-
 def validate_image_file(file):
     """
     Kiểm tra tính hợp lệ của file ảnh tải lên hệ thống.
@@ -140,56 +54,121 @@ def validate_image_file(file):
 # =========================================================================
 # ---> [NEW] HỆ THỐNG XỬ LÝ ẢNH (VISUAL SEARCH ENGINE) - CLIP 512D
 # =========================================================================
+def load_image(image_source, is_url=True):
+    """
+    Tải (nếu là URL) và giải mã ảnh về PIL RGB. Trả về None nếu link ảnh đã chết (404).
+    Ảnh tải lên đã qua Pipeline (PreparedImage) được dùng lại, không giải mã lần 2.
+    """
+    if isinstance(image_source, PreparedImage):
+        return image_source.image
+    if is_url:
+        # Session dùng chung: giới hạn đồng thời theo CDN, chặn ảnh quá dung lượng, tự thử lại khi lỗi mạng
+        response = get_image_fetcher().fetch(image_source)
+
+        # ---> [HOTFIX]: Giấu lỗi 404 (Ảnh link bị chết) để Terminal sạch sẽ, không bị spam
+        if response.status_code == 404:
+            return None
+        return Image.open(io.BytesIO(response.content)).convert('RGB')
+    return Image.open(image_source).convert('RGB')
+
+
+# Kết quả tải ảnh qua Kho Vector: `vector` có sẵn (khỏi chạy CLIP) hoặc `image` (PIL) cần nhúng
+ImageFetch = namedtuple('ImageFetch', ['sha256', 'vector', 'image'])
+
+
+def fetch_image_with_cache(url):
+    """
+    Tải ảnh từ URL có tận dụng Kho Vector theo nội dung:
+    - URL đã gặp: gửi Request có điều kiện (ETag / Last-Modified). 304 -> Dùng lại Vector cũ, không tải file.
+    - Tải về: băm SHA-256 nội dung, nếu cùng nội dung đã từng nhúng (dù khác URL) -> Dùng lại Vector.
+    Trả về ImageFetch, hoặc None nếu link ảnh đã chết (404).
+    """
+    store = get_image_embedding_store()
+    entry = store.lookup_url(url) if store else None
+    fetcher = get_image_fetcher()
+
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = fetcher.fetch(url, headers=headers)
+    if response.status_code == 304 and entry:
+        vector = store.get(entry['sha256'])
+        if vector is not None:
+            store.record_revalidation()
+            return ImageFetch(entry['sha256'], vector, None)
+        # Máy chủ báo ảnh không đổi nhưng Kho đã mất Vector -> Tải lại không điều kiện
+        response = fetcher.fetch(url)
+
+    if response.status_code == 404:
+        return None
+
+    data = response.content
+    digest = hashlib.sha256(data).hexdigest()
+    if store:
+        store.remember_url(url, digest, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        vector = store.get(digest)
+        if vector is not None:
+            return ImageFetch(digest, vector, None)
+    return ImageFetch(digest, None, Image.open(io.BytesIO(data)).convert('RGB'))
+
+
+def remember_image_embeddings(pairs):
+    """Lưu các cặp (sha256, vector) vừa nhúng vào Kho Vector trên đĩa để lần sau khỏi chạy CLIP."""
+    store = get_image_embedding_store()
+    if not store:
+        return
+    for digest, vector in pairs:
+        store.put(digest, vector)
+    store.save()
+
+
+def preprocess_images(images, clip):
+    """Tiền xử lý (Resize, Crop, Normalize) 1 hoặc nhiều ảnh PIL thành mảng NumPy `pixel_values` cho CLIP."""
+    return clip.processor(images=images, return_tensors="np")['pixel_values']
+
+
+def embed_pixel_values(pixel_values, clip):
+    """
+    Đẩy 1 lô ảnh (N x 3 x 224 x 224) qua CLIP trong đúng 1 lượt Forward (Backend torch / int8 / onnx).
+    Trả về N Vector đã chuẩn hóa L2 (dạng list để lưu vào ChromaDB).
+    """
+    image_features = np.asarray(clip.encode(pixel_values), dtype=np.float32)
+
+    # Chuẩn hóa Vector (L2 Normalization), chặn chia cho 0 với Vector rỗng
+    norms = np.linalg.norm(image_features, axis=-1, keepdims=True)
+    image_features = image_features / np.maximum(norms, 1e-12)
+    return image_features.tolist()
+
+
 def get_image_embedding(image_source, is_url=True):
     """
     Biến đổi hình ảnh thành mảng Vector 512 chiều bằng mô hình ngôn ngữ thị giác CLIP.
     Giúp ChromaDB hiểu được ngữ nghĩa "lưng da", "camera tròn", "viền phẳng".
     """
-    if not visual_model or not visual_processor or not device:
+    clip = get_clip_runtime()
+    if clip is None:
         return None
 
     try:
         if is_url:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'}
-            response = requests.get(image_source, stream=True, timeout=5, headers=headers)
-
-            # ---> [HOTFIX]: Giấu lỗi 404 (Ảnh link bị chết) để Terminal sạch sẽ, không bị spam
-            if response.status_code == 404:
+            # Ảnh sản phẩm: tra Kho Vector trước, ảnh không đổi thì bỏ qua hoàn toàn bước CLIP
+            fetched = fetch_image_with_cache(image_source)
+            if fetched is None:
                 return None
+            if fetched.vector is not None:
+                return fetched.vector
+            vector = embed_pixel_values(preprocess_images(fetched.image, clip), clip)[0]
+            remember_image_embeddings([(fetched.sha256, vector)])
+            return vector
 
-            response.raise_for_status()
-            img = Image.open(response.raw).convert('RGB')
-        else:
-            img = Image.open(image_source).convert('RGB')
+        img = load_image(image_source, is_url=False)
 
         # ---> [NÂNG CẤP]: Tiền xử lý và đẩy qua mạng CLIP
-        inputs = visual_processor(images=img, return_tensors="pt").to(device)
-
-        with torch.no_grad():
-            # ---> [FIX MATRIX LỖI NHÂN MA TRẬN]: Tự tay bóc tách Vector bỏ qua hàm có sẵn
-            vision_outputs = visual_model.vision_model(**inputs)
-
-            # Trích xuất Pooler Output (Thường là 768 chiều)
-            if hasattr(vision_outputs, 'pooler_output') and vision_outputs.pooler_output is not None:
-                image_features = vision_outputs.pooler_output
-            elif hasattr(vision_outputs, 'last_hidden_state'):
-                image_features = vision_outputs.last_hidden_state[:, 0, :]
-            else:
-                image_features = vision_outputs[1] if isinstance(vision_outputs, tuple) else vision_outputs
-
-            # Bức tường Lửa chặn Lỗi Nhân Ma Trận (1x512 and 768x512)
-            # CHỈ được đẩy qua màn lọc Projection khi và chỉ khi Vector bị sai chiều (khác 512)
-            if hasattr(visual_model, 'visual_projection'):
-                target_dim = visual_model.visual_projection.out_features
-                if image_features.shape[-1] != target_dim:
-                    image_features = visual_model.visual_projection(image_features)
-
-        # Chuẩn hóa Vector (L2 Normalization) bằng F (an toàn tuyệt đối, chống crash AttributeError)
-        image_features = F.normalize(image_features, p=2, dim=-1)
-
-        # Kéo dữ liệu từ GPU về lại CPU để chuyển thành list lưu vào ChromaDB
-        flattened_vector = image_features.squeeze().cpu().numpy().tolist()
-        return flattened_vector
+        return embed_pixel_values(preprocess_images(img, clip), clip)[0]
 
     except Exception as e:
         print(f"⚠️ Lỗi trích xuất Vector Ảnh bằng CLIP: {e}")
@@ -200,7 +179,10 @@ def sync_product_image_to_vector_db(product):
     """
     Đồng bộ ảnh của sản phẩm vào ChromaDB khi Admin thêm/sửa sản phẩm.
     """
-    if not product_image_collection or not product.image_url:
+    if not product.image_url:
+        return
+    product_image_collection = get_product_image_collection()
+    if not product_image_collection:
         return
 
     embedding = get_image_embedding(product.image_url, is_url=True)
@@ -220,6 +202,7 @@ def search_image_vector_db(image_file, n_results=4):
     """
     Tìm kiếm các sản phẩm có hình dáng giống nhất với ảnh tải lên.
     """
+    product_image_collection = get_product_image_collection()
     if not product_image_collection: return []
 
     embedding = get_image_embedding(image_file, is_url=False)
@@ -243,16 +226,20 @@ def identify_phone_by_gemini(image_file):
     Áp dụng kỹ thuật Cross-Examination (Đối chiếu chéo) vào logic nhận diện của AI.
     Bổ sung toàn diện Prompts cho Xiaomi, OPPO, Realme, Vivo và ASUS.
     """
-    raw_keys = os.environ.get("GEMINI_API_KEY", "")
-    api_keys = [k.strip() for k in raw_keys.split(",") if k.strip()]
+    pool = get_gemini_pool()
 
-    if not api_keys:
+    if not len(pool) or not is_gemini_available():
         return None
 
     try:
-        # Nhận diện ảnh bằng PIL để chuẩn bị nén gửi cho Gemini
-        img = Image.open(image_file).convert('RGB')
-        img.thumbnail((1024, 1024)) # Nén về size tối ưu để Gemini đọc nhanh hơn
+        # Ảnh đã qua Pipeline 1 lần giải mã (Route Visual Search) -> Dùng lại luôn,
+        # file thô -> Tự chạy Pipeline (giải mã có thu nhỏ, tối đa 1024px để Gemini đọc nhanh hơn)
+        if isinstance(image_file, PreparedImage):
+            prepared = image_file
+        else:
+            prepared = prepare_upload(image_file.read())
+            # Reset con trỏ file gốc để các hàm sau (nếu có dùng) không bị lỗi
+            image_file.seek(0)
 
         # ---> [GIẢI QUYẾT TÌNH TRẠNG ẢO GIÁC - HALLUCINATION] <---
         # Đã VÔ HIỆU HÓA các bộ lọc ImageEnhance (Sharpness 1.5, Contrast 1.1) theo lời khuyên của chuyên gia.
@@ -260,14 +247,9 @@ def identify_phone_by_gemini(image_file):
         # LLM Vision như Gemini rất nhạy cảm với nhiễu này, dễ nhìn nhầm "lưng nhám" thành "lưng sần",
         # hoặc viền kim loại xước mờ thành viền nhựa bóng. Giữ nguyên chất lượng ảnh gốc là tốt nhất.
 
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG', quality=85)
-        image_bytes = img_byte_arr.getvalue()
+        image_bytes = prepared.gemini_jpeg
         mime_type = 'image/jpeg'
 
-        # Reset con trỏ file gốc để các hàm sau (nếu có dùng) không bị lỗi
-        image_file.seek(0)
-
         system_instruction = (
             "Bạn là siêu chuyên gia giám định thiết kế phần cứng điện thoại, ĐẶC BIỆT LÀ CHUYÊN GIA VỀ MỌI DÒNG MÁY SAMSUNG, APPLE, XIAOMI, OPPO, REALME, VIVO VÀ ASUS. "
             "Nhiệm vụ của bạn là nhận diện chính xác dòng máy từ ảnh chụp. KHÔNG ĐƯỢC ĐOÁN BỪA. "
@@ -394,28 +376,33 @@ def identify_phone_by_gemini(image_file):
             "TUYỆT ĐỐI CHỈ TRẢ VỀ 1 CHUỖI JSON DUY NHẤT."
         )
 
-        for key in api_keys:
-            try:
-                temp_client = genai.Client(api_key=key)
-                response = temp_client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=[
-                        "Hãy soi thật kỹ ảnh này, áp dụng BỘ QUY TẮC PHÂN BIỆT ĐẶC ĐIỂM ĐỂ NHẬN DIỆN dòng máy chính xác nhất:",
-                        types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-                    ],
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_instruction,
-                        response_mime_type="application/json",
-                        temperature=0.1 # Giữ nhiệt độ thấp để AI phân tích logic, tránh ảo giác (hallucination)
-                    )
-                )
-
-                clean = re.sub(r"```json|```", "", response.text).strip()
-                parsed = json.loads(clean)
-                return parsed
-            except Exception as e:
-                continue
-        return None
+        if not gemini_breaker.allow_request():
+            return None
+
+        from google.genai import types  # Nạp lười SDK (xem GeminiKeyHealth.client)
+        response, reason = pool.generate_content(
+            contents=[
+                "Hãy soi thật kỹ ảnh này, áp dụng BỘ QUY TẮC PHÂN BIỆT ĐẶC ĐIỂM ĐỂ NHẬN DIỆN dòng máy chính xác nhất:",
+                types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+            ],
+            config=types.GenerateContentConfig(
+                system_instruction=system_instruction,
+                response_mime_type="application/json",
+                temperature=0.1 # Giữ nhiệt độ thấp để AI phân tích logic, tránh ảo giác (hallucination)
+            ),
+            failover_on_any_error=True
+        )
+        if reason == 'rejected':
+            # Ảnh / Prompt bị Gemini từ chối: dịch vụ vẫn sống, không tính vào Cầu dao
+            gemini_breaker.record_success()
+            return None
+        if response is None:
+            gemini_breaker.record_failure()
+            return None
+        gemini_breaker.record_success()
+
+        clean = re.sub(r"```json|```", "", response.text).strip()
+        return json.loads(clean)
     except Exception as e:
         print(f"Lỗi AI Vision Nhận diện: {e}")
         return None
@@ -442,18 +429,17 @@ def send_reset_email_simulation(to_email, token):
 def search_vector_db(query_text, n_results=5, metadata_filters=None):
     # ---> [HOTFIX 4]: Đã xóa bỏ điều kiện 'or not GEMINI_API_KEY'
     # Giải phóng hoàn toàn Vector Offline, cho phép nó chạy bất chấp trạng thái API Key
+    product_collection = get_product_collection()
     if not product_collection:
         return []
     try:
-        count = product_collection.count()
-        if count == 0: return []
-        safe_n_results = min(n_results, count)
-
-        query_params = {"query_texts": [query_text], "n_results": safe_n_results}
-        if metadata_filters:
-            query_params["where"] = metadata_filters
-
-        results = product_collection.query(**query_params)
+        # Nhúng câu truy vấn qua Cache LRU + Micro-batching của dịch vụ nhúng dùng chung
+        # (hàm nhúng của Collection chỉ dành cho văn bản sản phẩm)
+        embedder = get_text_embedder()
+        query = ({'query_embeddings': [embed_query_text(embedder, query_text)]} if embedder is not None
+                 else {'query_texts': [query_text]})
+        # Backend Vector tự thu nhỏ n_results theo số Vector đang có (không cần gọi count() mỗi truy vấn)
+        results = product_collection.query(n_results=n_results, where=metadata_filters, **query)
         if results['ids'] and len(results['ids']) > 0:
             return results['ids'][0]
         return []
@@ -462,20 +448,36 @@ def search_vector_db(query_text, n_results=5, metadata_filters=None):
         return []
 
 
+def product_semantic_text(product):
+    """Chuyển đổi dữ liệu bảng (SQL) của 1 Sản phẩm thành văn bản ngữ nghĩa để AI dễ dàng đọc hiểu."""
+    clean_desc = str(product.description).replace('\n', ' ').strip()
+    return f"Sản phẩm {product.name}, hãng {product.brand}, loại {product.category}. Cấu hình/Tính năng: {clean_desc}. Giá bán: {product.price} VNĐ."
+
+
+def semantic_text_hash(semantic_text):
+    """Dấu vân tay nội dung của văn bản ngữ nghĩa (lưu kèm Metadata để đồng bộ tăng dần biết sản phẩm nào đã đổi)."""
+    return hashlib.sha1(semantic_text.encode('utf-8')).hexdigest()
+
+
+def product_vector_metadata(product, semantic_text=None):
+    semantic_text = semantic_text or product_semantic_text(product)
+    return {"price": product.price, "brand": product.brand, "category": product.category,
+            "content_hash": semantic_text_hash(semantic_text)}
+
+
 def sync_product_to_vector_db(product):
     """
     Đồng bộ dữ liệu của 1 Sản phẩm vào bộ nhớ Vector Database.
-    Chuyển đổi dữ liệu bảng (SQL) thành văn bản ngữ nghĩa để AI dễ dàng đọc hiểu.
+    Đồng bộ nhiều sản phẩm cùng lúc -> Dùng `bulk_sync_products_to_vector_db` (app/text_indexer.py).
     """
+    product_collection = get_product_collection()
     if not product_collection: return
 
-    clean_desc = str(product.description).replace('\n', ' ').strip()
-    semantic_text = f"Sản phẩm {product.name}, hãng {product.brand}, loại {product.category}. Cấu hình/Tính năng: {clean_desc}. Giá bán: {product.price} VNĐ."
-
+    semantic_text = product_semantic_text(product)
     try:
         product_collection.upsert(
             documents=[semantic_text],
-            metadatas=[{"price": product.price, "brand": product.brand, "category": product.category}],
+            metadatas=[product_vector_metadata(product, semantic_text)],
             ids=[str(product.id)]
         )
         print(f"✅ Indexed Vector: {product.name}")
@@ -483,6 +485,17 @@ def sync_product_to_vector_db(product):
         print(f"Sync Vector Error: {e}")
 
 
+def remove_product_from_vector_db(product_id):
+    """Xóa Vector Văn bản + Vector Ảnh của sản phẩm đã bị xóa khỏi kho (tránh AI gợi ý sản phẩm không còn tồn tại)."""
+    for collection in (get_product_collection(), get_product_image_collection()):
+        if not collection:
+            continue
+        try:
+            collection.delete(ids=[str(product_id)])
+        except Exception as e:
+            print(f"⚠️ Lỗi xóa Vector sản phẩm #{product_id} khỏi ChromaDB: {e}")
+
+
 def get_similar_products(current_product, limit=4):
     """
     Thuật toán Gợi ý Sản phẩm Tương tự dựa trên Content-Based Filtering.
@@ -534,13 +547,11 @@ def call_gemini_api(prompt, system_instruction=None, is_json=False):
     """
     Hàm lõi gọi Google Gemini có tính năng xoay vòng API Key (Key Rotation)
     Đã được tối ưu bộ lọc chuỗi để chống lỗi 400 INVALID_ARGUMENT.
+    Key được chọn qua bể `GeminiKeyPool` (Weighted Round-Robin theo sức khỏe từng Key).
     """
-    raw_keys = os.environ.get("GEMINI_API_KEY", "")
+    pool = get_gemini_pool()
 
-    # Xử lý chuỗi key an toàn hơn: Cắt theo dấu phẩy, loại bỏ khoảng trắng, lọc bỏ key rỗng
-    api_keys = [k.strip() for k in raw_keys.split(",") if k.strip()]
-
-    if not api_keys:
+    if not len(pool):
         print("❌ System Error: Không tìm thấy GEMINI_API_KEY trong file .env")
         return None
 
@@ -551,28 +562,27 @@ def call_gemini_api(prompt, system_instruction=None, is_json=False):
     if is_json:
         config_kwargs['response_mime_type'] = "application/json"
 
+    from google.genai import types  # Nạp lười SDK (xem GeminiKeyHealth.client)
     config = types.GenerateContentConfig(**config_kwargs) if config_kwargs else None
 
-    # Thử lần lượt từng API Key
-    for key in api_keys:
-        try:
-            temp_client = genai.Client(api_key=key)
-            response = temp_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt,
-                config=config
-            )
-            return response.text
-        except Exception as e:
-            error_str = str(e).lower()
-            # Bắt cả lỗi 429 (Hết Quota) và 400 (Key sai/bị khóa) để trượt sang key tiếp theo
-            if "429" in error_str or "quota" in error_str or "exhausted" in error_str or "400" in error_str or "invalid" in error_str:
-                hidden_key = f"...{key[-4:]}" if len(key) > 4 else "UNKNOWN"
-                print(f"⚠️ Key ({hidden_key}) gặp lỗi ({error_str[:30]}...). Đang thử Key tiếp theo...")
-                continue
-            else:
-                print(f"Gemini API Error: {e}")
-                return None
+    # Cầu dao đang ngắt: trả về None ngay để nơi gọi rơi xuống phương án dự phòng nội bộ
+    if not gemini_breaker.allow_request():
+        return None
+
+    # Bể Key dùng chung: Client được tái sử dụng, Key hết Quota bị cách ly tới khi Reset
+    response, reason = pool.generate_content(contents=prompt, config=config)
+    if response is not None:
+        gemini_breaker.record_success()
+        return response.text
+
+    if reason == 'rejected':
+        # Gemini vẫn trả lời (chỉ từ chối Request này) -> Không tính vào Cầu dao
+        gemini_breaker.record_success()
+        return None
+
+    gemini_breaker.record_failure()
+    if reason == 'error':
+        return None
 
     print("❌ TOÀN BỘ API KEY ĐÃ HỎNG HOẶC HẾT HẠN MỨC. Hệ thống AI đang tạm liệt!")
     return None
@@ -649,6 +659,9 @@ def build_product_context(user_query):
     return context_text
 
 
+CHATBOT_FALLBACK_REPLY = "Dạ hiện tại hệ thống AI tư vấn đang tải hơi nhiều dữ liệu một chút, anh/chị có thể đợi em vài giây hoặc nói rõ tên dòng máy (VD: 'iPhone 15') để em tra cứu kho nhanh nhất nhé! 🥰"
+
+
 def generate_chatbot_response(user_msg, chat_history=None):
 
     """
@@ -658,6 +671,10 @@ def generate_chatbot_response(user_msg, chat_history=None):
     if chat_history is None:
         chat_history = []
 
+    # Cầu dao Gemini đang ngắt -> Bỏ qua cả bước RAG, trả lời dự phòng ngay lập tức
+    if not is_gemini_available():
+        return CHATBOT_FALLBACK_REPLY
+
     # ---> [FIX LỖI QUÊN NGỮ CẢNH (AMNESIA & FALSE OUT-OF-STOCK)] <---
     # Nối câu hỏi gần nhất của User và 1 phần câu trả lời của AI vào truy vấn RAG
     # Giúp hệ thống tìm kiếm luôn giữ được Tên Sản Phẩm dù khách chỉ nói "tư vấn máy đó"
@@ -696,14 +713,27 @@ def generate_chatbot_response(user_msg, chat_history=None):
 
     prompt += f"\n--- CÂU HỎI MỚI CỦA KHÁCH ---\nKhách hàng: {user_msg}\nMobileStore:"
 
-    # 4. Giao tiếp với não bộ Gemini
+    # 4. Semantic Cache: chỉ áp dụng cho câu hỏi mở đầu (không có lịch sử) vì câu trả lời phụ thuộc mạch hội thoại.
+    # Dấu vân tay = System Instruction (gồm cả dữ liệu kho) -> Kho đổi giá/tồn kho thì không dùng lại câu trả lời cũ
+    semantic_cache = None if chat_history else get_semantic_cache('generate_chatbot_response', get_text_embedder)
+    fingerprint = hashlib.md5(system_instruction.encode('utf-8')).hexdigest()
+    query_vector = None
+    if semantic_cache:
+        cached_reply, query_vector = semantic_cache.lookup(user_msg, fingerprint)
+        if cached_reply:
+            return cached_reply
+
+    # 5. Giao tiếp với não bộ Gemini
     res = call_gemini_api(prompt, system_instruction=system_instruction)
 
     if res:
-        return res.strip()
+        answer = res.strip()
+        if semantic_cache:
+            semantic_cache.store(user_msg, fingerprint, answer, vector=query_vector)
+        return answer
 
-    # 5. Fallback tinh tế khi API sập hoặc Quota cạn kiệt
-    return "Dạ hiện tại hệ thống AI tư vấn đang tải hơi nhiều dữ liệu một chút, anh/chị có thể đợi em vài giây hoặc nói rõ tên dòng máy (VD: 'iPhone 15') để em tra cứu kho nhanh nhất nhé! 🥰"
+    # 6. Fallback tinh tế khi API sập hoặc Quota cạn kiệt
+    return CHATBOT_FALLBACK_REPLY
 
 
 def analyze_search_intents(query):
@@ -728,6 +758,15 @@ def analyze_search_intents(query):
     Định dạng JSON yêu cầu (BẮT BUỘC DÙNG CẤU TRÚC NÀY):
     {"brand": "Tên hãng hoặc null", "category": "phone hoặc accessory hoặc null", "min_price": Số hoặc null, "max_price": Số hoặc null, "keyword": "Từ khóa thô hoặc null", "semantic_query": "Câu dịch ngữ nghĩa hoặc null", "sort": "price_asc hoặc price_desc hoặc null"}
     """
+    # Semantic Cache: "giá ip15" và "iphone 15 giá bao nhiêu" dùng chung 1 kết quả phân tích
+    semantic_cache = get_semantic_cache('analyze_search_intents', get_text_embedder)
+    fingerprint = hashlib.md5(system_instruction.encode('utf-8')).hexdigest()
+    query_vector = None
+    if semantic_cache:
+        cached_intent, query_vector = semantic_cache.lookup(query, fingerprint)
+        if cached_intent:
+            return dict(cached_intent)
+
     prompt = f"Câu hỏi: '{query}'\n\nTrả về JSON:"
     # Ép Gemini cấu trúc response trả về 100% JSON (Tránh lỗi 500)
     res = call_gemini_api(prompt, system_instruction=system_instruction, is_json=True)
@@ -748,7 +787,9 @@ def analyze_search_intents(query):
                 'semantic_query': parsed.get('semantic_query', ''),
                 'sort': parsed.get('sort')
             }
-            return safe_data
+            if semantic_cache:
+                semantic_cache.store(query, fingerprint, safe_data, vector=query_vector)
+            return dict(safe_data)
         return None
     except Exception as e:
         print(f"AI Parse JSON Error: {e}")
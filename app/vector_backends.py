@@ -0,0 +1,391 @@
+"""
+Module Backend Vector DB có thể hoán đổi (Pluggable Vector Backends) của MobileStore.
+Mọi Backend dùng chung giao diện kiểu Collection của ChromaDB (`upsert / delete / get / query / count`),
+nên các hàm đồng bộ + tìm kiếm trong app/utils.py, text_indexer.py, visual_indexer.py không cần biết
+đang chạy trên Backend nào. Chọn qua biến môi trường VECTOR_BACKEND:
+- chroma: ChromaDB + chỉ mục HNSW (mặc định, phù hợp hàng triệu Vector).
+- numpy : Ma trận float32 liền khối đã chuẩn hóa, ánh xạ bộ nhớ (memmap) từ đĩa, tìm Top-K chính xác
+          bằng `argpartition` + lọc Metadata bằng mặt nạ Boolean. Với catalog vài nghìn sản phẩm,
+          quét toàn bộ còn nhanh hơn HNSW và không cần nạp ChromaDB.
+"""
+
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+
+from app.file_lock import interprocess_lock, file_stamp
+
+VECTOR_BACKENDS = ('chroma', 'numpy')
+INDEX_FILENAME = 'index.json'
+VECTORS_FILENAME = 'vectors.f32'
+LOCK_FILENAME = 'index.lock'
+
+
+def vector_backend_name():
+    backend = os.environ.get('VECTOR_BACKEND', 'chroma').strip().lower()
+    return backend if backend in VECTOR_BACKENDS else 'chroma'
+
+
+class VectorBackend(ABC):
+    """
+    Class Abstract cho kho Vector sản phẩm. Kết quả trả về giữ nguyên định dạng của ChromaDB
+    (VD: `query()` -> {'ids': [[...]], 'distances': [[...]], 'metadatas': [[...]]}).
+    """
+    name = 'abstract'
+
+    @abstractmethod
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        pass
+
+    @abstractmethod
+    def delete(self, ids):
+        pass
+
+    @abstractmethod
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        pass
+
+    @abstractmethod
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, include=None):
+        """Top-K gần nhất. `n_results` lớn hơn số Vector đang có -> Tự thu nhỏ, kho rỗng -> Kết quả rỗng."""
+        pass
+
+    @abstractmethod
+    def count(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.name, 'vectors': self.count()}
+
+
+class ChromaVectorBackend(VectorBackend):
+    """
+    Bọc 1 Collection ChromaDB. Số lượng Vector được nhớ tạm (làm mới sau mỗi lần ghi hoặc sau
+    `count_ttl` giây) để không phải gọi `count()` trước mỗi câu truy vấn.
+    """
+    name = 'chroma'
+
+    def __init__(self, collection, count_ttl=30):
+        self.collection = collection
+        self.count_ttl = count_ttl
+        self._count = None
+        self._counted_at = 0.0
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        params = {'ids': ids}
+        for key, value in (('embeddings', embeddings), ('documents', documents), ('metadatas', metadatas)):
+            if value is not None:
+                params[key] = value
+        self._count = None
+        return self.collection.upsert(**params)
+
+    def delete(self, ids):
+        self._count = None
+        return self.collection.delete(ids=ids)
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        params = {'include': include if include is not None else ['metadatas', 'documents']}
+        for key, value in (('ids', ids), ('where', where), ('limit', limit), ('offset', offset)):
+            if value is not None:
+                params[key] = value
+        return self.collection.get(**params)
+
+    def count(self):
+        if self._count is None or time.monotonic() - self._counted_at > self.count_ttl:
+            self._count = self.collection.count()
+            self._counted_at = time.monotonic()
+        return self._count
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, include=None):
+        total = self.count()
+        queries = query_embeddings if query_embeddings is not None else query_texts
+        if total == 0:
+            return {'ids': [[] for _ in queries], 'distances': [[] for _ in queries],
+                    'metadatas': [[] for _ in queries]}
+        params = {'n_results': min(n_results, total),
+                  'include': include if include is not None else ['metadatas', 'distances']}
+        if query_embeddings is not None:
+            params['query_embeddings'] = query_embeddings
+        else:
+            params['query_texts'] = query_texts
+        if where:
+            params['where'] = where
+        return self.collection.query(**params)
+
+
+def _object_array(values):
+    # Tạo mảng object 1 chiều (tránh NumPy tự "bung" các giá trị dạng list thành mảng 2 chiều)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyVectorBackend(VectorBackend):
+    """
+    Kho Vector tìm kiếm vét cạn (Brute-force) chính xác, khoảng cách Cosine (`distance = 1 - cosine`).
+
+    Định dạng trên đĩa:
+    - `vectors.f32` : Ma trận float32 (sức chứa x dim) đã chuẩn hóa L2, mở bằng `numpy.memmap` (r+).
+                      Sức chứa tăng gấp đôi khi đầy; dòng của Vector đã xóa được tái sử dụng.
+    - `index.json`  : {"dim", "ids": [id hoặc null theo dòng], "metadatas": [...], "documents": [...]}.
+    - `index.lock`  : Khóa ghi giữa các tiến trình (nhiều Worker Gunicorn + Script CLI cùng đồng bộ).
+
+    Mỗi lần ghi giữ `index.lock` và nạp lại `index.json` nếu tiến trình khác vừa ghi, TRƯỚC khi cấp dòng mới,
+    nên 2 tiến trình không bao giờ cấp trùng 1 dòng hay ghi đè ID của nhau. Lần đọc cũng tự nạp lại khi
+    `index.json` đổi (so inode + mtime + kích thước), không cần khóa vì file được thay thế nguyên tử.
+    """
+    name = 'numpy'
+
+    def __init__(self, directory, dim, embedding_function=None, initial_capacity=1024):
+        self.directory = directory
+        self.dim = dim
+        self.embedding_function = embedding_function
+        self._lock = threading.RLock()
+        self._index_path = os.path.join(directory, INDEX_FILENAME)
+        self._vectors_path = os.path.join(directory, VECTORS_FILENAME)
+        self._lock_path = os.path.join(directory, LOCK_FILENAME)
+        self._initial_capacity = initial_capacity
+        self._columns = {}
+        self._index_stamp = None
+
+        os.makedirs(directory, exist_ok=True)
+        with interprocess_lock(self._lock_path):
+            self._reload()
+
+    def _reload(self):
+        """Nạp (lại) `index.json` + ánh xạ lại `vectors.f32` từ đĩa."""
+        self._index_stamp = file_stamp(self._index_path)
+        self._ids, self._metadatas, self._documents = self._load_index()
+        rows_on_disk = os.path.getsize(self._vectors_path) // (self.dim * 4) if os.path.exists(self._vectors_path) else 0
+        if rows_on_disk < len(self._ids):
+            # Thiếu file Vector (hỏng / bị xóa tay) -> Bắt đầu lại từ đầu thay vì trả kết quả sai
+            self._ids, self._metadatas, self._documents = [], [], []
+        self._row_of = {vid: row for row, vid in enumerate(self._ids) if vid is not None}
+        self._free_rows = [row for row, vid in enumerate(self._ids) if vid is None]
+        self._matrix = self._open_matrix(max(self._initial_capacity, rows_on_disk, len(self._ids)))
+        # Mặt nạ dòng còn sống có cùng sức chứa với ma trận (tăng gấp đôi cùng lúc, không nối từng dòng)
+        self._alive = np.zeros(self._matrix.shape[0], dtype=bool)
+        self._alive[:len(self._ids)] = [vid is not None for vid in self._ids]
+        self._columns.clear()
+
+    def _refresh(self):
+        # Tiến trình khác vừa ghi `index.json` -> Nạp lại trước khi đọc / cấp dòng (gọi khi đang giữ self._lock)
+        if file_stamp(self._index_path) != self._index_stamp:
+            self._reload()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return [], [], []
+        if data.get('dim') != self.dim:
+            print(f"⚠️ Numpy Vector Store ({self.directory}) khác số chiều, bỏ qua dữ liệu cũ.")
+            if os.path.exists(self._vectors_path):
+                os.remove(self._vectors_path)
+            return [], [], []
+        return data.get('ids', []), data.get('metadatas', []), data.get('documents', [])
+
+    def _open_matrix(self, capacity):
+        required = capacity * self.dim * 4
+        if not os.path.exists(self._vectors_path) or os.path.getsize(self._vectors_path) < required:
+            with open(self._vectors_path, 'ab') as f:
+                f.truncate(required)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _save_index(self):
+        self._matrix.flush()
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'ids': self._ids, 'metadatas': self._metadatas,
+                       'documents': self._documents}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+        self._index_stamp = file_stamp(self._index_path)
+
+    def _allocate_row(self):
+        if self._free_rows:
+            return self._free_rows.pop()
+        row = len(self._ids)
+        if row >= self._matrix.shape[0]:
+            self._matrix.flush()
+            self._matrix = self._open_matrix(self._matrix.shape[0] * 2)
+            self._alive = np.concatenate([self._alive, np.zeros(self._matrix.shape[0] - len(self._alive), dtype=bool)])
+        self._ids.append(None)
+        self._metadatas.append(None)
+        self._documents.append(None)
+        return row
+
+    def _embed(self, texts):
+        if self.embedding_function is None:
+            raise ValueError("NumpyVectorBackend chưa có embedding_function để nhúng văn bản")
+        return self.embedding_function(list(texts))
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        if embeddings is None:
+            embeddings = self._embed(documents)
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), self.dim))
+        with self._lock, interprocess_lock(self._lock_path):
+            self._refresh()
+            for i, vid in enumerate(ids):
+                vid = str(vid)
+                row = self._row_of.get(vid)
+                if row is None:
+                    row = self._allocate_row()
+                    self._row_of[vid] = row
+                    self._ids[row] = vid
+                    self._alive[row] = True
+                self._matrix[row] = vectors[i]
+                if metadatas is not None:
+                    self._metadatas[row] = metadatas[i]
+                if documents is not None:
+                    self._documents[row] = documents[i]
+            self._columns.clear()
+            self._save_index()
+
+    def delete(self, ids):
+        with self._lock, interprocess_lock(self._lock_path):
+            self._refresh()
+            for vid in ids:
+                row = self._row_of.pop(str(vid), None)
+                if row is None:
+                    continue
+                self._ids[row] = self._metadatas[row] = self._documents[row] = None
+                self._alive[row] = False
+                self._free_rows.append(row)
+            self._columns.clear()
+            self._save_index()
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    # ---------------------------------------------------------------
+    # Lọc Metadata bằng mặt nạ Boolean (hỗ trợ tập con cú pháp `where` của ChromaDB)
+    # ---------------------------------------------------------------
+    def _column(self, field):
+        """Cột Metadata dạng mảng NumPy (object), nhớ tạm cho tới lần ghi tiếp theo."""
+        column = self._columns.get(field)
+        if column is None or len(column) != len(self._ids):
+            column = _object_array([(m or {}).get(field) for m in self._metadatas])
+            self._columns[field] = column
+        return column
+
+    def _numeric_column(self, field):
+        key = ('#', field)
+        column = self._columns.get(key)
+        if column is None or len(column) != len(self._ids):
+            column = np.array([v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                               for v in self._column(field)], dtype=np.float64)
+            self._columns[key] = column
+        return column
+
+    def _mask(self, where):
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key == '$and':
+                for sub in condition:
+                    mask &= self._mask(sub)
+                continue
+            if key == '$or':
+                any_mask = np.zeros(len(self._ids), dtype=bool)
+                for sub in condition:
+                    any_mask |= self._mask(sub)
+                mask &= any_mask
+                continue
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for op, value in condition.items():
+                if op in ('$gt', '$gte', '$lt', '$lte'):
+                    column = self._numeric_column(key)
+                    with np.errstate(invalid='ignore'):
+                        mask &= {'$gt': column > value, '$gte': column >= value,
+                                 '$lt': column < value, '$lte': column <= value}[op]
+                elif op == '$eq':
+                    mask &= self._column(key) == value
+                elif op == '$ne':
+                    mask &= self._column(key) != value
+                elif op in ('$in', '$nin'):
+                    hit = np.isin(self._column(key), _object_array(list(value)))
+                    mask &= hit if op == '$in' else ~hit
+                else:
+                    raise ValueError(f"Toán tử lọc không hỗ trợ: {op}")
+        return mask
+
+    def _candidate_mask(self, where):
+        mask = self._alive[:len(self._ids)].copy()
+        if where:
+            mask &= self._mask(where)
+        return mask
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        include = include if include is not None else ['metadatas', 'documents']
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self._row_of[str(v)] for v in ids if str(v) in self._row_of]
+                if where:
+                    mask = self._mask(where)
+                    rows = [r for r in rows if mask[r]]
+            else:
+                rows = np.flatnonzero(self._candidate_mask(where)).tolist()
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            result = {'ids': [self._ids[r] for r in rows]}
+            if 'metadatas' in include:
+                result['metadatas'] = [self._metadatas[r] for r in rows]
+            if 'documents' in include:
+                result['documents'] = [self._documents[r] for r in rows]
+            if 'embeddings' in include:
+                result['embeddings'] = np.asarray(self._matrix[rows]).tolist()
+            return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, include=None):
+        include = include if include is not None else ['metadatas', 'distances']
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts)
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim))
+        result = {'ids': [], 'distances': [], 'metadatas': []}
+
+        with self._lock:
+            self._refresh()
+            used = len(self._ids)
+            mask = self._candidate_mask(where)
+            candidates = int(mask.sum())
+            k = min(n_results, candidates)
+            # Chỉ nhân với phần ma trận đã dùng; dòng bị loại (đã xóa / không khớp bộ lọc) gán -inf
+            scores = queries @ np.asarray(self._matrix[:used]).T if used else np.empty((len(queries), 0), np.float32)
+            scores[:, ~mask] = -np.inf
+            for row_scores in scores:
+                if k <= 0:
+                    top = np.empty(0, dtype=np.int64)
+                elif k < used:
+                    top = np.argpartition(-row_scores, k - 1)[:k]
+                    top = top[np.argsort(-row_scores[top], kind='stable')]
+                else:
+                    top = np.argsort(-row_scores, kind='stable')[:k]
+                result['ids'].append([self._ids[r] for r in top])
+                result['distances'].append([float(1.0 - row_scores[r]) for r in top])
+                result['metadatas'].append([self._metadatas[r] for r in top])
+
+        return {key: value for key, value in result.items() if key == 'ids' or key in include}
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                'backend': self.name,
+                'vectors': self.count(),
+                'capacity': int(self._matrix.shape[0]),
+                'free_rows': len(self._free_rows),
+                'disk_bytes': int(self._matrix.shape[0]) * self.dim * 4
+            }
@@ -3,7 +3,9 @@ import os
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
 import chromadb
-from chromadb.utils import embedding_functions
+
+from app.ai_resources import get_text_embedder
+from app.constants import TEXT_VECTOR_SYNC_BATCH_SIZE
 
 # =========================================================================
 # [HOTFIX] Khóa mõm triệt để lỗi rác Telemetry của ChromaDB 0.4.22
@@ -32,9 +34,10 @@ class AIVectorManager:
                 path=db_path,
                 settings=chromadb.Settings(anonymized_telemetry=False)
             )
+            self._embedder = self._get_embedding_function()
             self.collection = self.client.get_or_create_collection(
                 name=collection_name,
-                embedding_function=self._get_embedding_function()
+                embedding_function=self._embedder
             )
         except Exception as e:
             print(f"Vector DB Init Error: {e}")
@@ -42,40 +45,49 @@ class AIVectorManager:
 
     def _get_embedding_function(self):
         """Hàm nhúng (Embedding) Offline đa ngôn ngữ (Tiết kiệm 100% API Quota)"""
+        # Dùng chung Model MiniLM với Vector DB sản phẩm thay vì nạp thêm 1 bản ~400MB vào RAM
+        embedder = get_text_embedder()
+        if embedder is None:
+            raise RuntimeError("Text Embedding Model không khả dụng")
+        return embedder
 
-        class LocalEmbed(embedding_functions.EmbeddingFunction):
-            def __init__(self):
-                # Tải model đa ngôn ngữ cực nhẹ (~400MB) vào RAM, chạy siêu tốc trên máy
-                self.ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="paraphrase-multilingual-MiniLM-L12-v2")
-
-            def __call__(self, input: list[str]) -> list[list[float]]:
-                try:
-                    return self.ef(input)
-                except Exception as e:
-                    print(f"Local Embedding API Error: {e}")
-                    # Trả về vector rỗng (384 chiều) nếu lỗi để không gãy hệ thống
-                    return [[0.0] * 384] * len(input)
-
-        return LocalEmbed()
+    @staticmethod
+    def _semantic_text(name, brand, category, description, price):
+        # Tiền xử lý dữ liệu (Làm sạch chuỗi)
+        clean_desc = str(description).replace('\n', ' ').strip()
+        return f"Sản phẩm {name}, hãng {brand}, loại {category}. Cấu hình/Tính năng: {clean_desc}. Giá bán: {price} VNĐ."
 
     def add_product_to_brain(self, product_id, name, brand, category, description, price):
         """Đưa kiến thức về 1 sản phẩm vào não bộ AI"""
-        if not self.collection: return False
+        return self.add_products_to_brain([{
+            "product_id": product_id, "name": name, "brand": brand,
+            "category": category, "description": description, "price": price
+        }]) == 1
 
-        # Tiền xử lý dữ liệu (Làm sạch chuỗi)
-        clean_desc = str(description).replace('\n', ' ').strip()
-        semantic_text = f"Sản phẩm {name}, hãng {brand}, loại {category}. Cấu hình/Tính năng: {clean_desc}. Giá bán: {price} VNĐ."
+    def add_products_to_brain(self, products, batch_size=TEXT_VECTOR_SYNC_BATCH_SIZE):
+        """
+        Đưa kiến thức về nhiều sản phẩm vào não bộ AI (mỗi phần tử là dict cùng tham số với `add_product_to_brain`).
+        Nhúng + Upsert theo lô. Trả về số sản phẩm đã lưu thành công.
+        """
+        if not self.collection: return 0
 
-        try:
-            self.collection.upsert(
-                documents=[semantic_text],
-                metadatas=[{"price": price, "brand": brand, "category": category}],
-                ids=[str(product_id)]
-            )
-            return True
-        except Exception as e:
-            print(f"Failed to add to AI Brain: {e}")
-            return False
+        products = list(products)
+        saved = 0
+        for i in range(0, len(products), batch_size):
+            batch = products[i:i + batch_size]
+            try:
+                documents = [self._semantic_text(p["name"], p["brand"], p["category"], p["description"], p["price"])
+                             for p in batch]
+                self.collection.upsert(
+                    embeddings=self._embedder(documents),
+                    documents=documents,
+                    metadatas=[{"price": p["price"], "brand": p["brand"], "category": p["category"]} for p in batch],
+                    ids=[str(p["product_id"]) for p in batch]
+                )
+                saved += len(batch)
+            except Exception as e:
+                print(f"Failed to add to AI Brain: {e}")
+        return saved
 
     def check_brain_health(self):
         """Kiểm tra sức khỏe và dung lượng của não bộ AI"""
@@ -0,0 +1,131 @@
+"""
+Module Đồng bộ hàng loạt Vector Ảnh (Bulk CLIP Indexer) của MobileStore.
+Thay cho việc gọi `sync_product_image_to_vector_db` lần lượt từng sản phẩm
+(tải ảnh tuần tự -> CLIP 1 ảnh/lượt -> Upsert 1 dòng), pipeline này:
+1. Tải + giải mã + tiền xử lý ảnh song song trên Thread Pool có giới hạn.
+   Ảnh đã có trong Kho Vector theo nội dung (SHA-256 / ETag không đổi) bỏ qua bước CLIP.
+2. Gom ảnh thành lô (Mini-batch) và chạy CLIP 1 lượt Forward cho cả lô.
+3. Upsert cả lô vào `product_image_collection` bằng 1 lệnh duy nhất.
+"""
+
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from app.constants import VISUAL_SYNC_DOWNLOAD_WORKERS, VISUAL_SYNC_BATCH_SIZE
+from app.utils import (
+    get_clip_runtime,
+    get_product_image_collection,
+    fetch_image_with_cache,
+    remember_image_embeddings,
+    preprocess_images,
+    embed_pixel_values
+)
+
+
+def _download_and_preprocess(url, clip):
+    """
+    Chạy trên luồng phụ: trả về (sha256, vector_có_sẵn, tensor_ảnh) - chỉ 1 trong 2 phần sau khác None,
+    hoặc None nếu ảnh lỗi / link chết.
+    """
+    try:
+        fetched = fetch_image_with_cache(url)
+        if fetched is None:
+            return None
+        if fetched.vector is not None:
+            return fetched.sha256, fetched.vector, None
+        return fetched.sha256, None, preprocess_images(fetched.image, clip)
+    except Exception as e:
+        print(f"⚠️ Bỏ qua ảnh lỗi ({url[:60]}): {e}")
+        return None
+
+
+def _flush_batch(collection, clip, batch):
+    """Nhúng các ảnh chưa có Vector trong lô + Upsert cả lô. Trả về số ảnh đã lưu thành công."""
+    try:
+        to_embed = [i for i, item in enumerate(batch) if item[3] is None]
+        vectors = [item[3] for item in batch]
+        if to_embed:
+            pixel_values = np.concatenate([batch[i][4] for i in to_embed])
+            for i, vector in zip(to_embed, embed_pixel_values(pixel_values, clip)):
+                vectors[i] = vector
+            remember_image_embeddings([(batch[i][2], vectors[i]) for i in to_embed])
+        collection.upsert(
+            embeddings=vectors,
+            metadatas=[item[1] for item in batch],
+            ids=[item[0] for item in batch]
+        )
+        return len(batch)
+    except Exception as e:
+        print(f"⚠️ Lỗi lưu lô Vector Ảnh vào ChromaDB: {e}")
+        return 0
+
+
+def bulk_sync_product_images(products, batch_size=VISUAL_SYNC_BATCH_SIZE, workers=VISUAL_SYNC_DOWNLOAD_WORKERS):
+    """
+    Đồng bộ Vector Ảnh cho nhiều sản phẩm cùng lúc.
+    Số ảnh đang tải/chờ nhúng luôn bị chặn trên (workers + batch_size) để RAM không phình to
+    khi CLIP chạy chậm hơn tốc độ tải ảnh.
+    Trả về thống kê {'indexed', 'reused', 'failed', 'skipped', 'seconds'}
+    (`reused`: số ảnh lấy lại Vector từ Kho, không phải chạy CLIP).
+    """
+    started = time.perf_counter()
+    stats = {'indexed': 0, 'reused': 0, 'failed': 0, 'skipped': 0, 'seconds': 0.0}
+
+    collection = get_product_image_collection()
+    clip = get_clip_runtime()
+    if not collection or clip is None:
+        stats['skipped'] = len(products)
+        return stats
+
+    # Chụp dữ liệu cần dùng ngay trên luồng chính (Object SQLAlchemy không an toàn đa luồng)
+    jobs = []
+    seen = set()
+    for p in products:
+        if not p.image_url or p.id in seen:
+            stats['skipped'] += 1
+            continue
+        seen.add(p.id)
+        jobs.append((str(p.id), p.image_url, {"name": p.name, "brand": p.brand}))
+
+    max_pending = workers + batch_size
+    pending = {}
+    batch = []
+    job_iter = iter(jobs)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clip-download') as pool:
+        while True:
+            while len(pending) < max_pending:
+                job = next(job_iter, None)
+                if job is None:
+                    break
+                pending[pool.submit(_download_and_preprocess, job[1], clip)] = job
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                product_id, _, metadata = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    stats['failed'] += 1
+                    continue
+                digest, vector, pixel_values = result
+                if vector is not None:
+                    stats['reused'] += 1
+                batch.append((product_id, metadata, digest, vector, pixel_values))
+
+                if len(batch) >= batch_size:
+                    saved = _flush_batch(collection, clip, batch)
+                    stats['indexed'] += saved
+                    stats['failed'] += len(batch) - saved
+                    batch = []
+                    print(f"📸 Đã nhúng {stats['indexed']}/{len(jobs)} ảnh sản phẩm (CLIP Batch)...")
+
+    if batch:
+        saved = _flush_batch(collection, clip, batch)
+        stats['indexed'] += saved
+        stats['failed'] += len(batch) - saved
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
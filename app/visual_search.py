@@ -0,0 +1,139 @@
+"""
+Module Điều phối Tìm kiếm bằng Hình ảnh song song (Parallel Visual Search) của MobileStore.
+Tầng Gemini Vision (đọc tên máy, thường mất vài giây) và Tầng CLIP (Vector hình dáng) cùng khởi động
+ngay khi nhận ảnh, trên cùng 1 ảnh đã giải mã sẵn (`PreparedImage`, xem app/image_pipeline.py). Route chỉ chờ tối đa 1 hạn chót chung:
+- Gemini trả lời kịp và đủ tự tin -> Dùng bộ so khớp chính xác dòng máy.
+- Ngược lại -> Kết quả CLIP thường đã tính xong, trả về ngay không phải chạy nối tiếp.
+Độ trễ xấu nhất ~ tầng chậm hơn trong 2 tầng (thay vì tổng 2 tầng), và không vượt quá hạn chót.
+Kết quả của từng tầng được ghi vào Bộ đệm theo dấu vân tay ảnh (`ImageSearchCache`) ngay trên luồng nền
+(kể cả khi Route đã thôi chờ), nên lần gửi lại cùng ảnh không tốn Quota Gemini Vision lẫn lượt chạy CLIP.
+"""
+
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+
+from app.constants import VISUAL_SEARCH_DEADLINE_SECONDS, VISUAL_SEARCH_WORKERS
+from app.ai_cache import ai_cache_namespace
+from app.search_engine import get_search_result_cache
+from app.image_search_cache import ImageSearchCache, image_fingerprint
+
+
+class VisualSearchJob:
+    """1 lượt tìm kiếm bằng ảnh: 2 tầng đang chạy nền + mốc hạn chót chung."""
+
+    def __init__(self, runner, gemini_future, clip_future, deadline_at, cache_hit=None):
+        self._runner = runner
+        self._gemini_future = gemini_future
+        self._clip_future = clip_future
+        self.deadline_at = deadline_at
+        # 'exact' / 'perceptual' nếu ít nhất 1 tầng được lấy từ Bộ đệm ảnh
+        self.cache_hit = cache_hit
+        self.gemini_timed_out = False
+        self.clip_timed_out = False
+
+    def _wait(self, future, tier):
+        remaining = max(0.0, self.deadline_at - time.monotonic())
+        try:
+            return future.result(timeout=remaining), False
+        except FutureTimeoutError:
+            self._runner._record(f'{tier}_timeouts')
+            return None, True
+        except Exception as e:
+            print(f"⚠️ Tầng nhận diện ảnh [{tier}] lỗi: {e}")
+            self._runner._record(f'{tier}_errors')
+            return None, False
+
+    def gemini_result(self):
+        """Kết quả Gemini Vision (dict) hoặc None nếu lỗi / quá hạn chót."""
+        result, self.gemini_timed_out = self._wait(self._gemini_future, 'gemini')
+        return result
+
+    def clip_result(self):
+        """Danh sách ID sản phẩm giống nhất theo CLIP (đã tính song song), rỗng nếu lỗi / quá hạn chót."""
+        result, self.clip_timed_out = self._wait(self._clip_future, 'clip')
+        return result or []
+
+    def discard_clip(self):
+        """Không cần tầng CLIP nữa (Gemini đã khớp chính xác) -> Hủy nếu luồng nền chưa kịp chạy."""
+        self._clip_future.cancel()
+
+
+class VisualSearchRunner:
+    """
+    Bộ điều phối gắn với 1 Flask App (Thread Pool dùng chung cho mọi request).
+    Hàm nhận diện được truyền vào từ Route để giữ nguyên điểm Mock của Unit Test
+    (`app.routes.main.identify_phone_by_gemini` / `search_image_vector_db`).
+    """
+
+    def __init__(self, app, max_workers=VISUAL_SEARCH_WORKERS, cache=None):
+        self.app = app
+        self.cache = cache if cache is not None else ImageSearchCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='visual-search')
+        self._lock = threading.Lock()
+        self.counters = {'jobs': 0, 'gemini_timeouts': 0, 'clip_timeouts': 0, 'gemini_errors': 0, 'clip_errors': 0,
+                         'gemini_calls_saved': 0, 'clip_calls_saved': 0}
+
+    @property
+    def deadline_seconds(self):
+        return float(self.app.config.get('VISUAL_SEARCH_DEADLINE_SECONDS') or VISUAL_SEARCH_DEADLINE_SECONDS)
+
+    def _record(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _run_tier(self, func, prepared, kwargs, store):
+        # Các tầng dùng chung ảnh đã giải mã (chỉ đọc), chạy trong App Context của luồng nền.
+        # Ghi Cache trước khi Future hoàn tất -> Lần gửi lại ngay sau đó chắc chắn trúng Cache
+        with self.app.app_context():
+            result = func(prepared, **kwargs)
+        if result:
+            store(result)
+        return result
+
+    @staticmethod
+    def _completed(value):
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def start(self, prepared, gemini_identifier, clip_searcher, n_results=5):
+        self._record('jobs')
+        deadline_at = time.monotonic() + self.deadline_seconds
+        fingerprint = image_fingerprint(prepared.raw_bytes, prepared.image)
+        namespace = ai_cache_namespace(gemini_identifier)
+        catalog_version = get_search_result_cache().version
+        hit = self.cache.lookup(fingerprint, namespace, catalog_version, n_results)
+
+        if hit is not None and hit.gemini is not None:
+            self._record('gemini_calls_saved')
+            gemini_future = self._completed(hit.gemini)
+        else:
+            gemini_future = self._executor.submit(
+                self._run_tier, gemini_identifier, prepared, {},
+                lambda result: self.cache.store_gemini(fingerprint, namespace, result))
+
+        if hit is not None and hit.clip_ids is not None:
+            self._record('clip_calls_saved')
+            clip_future = self._completed(hit.clip_ids)
+        else:
+            clip_future = self._executor.submit(
+                self._run_tier, clip_searcher, prepared, {'n_results': n_results},
+                lambda ids: self.cache.store_clip(fingerprint, ids, catalog_version, n_results))
+
+        return VisualSearchJob(self, gemini_future, clip_future, deadline_at,
+                               cache_hit=hit.kind if hit is not None else None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, deadline_seconds=self.deadline_seconds, cache=self.cache.stats())
+
+
+def get_visual_search_runner():
+    """Lấy bộ điều phối Visual Search gắn với Flask App hiện tại (Lazy Init trong `app.extensions`)."""
+    app = current_app._get_current_object()
+    runner = app.extensions.get('visual_search_runner')
+    if runner is None:
+        runner = app.extensions.setdefault('visual_search_runner', VisualSearchRunner(app))
+    return runner
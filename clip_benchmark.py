@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+# =========================================================================
+# Ép Terminal của Windows đọc được Emoji và Màu sắc UTF-8
+# =========================================================================
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+    except Exception:
+        pass
+
+
+class Colors:
+    HEADER = '\033[95m'
+    BLUE = '\033[94m'
+    CYAN = '\033[96m'
+    GREEN = '\033[92m'
+    WARNING = '\033[93m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+
+
+SAMPLE_IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'uploads')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def current_rss_kb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+def load_sample_images(image_dir, limit):
+    """Ảnh mẫu từ thư mục uploads; không có thì sinh ảnh ngẫu nhiên (cố định Seed để so Parity)."""
+    from PIL import Image
+    paths = sorted(p for p in os.listdir(image_dir) if p.lower().endswith(IMAGE_EXTENSIONS)) if os.path.isdir(image_dir) else []
+    images = []
+    for name in paths[:limit]:
+        try:
+            images.append(Image.open(os.path.join(image_dir, name)).convert('RGB'))
+        except Exception:
+            continue
+    rng = np.random.default_rng(42)
+    while len(images) < limit:
+        images.append(Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)))
+    return images
+
+
+def run_single_backend(backend, image_dir, limit, batch_size, output_path):
+    """
+    Chạy trong tiến trình con riêng để đo RSS của từng Backend một cách độc lập.
+    Ghi Vector (đã chuẩn hóa) ra file .npy và số liệu ra stdout (JSON).
+    """
+    rss_start = current_rss_kb()
+    load_started = time.perf_counter()
+    from app.ai_resources import build_clip_runtime
+    from app.utils import preprocess_images, embed_pixel_values
+    clip = build_clip_runtime(backend)
+    load_seconds = time.perf_counter() - load_started
+    rss_loaded = current_rss_kb()
+
+    images = load_sample_images(image_dir, limit)
+    pixel_values = preprocess_images(images, clip)
+
+    # Warm-up 1 lượt để không tính chi phí khởi tạo Kernel vào độ trễ
+    embed_pixel_values(pixel_values[:1], clip)
+
+    single_latencies = []
+    for i in range(len(images)):
+        started = time.perf_counter()
+        embed_pixel_values(pixel_values[i:i + 1], clip)
+        single_latencies.append((time.perf_counter() - started) * 1000)
+
+    vectors = []
+    batch_started = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        vectors.extend(embed_pixel_values(pixel_values[i:i + batch_size], clip))
+    batch_seconds = time.perf_counter() - batch_started
+
+    np.save(output_path, np.asarray(vectors, dtype=np.float32))
+    return {
+        'backend': clip.backend,
+        'device': clip.device,
+        'load_seconds': round(load_seconds, 2),
+        'latency_p50_ms': round(float(np.percentile(single_latencies, 50)), 2),
+        'latency_p95_ms': round(float(np.percentile(single_latencies, 95)), 2),
+        'batch_images_per_second': round(len(images) / batch_seconds, 2) if batch_seconds else None,
+        'rss_model_kb': (rss_loaded - rss_start) if None not in (rss_loaded, rss_start) else None,
+        'rss_peak_kb': current_rss_kb()
+    }
+
+
+def compare_backends(backends, image_dir, limit, batch_size):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            output_path = os.path.join(tmp, f"{backend}.npy")
+            print(f"{Colors.CYAN}⏳ Đang đo Backend [{backend}]...{Colors.ENDC}")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', backend, '--images', image_dir,
+                 '--limit', str(limit), '--batch-size', str(batch_size), '--output', output_path],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"{Colors.WARNING}⚠️ Backend [{backend}] lỗi:{Colors.ENDC}\n{proc.stderr[-800:]}")
+                continue
+            metrics = json.loads(proc.stdout.strip().splitlines()[-1])
+            metrics['vectors'] = np.load(output_path)
+            results[backend] = metrics
+
+    reference = results.get('torch')
+    print(f"\n{Colors.HEADER}{Colors.BOLD}📊 CLIP BACKEND PARITY & BENCHMARK ({limit} ảnh){Colors.ENDC}")
+    print(f"{'Backend':<8} {'Cos mean':>9} {'Cos min':>8} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'RSS MB':>8} {'Load s':>7}")
+    report = {}
+    for backend, m in results.items():
+        cos_mean = cos_min = None
+        if reference is not None:
+            # Vector đã chuẩn hóa L2 -> Cosine = tích vô hướng từng dòng
+            cosines = np.sum(reference['vectors'] * m['vectors'], axis=1)
+            cos_mean, cos_min = round(float(cosines.mean()), 5), round(float(cosines.min()), 5)
+        rss_mb = round(m['rss_model_kb'] / 1024, 1) if m['rss_model_kb'] is not None else None
+        print(f"{backend:<8} {str(cos_mean):>9} {str(cos_min):>8} {m['latency_p50_ms']:>8} {m['latency_p95_ms']:>8} "
+              f"{str(m['batch_images_per_second']):>8} {str(rss_mb):>8} {m['load_seconds']:>7}")
+        report[backend] = {k: v for k, v in m.items() if k != 'vectors'}
+        report[backend].update({'cosine_mean_vs_torch': cos_mean, 'cosine_min_vs_torch': cos_min})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh Parity + Benchmark các Backend suy luận CLIP (torch / int8 / onnx).")
+    parser.add_argument('--backends', default='torch,int8,onnx')
+    parser.add_argument('--images', default=SAMPLE_IMAGE_DIR, help="Thư mục ảnh mẫu")
+    parser.add_argument('--limit', type=int, default=32, help="Số ảnh dùng để đo")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--report', default=None, help="Ghi kết quả ra file JSON")
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        metrics = run_single_backend(args.worker, args.images, args.limit, args.batch_size, args.output)
+        print(json.dumps(metrics))
+        return
+
+    report = compare_backends([b.strip() for b in args.backends.split(',') if b.strip()],
+                              args.images, args.limit, args.batch_size)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n{Colors.GREEN}✅ Đã ghi báo cáo: {args.report}{Colors.ENDC}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
+import sys
 from app import create_app, db, initialize_database
 from app.models import Product
-from app.utils import sync_product_to_vector_db
+from app.text_indexer import incremental_sync_products_to_vector_db
+from app.visual_indexer import bulk_sync_product_images
 
 # Khởi tạo App Context để truy cập Database
 app = create_app()
 
 
-def sync_all():
+def sync_all(include_images=False, full=False):
     """
     Quét toàn bộ DB và đẩy vào Vector DB (ChromaDB).
-    Chạy script này sau khi khởi tạo DB hoặc khi muốn re-index lại từ đầu.
+    Mặc định chạy tăng dần: chỉ nhúng lại sản phẩm có nội dung thay đổi, xóa Vector của sản phẩm
+    đã bị xóa / ngừng bán. Thêm tham số `--full` để nhúng lại từ đầu (VD: sau khi đổi Model nhúng).
+    Thêm tham số `--images` để nhúng lại toàn bộ ảnh sản phẩm (CLIP theo lô).
     """
     with app.app_context():
         # Đảm bảo CSDL được tạo trước khi truy vấn, chống lỗi "no such table: product"
@@ -17,16 +21,18 @@ def sync_all():
 
         print("🔄 Đang đồng bộ dữ liệu sang Vector Database (ChromaDB)...")
         products = Product.query.all()
-        count = 0
-        for p in products:
-            # Chỉ đồng bộ sản phẩm đang hoạt động
-            if p.is_active:
-                sync_product_to_vector_db(p)
-                count += 1
-                # ---> [HOTFIX]: Đã tháo bỏ gông xiềng time.sleep(2.5) vì chạy Local không sợ tốn Quota!
+        # Truyền cả sản phẩm ngừng bán để Vector của chúng được dọn khỏi ChromaDB
+        result = incremental_sync_products_to_vector_db(products, force=full)
 
-        print(f"✅ Đã đồng bộ thành công {count} sản phẩm vào ChromaDB!")
+        print(f"✅ Đồng bộ ChromaDB xong trong {result['seconds']}s: Thêm {result['added']}, Cập nhật {result['updated']}, "
+              f"Xóa {result['deleted']}, Bỏ qua (không đổi) {result['skipped']}, Lỗi {result['failed']} "
+              f"~ {result['docs_per_second']} sản phẩm/giây!")
+
+        if include_images:
+            print("🔄 Đang nhúng lại Vector Ảnh (CLIP) cho toàn bộ sản phẩm...")
+            result = bulk_sync_product_images([p for p in products if p.is_active])
+            print(f"✅ Đã đồng bộ {result['indexed']} ảnh (Lỗi: {result['failed']}) trong {result['seconds']}s!")
 
 
 if __name__ == "__main__":
-    sync_all()
\ No newline at end of file
+    sync_all(include_images='--images' in sys.argv, full='--full' in sys.argv)
\ No newline at end of file
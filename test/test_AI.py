@@ -458,9 +458,9 @@ class AIFeaturesTestCase(unittest.TestCase):
     # ==============================================================================
     # ---> [NEW] TEST TÍNH NĂNG TÌM KIẾM BẰNG HÌNH ẢNH (VISUAL SEARCH) <---
     # ==============================================================================
-    @patch('app.utils.product_image_collection')
+    @patch('app.utils.get_product_image_collection')
     @patch('app.utils.get_image_embedding')
-    def test_visual_search_logic(self, mock_get_embedding, mock_collection):
+    def test_visual_search_logic(self, mock_get_embedding, mock_get_collection):
         """
         Kiểm tra luồng Tìm kiếm bằng hình ảnh (Visual AI).
         Mục tiêu: Đảm bảo thuật toán gọi đúng hàm nhúng (Embedding MobileNetV2)
@@ -470,6 +470,7 @@ class AIFeaturesTestCase(unittest.TestCase):
 
         # Kịch bản 1: AI nhúng ảnh thành Vector thành công, ChromaDB tìm được ảnh giống
         mock_get_embedding.return_value = [0.1, 0.2, 0.3] # Giả lập vector đặc trưng
+        mock_collection = mock_get_collection.return_value
         mock_collection.query.return_value = {'ids': [[str(self.p1_id), str(self.p3_id)]]}
 
         # Giả lập tham số image_file
@@ -485,7 +486,7 @@ class AIFeaturesTestCase(unittest.TestCase):
         self.assertEqual(len(empty_ids), 0)
 
         # Kịch bản 3: Bộ sưu tập chưa được khởi tạo (Database sập) -> Bắt lỗi Try/Catch an toàn
-        with patch('app.utils.product_image_collection', None):
+        with patch('app.utils.get_product_image_collection', return_value=None):
             mock_get_embedding.return_value = [0.1]
             safe_empty = search_image_vector_db("test.jpg")
             self.assertEqual(len(safe_empty), 0)
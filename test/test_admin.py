@@ -1,9 +1,12 @@
 import unittest
 import io
+import threading
 import pandas as pd
+from unittest.mock import patch
 from werkzeug.security import generate_password_hash
 from app import create_app, db
 from app.models import User, Product, Order, OrderDetail, TradeInRequest, Comment
+from app.product_vector_sync import get_product_vector_sync
 
 
 class AdminDashboardTestCase(unittest.TestCase):
@@ -14,6 +17,7 @@ class AdminDashboardTestCase(unittest.TestCase):
     - Quản lý Đơn hàng (Cập nhật trạng thái)
     - Quản lý Thu cũ đổi mới
     - Xuất file Excel Báo cáo doanh thu (Pandas)
+    - Đồng bộ Vector sản phẩm chạy nền sau khi Sửa (không chặn request của Admin)
     """
 
     def setUp(self):
@@ -150,6 +154,56 @@ class AdminDashboardTestCase(unittest.TestCase):
         self.assertEqual(updated_req.status, 'Approved')
         self.assertEqual(updated_req.valuation_price, 5000)
 
+    def test_admin_product_save_syncs_vectors_in_background(self):
+        """Kiểm tra Admin lưu sản phẩm trả về ngay, Vector đồng bộ ở luồng nền và gộp các lần lưu liên tiếp"""
+        print("\n[Admin Test 5] Kiểm tra Đồng bộ Vector chạy nền...")
+        self.app.config['PRODUCT_VECTOR_SYNC_INLINE'] = False
+        self.login('admin_vip', '123')
+        product = Product.query.filter_by(name='Test Phone 1').first()
+        cdn_released = threading.Event()
+        first_sync_started = threading.Event()
+        synced_names = []
+
+        def slow_image_sync(p):
+            # Giả lập CDN chậm: lượt đồng bộ đầu tiên bị treo cho tới khi Test cho phép
+            synced_names.append(p.name)
+            first_sync_started.set()
+            self.assertTrue(cdn_released.wait(5))
+
+        def edit(name):
+            return self.client.post(f'/admin/product/edit/{product.id}', data={
+                'name': name, 'brand': 'Apple', 'price': 1000, 'stock_quantity': 10, 'is_active': 'on'
+            })
+
+        sync_queue = get_product_vector_sync()
+        with patch('app.product_vector_sync.sync_product_to_vector_db') as mock_text_sync, \
+                patch('app.product_vector_sync.sync_product_image_to_vector_db', side_effect=slow_image_sync):
+            self.assertEqual(edit('Phone v1').status_code, 302)
+            self.assertTrue(first_sync_started.wait(5))
+            # Luồng nền đang treo vì CDN nhưng Admin vẫn lưu tiếp được ngay
+            self.assertEqual(edit('Phone v2').status_code, 302)
+            self.assertEqual(edit('Phone v3').status_code, 302)
+            cdn_released.set()
+            sync_queue.wait_pending(timeout=5)
+
+        # 3 lần lưu -> Chỉ 2 lượt đồng bộ: lượt đang chạy + đúng 1 lượt bù với dữ liệu mới nhất
+        self.assertEqual(synced_names, ['Phone v1', 'Phone v3'])
+        self.assertEqual(mock_text_sync.call_count, 2)
+        self.assertEqual(sync_queue.stats()['coalesced'], 2)
+
+        # Admin ẩn sản phẩm (bỏ tick is_active) -> Gỡ Vector thay vì Upsert lại
+        with patch('app.product_vector_sync.sync_product_to_vector_db') as mock_text_sync, \
+                patch('app.product_vector_sync.sync_product_image_to_vector_db') as mock_image_sync, \
+                patch('app.product_vector_sync.remove_product_from_vector_db') as mock_remove:
+            response = self.client.post(f'/admin/product/edit/{product.id}', data={
+                'name': 'Phone v3', 'brand': 'Apple', 'price': 1000, 'stock_quantity': 10
+            })
+            self.assertEqual(response.status_code, 302)
+            sync_queue.wait_pending(timeout=5)
+        mock_remove.assert_called_once_with(product.id)
+        mock_text_sync.assert_not_called()
+        mock_image_sync.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
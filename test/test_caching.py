@@ -0,0 +1,328 @@
+import sys
+import os
+
+# Thêm thư mục gốc vào đường dẫn hệ thống để Python tìm thấy 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
+from app import create_app, db
+from app.models import AICache
+from app.caching import TTLLRUCache, SingleFlight
+from app.ai_cache import AIResponseCache, get_ai_response_cache, ai_cache_namespace
+from app.routes.main import cached_ai_call
+from app.semantic_cache import SemanticCache, get_semantic_cache, prompt_signature
+from app.constants import SEMANTIC_CACHE_THRESHOLD
+from app.ai_resources import LazyResource
+from app.text_embedding import TextEmbeddingService, embed_query_text
+from app.utils import generate_chatbot_response
+
+
+def fake_embedder(texts):
+    """Embedding giả lập dạng túi từ (Bag-of-words): đảo thứ tự từ vẫn ra cùng 1 Vector."""
+    vectors = []
+    for text in texts:
+        vec = [0.0] * 32
+        for word in text.split():
+            vec[sum(map(ord, word)) % 32] += 1.0
+        vectors.append(vec)
+    return vectors
+
+
+class CachingPrimitivesTestCase(unittest.TestCase):
+    """
+    Test Suite cho các khối dựng Cache dùng chung:
+    1. TTLLRUCache: đẩy phần tử cũ (LRU), hết hạn (TTL) và bộ đếm Hit/Miss
+    2. SingleFlight: gộp các lời gọi trùng lặp chạy đồng thời
+    3. AIResponseCache: Cache phản hồi AI 2 tầng (RAM LRU + Bảng AICache), TTL và Sweeper
+    4. SemanticCache: Câu hỏi diễn đạt khác nhau nhưng cùng ý dùng chung câu trả lời
+    5. LazyResource: Model AI nặng chỉ nạp 1 lần ở lần dùng đầu tiên
+    6. TextEmbeddingService: Cache truy vấn + gom lô vi mô các truy vấn đồng thời
+    """
+
+    def test_ttl_lru_cache_eviction_and_stats(self):
+        print("\n[Cache Test 1] Testing TTL/LRU Cache...")
+        cache = TTLLRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'a' vừa dùng -> 'b' thành phần tử cũ nhất
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+
+        cache.set('d', 4, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('d'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['expirations'], 1)
+
+    def test_single_flight_coalesces_concurrent_calls(self):
+        print("\n[Cache Test 2] Testing Single-flight Request Coalescing...")
+        flight = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_gemini_call(prompt):
+            calls.append(prompt)
+            started.set()
+            release.wait(timeout=5)
+            return f"answer:{prompt}"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', slow_gemini_call, 'so sánh')))
+        leader.start()
+        started.wait(timeout=5)
+
+        followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow_gemini_call, 'so sánh')))
+                     for _ in range(4)]
+        for t in followers:
+            t.start()
+        # Chờ tất cả Follower đăng ký vào cùng lời gọi rồi mới cho Leader trả kết quả
+        while flight.stats()['coalesced'] < 4:
+            time.sleep(0.005)
+        release.set()
+        for t in [leader] + followers:
+            t.join(timeout=5)
+
+        self.assertEqual(calls, ['so sánh'])
+        self.assertEqual(results, ['answer:so sánh'] * 5)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+        # Lời gọi mới sau khi kết thúc phải chạy lại, và Exception được trả về cho Leader
+        def broken():
+            raise RuntimeError("quota")
+        with self.assertRaises(RuntimeError):
+            flight.do('k', broken)
+        self.assertEqual(flight.stats()['executed'], 2)
+
+        # Leader treo: Follower chỉ chờ tối đa `wait_timeout` rồi tự thực thi, không kẹt vô thời hạn
+        hung_flight = SingleFlight('hung', wait_timeout=0.05)
+        hung = threading.Event()
+        leader = threading.Thread(target=hung_flight.do, args=('k', lambda: hung.wait(timeout=5)))
+        leader.start()
+        while hung_flight.stats()['in_flight'] < 1:
+            time.sleep(0.005)
+        started_at = time.monotonic()
+        self.assertEqual(hung_flight.do('k', lambda: 'direct'), 'direct')
+        self.assertLess(time.monotonic() - started_at, 1)
+        hung.set()
+        leader.join(timeout=5)
+        stats = hung_flight.stats()
+        self.assertEqual((stats['wait_timeouts'], stats['coalesced'], stats['executed']), (1, 1, 2))
+
+    def test_two_tier_ai_response_cache(self):
+        print("\n[Cache Test 3] Testing Two-tier AI Response Cache...")
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            try:
+                fake_compare = MagicMock(return_value={'html': '<table></table>'})
+                fake_compare.__name__ = 'get_comparison_result'
+
+                for _ in range(3):
+                    self.assertEqual(cached_ai_call(fake_compare, 1, 2), {'html': '<table></table>'})
+                self.assertEqual(fake_compare.call_count, 1)
+                self.assertEqual(AICache.query.count(), 1)
+
+                stats = get_ai_response_cache().stats()
+                self.assertEqual((stats['memory_hits'], stats['db_hits'], stats['misses']), (2, 0, 1))
+
+                # Namespace (băm Bytecode) chỉ tính 1 lần cho mỗi hàm, không lặp lại ở mỗi lượt Hit
+                def prompt_v1():
+                    return "So sánh 2 máy"
+                with patch('app.ai_cache._fingerprint_code') as mock_fingerprint:
+                    namespace = ai_cache_namespace(prompt_v1)
+                    for _ in range(3):
+                        self.assertEqual(ai_cache_namespace(prompt_v1), namespace)
+                self.assertEqual(mock_fingerprint.call_count, 1)
+
+                # Tiến trình mới (RAM trống) -> Lấy từ Database rồi đưa ngược lên RAM
+                fresh = AIResponseCache(app)
+                key = AICache.query.first().prompt_hash
+                self.assertEqual(fresh.get(key), {'html': '<table></table>'})
+                self.assertEqual(fresh.get(key), {'html': '<table></table>'})
+                self.assertEqual((fresh.db_hits, fresh.memory_hits), (1, 1))
+
+                # Ghi nền theo lô (Write-behind) khi không chạy Test
+                app.config['TESTING'] = False
+                fresh._ensure_worker = lambda: None  # Giữ hàng đợi để flush thủ công
+                fresh.set('k1', 'một')
+                fresh.set('k2', ['hai'])
+                self.assertEqual(fresh.stats()['pending_writes'], 2)
+                fresh.flush()
+                self.assertEqual(AICache.query.count(), 3)
+                self.assertEqual(fresh.write_batches, 1)
+                # Lượt Hit được gom và ghi theo lô khi flush
+                self.assertEqual(AICache.query.filter_by(prompt_hash=key).first().hit_count, 2)
+
+                # Sweeper: xóa bản ghi hết hạn, phiên bản Prompt cũ, rồi LRU theo ngân sách số dòng
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                db.session.add_all([
+                    AICache(prompt_hash='expired', response_text='x', namespace='default',
+                            expires_at=now - timedelta(seconds=1)),
+                    AICache(prompt_hash='old_prompt', response_text='x', namespace='get_comparison_result:oldversion',
+                            expires_at=now + timedelta(days=1))
+                ])
+                db.session.commit()
+                with patch('app.ai_cache.AI_CACHE_MAX_ROWS', 2):
+                    removed = get_ai_response_cache().sweep()
+                self.assertEqual(removed, {'expired': 1, 'stale_namespace': 1, 'evicted': 1})
+                # Bản ghi vừa được đọc (last_hit_at mới nhất) được giữ lại
+                self.assertIsNotNone(AICache.query.filter_by(prompt_hash=key).first())
+
+                # Giới hạn theo byte: phần tử cũ bị đẩy ra khỏi RAM
+                small = AIResponseCache(app, max_bytes=10)
+                small.memory.set('a', 'x' * 6, 6)
+                small.memory.set('b', 'y' * 6, 6)
+                self.assertEqual(len(small.memory), 1)
+                self.assertEqual(small.memory.evictions, 1)
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    def test_semantic_cache_matches_paraphrases(self):
+        print("\n[Cache Test 4] Testing Semantic Cache...")
+        cache = SemanticCache('generate_chatbot_response', fake_embedder, threshold=0.9, max_entries=2)
+        self.assertIsNone(cache.lookup('iPhone 15 giá bao nhiêu', 'ctx')[0])
+        cache.store('iPhone 15 giá bao nhiêu', 'ctx', 'Dạ 20 triệu ạ')
+
+        self.assertEqual(cache.lookup('giá bao nhiêu iphone 15?', 'ctx')[0], 'Dạ 20 triệu ạ')
+        # Khác đời máy (con số) hoặc khác ngữ cảnh kho -> Không dùng lại câu trả lời
+        self.assertIsNone(cache.lookup('iPhone 14 giá bao nhiêu', 'ctx')[0])
+        self.assertIsNone(cache.lookup('iPhone 15 giá bao nhiêu', 'ctx_moi')[0])
+        # Embedding coi mọi câu là 1 -> Chỉ chữ ký (con số + biến thể đời máy) quyết định Hit
+        blunt = SemanticCache('analyze_search_intents', lambda texts: [[1.0] * 32] * len(texts), threshold=0.9)
+        blunt.store('giá galaxy s24', 'ctx', {'keyword': 'galaxy s24'})
+        self.assertEqual(blunt.lookup('galaxy s24 giá', 'ctx')[0], {'keyword': 'galaxy s24'})
+        self.assertIsNone(blunt.lookup('giá galaxy s24 ultra', 'ctx')[0])
+        self.assertIsNone(blunt.lookup('giá galaxy s24+', 'ctx')[0])
+        self.assertIsNone(blunt.lookup('giá galaxy a24', 'ctx')[0])
+        # Cùng con số + biến thể nhưng khác hãng / dòng máy -> Không dùng lại câu trả lời
+        blunt.store('so sánh galaxy s23 vs iphone 15', 'ctx', {'keyword': 'galaxy s23, iphone 15'})
+        self.assertIsNone(blunt.lookup('so sánh pixel 8 vs iphone 15', 'ctx')[0])
+        blunt.store('pin realme 12 pro có trâu không', 'ctx', {'keyword': 'realme 12 pro'})
+        self.assertEqual(blunt.lookup('Pin Realme 12 Pro có trâu không?', 'ctx')[0], {'keyword': 'realme 12 pro'})
+        self.assertIsNone(blunt.lookup('pin redmi 12 pro có trâu không', 'ctx')[0])
+        self.assertEqual(prompt_signature('Galaxy S23 vs iPhone 15')[2], frozenset({'Samsung', 'Apple'}))
+        # Vector toàn 0 (Embedding lỗi) -> Bỏ qua
+        broken = SemanticCache('x', lambda texts: [[0.0] * 32])
+        self.assertEqual(broken.lookup('iphone', 'ctx'), (None, None))
+        broken.store('iphone', 'ctx', 'x')
+        self.assertEqual(broken.stats()['stores'], 0)
+
+        # Đầy chỉ mục -> Câu cũ nhất bị ghi đè
+        cache.store('tai nghe', 'ctx', 'a')
+        cache.store('ốp lưng', 'ctx', 'b')
+        self.assertIsNone(cache.lookup('iPhone 15 giá bao nhiêu', 'ctx')[0])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # Luồng Chatbot thật: câu hỏi mở đầu diễn đạt lại không gọi Gemini lần 2
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                          'SEMANTIC_CACHE_ENABLED': True})
+        with app.app_context(), \
+                patch('app.utils.get_text_embedder', return_value=fake_embedder), \
+                patch('app.utils.build_product_context', return_value='[KHO HÀNG THỰC TẾ]'), \
+                patch('app.utils.call_gemini_api', return_value='Dạ còn hàng ạ') as mock_gemini:
+            self.assertEqual(generate_chatbot_response('còn iphone 15 không'), 'Dạ còn hàng ạ')
+            self.assertEqual(generate_chatbot_response('iphone 15 còn không'), 'Dạ còn hàng ạ')
+            self.assertEqual(mock_gemini.call_count, 1)
+            # Có lịch sử hội thoại -> Luôn hỏi Gemini
+            generate_chatbot_response('iphone 15 còn không', [{'user': 'chào', 'ai': 'Dạ chào anh'}])
+            self.assertEqual(mock_gemini.call_count, 2)
+            self.assertEqual(app.extensions['semantic_caches']['generate_chatbot_response'].threshold,
+                             SEMANTIC_CACHE_THRESHOLD)
+
+        # Ngưỡng Cosine chỉnh được theo cấu hình App
+        strict_app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                                 'SEMANTIC_CACHE_ENABLED': True, 'SEMANTIC_CACHE_THRESHOLD': 0.99})
+        with strict_app.app_context():
+            self.assertEqual(get_semantic_cache('x', lambda: fake_embedder).threshold, 0.99)
+
+    def test_lazy_resource_loads_once(self):
+        print("\n[Cache Test 5] Testing Lazy AI Resource Loading...")
+        calls = []
+
+        def slow_loader():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'clip-model'
+
+        resource = LazyResource('clip', slow_loader)
+        self.assertFalse(resource.is_loaded)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(resource.get())) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+        self.assertEqual(results, ['clip-model'] * 5)
+        self.assertEqual(len(calls), 1)
+
+        # Nạp lỗi -> Trả về None và không thử lại ở các lần gọi sau
+        def broken_loader():
+            calls.append(1)
+            raise ImportError("No module named 'torch'")
+        broken = LazyResource('torch', broken_loader)
+        self.assertIsNone(broken.get())
+        self.assertIsNone(broken.get())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(broken.stats()['available'], False)
+
+    def test_text_embedding_service_cache_and_micro_batching(self):
+        print("\n[Cache Test 6] Testing Shared Text Embedding Service...")
+        forward_batches = []
+
+        def slow_encode(texts):
+            forward_batches.append(list(texts))
+            time.sleep(0.02)
+            return fake_embedder(texts)
+
+        service = TextEmbeddingService(slow_encode, dim=32, max_batch=8, max_wait_ms=50)
+        # 6 truy vấn đồng thời (có 1 câu trùng) -> Chỉ 1 lượt Forward, câu trùng chỉ nhúng 1 lần
+        queries = ['iphone 15', 'samsung s24', 'iphone 15', 'xiaomi 14', 'oppo reno', 'vivo x100']
+        results = {}
+        threads = [threading.Thread(target=lambda i=i, q=q: results.update({i: service.embed_query(q)}))
+                   for i, q in enumerate(queries)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+        self.assertEqual(len(forward_batches), 1)
+        self.assertEqual(sorted(forward_batches[0]), sorted(set(queries)))
+        self.assertEqual(results[0], fake_embedder(['iphone 15'])[0])
+        self.assertEqual(results[0], results[2])
+
+        # Tìm lại câu cũ -> Hit Cache, không chạy Model
+        service.embed_query('samsung s24')
+        self.assertEqual(len(forward_batches), 1)
+        self.assertEqual(service.stats()['query_cache']['hits'], 1)
+
+        # Collection gọi hàm nhúng để Upsert (kể cả 1 văn bản) -> Luôn nhúng văn bản, không đụng Cache truy vấn
+        service(['samsung s24'])
+        self.assertEqual(len(forward_batches), 2)
+        self.assertEqual(service.stats()['query_cache']['hits'], 1)
+        self.assertEqual(service.stats()['query_cache']['size'], 5)
+
+        # Đồng bộ nhiều văn bản -> Chia lô theo document_batch_size, không đi qua Cache truy vấn
+        service.document_batch_size = 2
+        self.assertEqual(len(service(['a', 'b', 'c'])), 3)
+        self.assertEqual([len(b) for b in forward_batches[2:]], [2, 1])
+        self.assertEqual(service.stats()['documents_embedded'], 4)
+
+        # Hàm nhúng thường (không phải dịch vụ dùng chung) vẫn dùng được cho truy vấn
+        self.assertEqual(embed_query_text(fake_embedder, 'oppo'), fake_embedder(['oppo'])[0])
+
+        # Model lỗi -> Trả về Vector 0 đúng số chiều, không gãy request
+        broken = TextEmbeddingService(lambda texts: 1 / 0, dim=4, max_wait_ms=1)
+        self.assertEqual(broken(['x']), [[0.0] * 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
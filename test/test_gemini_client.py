@@ -0,0 +1,176 @@
+import sys
+import os
+
+# Thêm thư mục gốc vào đường dẫn hệ thống để Python tìm thấy 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch, MagicMock
+from app.gemini_client import GeminiKeyPool, get_gemini_pool, parse_retry_delay, classify_gemini_error, gemini_breaker
+from app.circuit_breaker import CircuitBreaker
+from app.utils import call_gemini_api, generate_chatbot_response, CHATBOT_FALLBACK_REPLY
+
+
+def _fake_response(text):
+    response = MagicMock()
+    response.text = text
+    return response
+
+
+class GeminiKeyPoolTestCase(unittest.TestCase):
+    """
+    Test Suite cho Bể kết nối Gemini (Gemini Key Pool):
+    1. Tái sử dụng Client theo từng Key
+    2. Cách ly Key hết Quota và trượt sang Key khỏe
+    3. Weighted Round-Robin chia tải giữa các Key khỏe
+    """
+
+    def setUp(self):
+        def client_factory(api_key):
+            client = MagicMock(name=f'client_{api_key}')
+            client.models.generate_content.return_value = _fake_response(f'ok_{api_key}')
+            return client
+
+        patcher = patch('google.genai.Client', side_effect=client_factory)
+        self.mock_client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_client_reused_per_key(self):
+        """Gọi nhiều lần qua `call_gemini_api` chỉ khởi tạo đúng 1 Client cho mỗi Key."""
+        print("\n[Gemini Pool Test 1] Testing Client Reuse...")
+        with patch.dict(os.environ, {'GEMINI_API_KEY': 'key_aaaa1111'}):
+            for _ in range(3):
+                self.assertEqual(call_gemini_api("Xin chào"), 'ok_key_aaaa1111')
+            self.assertEqual(self.mock_client_cls.call_count, 1)
+            self.assertIs(get_gemini_pool(), get_gemini_pool())
+
+    def test_quota_cooldown_skips_exhausted_key(self):
+        """Key báo 429 bị cách ly theo retryDelay, các lượt sau không còn thử Key đó nữa."""
+        print("\n[Gemini Pool Test 2] Testing Quota Cooldown...")
+        pool = GeminiKeyPool(['key_dead0000', 'key_live1111'])
+        dead, live = pool.keys
+        dead.client.models.generate_content.side_effect = Exception(
+            "429 RESOURCE_EXHAUSTED. {'retryDelay': '37s'}")
+        # Ép Key hỏng được chọn trước ở lượt đầu
+        dead.current_weight = 1000
+
+        response, reason = pool.generate_content("hi")
+        self.assertEqual(response.text, 'ok_key_live1111')
+        self.assertIsNone(reason)
+        self.assertEqual(dead.failures, 1)
+
+        for _ in range(5):
+            pool.generate_content("hi")
+        self.assertEqual(dead.client.models.generate_content.call_count, 1)
+
+        stats = pool.stats()
+        self.assertEqual(stats['available_keys'], 1)
+        self.assertGreater(stats['keys'][0]['cooldown_remaining'], 30)
+
+        # Toàn bộ Key bị cách ly -> Trả về ngay, không tốn Round-trip nào
+        live.cooldown_until = dead.cooldown_until
+        self.assertEqual(pool.generate_content("hi"), (None, 'exhausted'))
+
+    def test_weighted_round_robin_prefers_fast_keys(self):
+        """Key nhanh, ít lỗi nhận nhiều lượt hơn, nhưng Key chậm vẫn được chia tải."""
+        print("\n[Gemini Pool Test 3] Testing Smooth Weighted Round-Robin...")
+        pool = GeminiKeyPool(['key_fast0000', 'key_slow1111'])
+        fast, slow = pool.keys
+        fast.latency_ewma, slow.latency_ewma = 0.2, 3.0
+
+        picks = [pool.candidates()[0].label for _ in range(100)]
+        self.assertGreater(picks.count(fast.label), picks.count(slow.label))
+        self.assertGreater(picks.count(slow.label), 0)
+
+    def test_bad_request_does_not_quarantine_keys(self):
+        """Ảnh / Prompt lỗi (400 INVALID_ARGUMENT) không cách ly Key nào và không trượt sang Key khác."""
+        print("\n[Gemini Pool Test 4] Testing Bad Request Handling...")
+        pool = GeminiKeyPool(['key_aaaa0000', 'key_bbbb1111', 'key_cccc2222'])
+        for entry in pool.keys:
+            entry.client.models.generate_content.side_effect = Exception(
+                "400 INVALID_ARGUMENT. {'message': 'Unable to process input image.'}")
+
+        for _ in range(3):
+            self.assertEqual(pool.generate_content("hi", failover_on_any_error=True), (None, 'rejected'))
+        self.assertEqual(sum(e.client.models.generate_content.call_count for e in pool.keys), 3)
+        stats = pool.stats()
+        self.assertEqual(stats['available_keys'], 3)
+        self.assertTrue(all(k['failures'] == 0 and k['error_rate'] == 0 for k in stats['keys']))
+
+    def test_error_helpers(self):
+        """Kiểm tra phân loại lỗi và bóc tách thời gian chờ Reset Quota."""
+        self.assertEqual(classify_gemini_error(Exception("429 Quota exceeded")), 'quota')
+        self.assertEqual(classify_gemini_error(Exception("400 API key not valid (INVALID_ARGUMENT)")), 'invalid')
+        self.assertEqual(classify_gemini_error(Exception("403 PERMISSION_DENIED")), 'invalid')
+        self.assertEqual(classify_gemini_error(Exception("401 Unauthorized")), 'invalid')
+        self.assertEqual(classify_gemini_error(Exception("400 INVALID_ARGUMENT. Unable to process input image")), 'request')
+        self.assertEqual(classify_gemini_error(Exception("503 Service Unavailable")), 'other')
+        self.assertEqual(parse_retry_delay("Please retry in 12.5s."), 12.5)
+        self.assertEqual(parse_retry_delay("Unknown", default=60), 60)
+
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    """
+    Test Suite cho Cầu dao tự ngắt (Circuit Breaker) của tầng Gemini:
+    1. Vòng đời CLOSED -> OPEN -> HALF_OPEN -> CLOSED / OPEN
+    2. Fail-fast: Cầu dao ngắt thì không còn Round-trip nào tới Gemini
+    """
+
+    def setUp(self):
+        gemini_breaker.reset()
+        self.addCleanup(gemini_breaker.reset)
+
+    def test_state_transitions_with_single_probe(self):
+        print("\n[Breaker Test 1] Testing State Transitions...")
+        now = [100.0]
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow_request())
+        self.assertTrue(breaker.is_open())
+
+        # Hết thời gian chờ -> Chỉ đúng 1 Probe được đi qua
+        now[0] += 10
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow_request())
+
+        # Probe thất bại -> Ngắt lại từ đầu
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+        now[0] += 10
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+        stats = breaker.stats()
+        self.assertEqual(stats['transitions'], {'closed->open': 1, 'open->half_open': 2,
+                                                'half_open->open': 1, 'half_open->closed': 1})
+        self.assertEqual(stats['rejected'], 2)
+
+    @patch('google.genai.Client')
+    def test_open_breaker_fails_fast_to_local_fallback(self, mock_client_cls):
+        print("\n[Breaker Test 2] Testing Fail-fast Fallback...")
+        mock_client_cls.return_value.models.generate_content.side_effect = Exception("503 Service Unavailable")
+
+        with patch.dict(os.environ, {'GEMINI_API_KEY': 'key_down9999'}):
+            for _ in range(gemini_breaker.failure_threshold):
+                self.assertIsNone(call_gemini_api("hi"))
+            self.assertEqual(gemini_breaker.state, 'open')
+            calls_before = mock_client_cls.return_value.models.generate_content.call_count
+
+            # Cầu dao ngắt: Không còn gọi mạng, Chatbot trả lời dự phòng ngay (bỏ qua cả RAG)
+            self.assertIsNone(call_gemini_api("hi"))
+            with patch('app.utils.build_product_context') as mock_rag:
+                self.assertEqual(generate_chatbot_response("tư vấn iphone"), CHATBOT_FALLBACK_REPLY)
+                mock_rag.assert_not_called()
+            self.assertEqual(mock_client_cls.return_value.models.generate_content.call_count, calls_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,439 @@
+import sys
+import os
+
+# Thêm thư mục gốc vào đường dẫn hệ thống để Python tìm thấy 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import time
+import tempfile
+import zlib
+import struct
+import threading
+import unittest
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+from PIL import Image
+from app import create_app, db
+from app.models import User, Product
+from app.search_engine import (
+    get_catalog_index, hybrid_rank, tokenize_vietnamese, model_fingerprint, bump_catalog_version,
+    sync_product_to_search_index, get_search_result_cache
+)
+from app.search_intent import get_search_intent_resolver
+from app.routes.main import build_chroma_filter, semantic_search_in_pool
+from app.visual_search import get_visual_search_runner
+from app.image_pipeline import PreparedImage, prepare_upload
+from app.custom_exceptions import InvalidUploadImageError
+
+
+def make_photo(size=(320, 240), fmt='PNG', seed=0, **save_kwargs):
+    """Ảnh có họa tiết (dải màu chéo, đổi theo `seed`) để dHash mang đủ thông tin."""
+    w, h = size
+    img = Image.new('RGB', size)
+    img.putdata([((x * 3 + y + seed) % 256, (x * y + seed * 7) % 256, (y * 2) % 256) for y in range(h) for x in range(w)])
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **save_kwargs)
+    return buffer.getvalue()
+
+
+class SearchEngineTestCase(unittest.TestCase):
+    """
+    Test Suite cho Động cơ Tìm kiếm Nội bộ (In-Memory Catalog Index):
+    1. Lọc cứng Hãng / Danh mục / Giá trên chỉ mục RAM
+    2. Xếp hạng BM25 trên Chỉ mục Đảo ngược + hợp nhất RRF với Vector
+    3. Route Home xếp hạng đúng thứ tự và đồng bộ khi Admin Thêm/Sửa/Xóa
+    4. Bộ đệm kết quả tìm kiếm và cơ chế vô hiệu hóa theo Phiên bản Kho hàng (dùng chung giữa các Worker)
+    5. Phân tích ý định Local-First, Gemini làm giàu ngầm (Background)
+    6. Đẩy bộ lọc cứng xuống Vector DB + Over-fetch thích ứng
+    7. Chỉ mục dấu vân tay dòng máy cho bộ so khớp chính xác của Visual Search
+    8. Visual Search chạy song song Tầng Gemini / CLIP với hạn chót chung
+    9. Bộ đệm kết quả Visual Search theo SHA-256 + dHash của ảnh tải lên
+    10. Pipeline tiền xử lý ảnh tải lên 1 lần giải mã + chặn ảnh quá lớn theo Header
+    """
+
+    def setUp(self):
+        """Khởi tạo DB ảo trên RAM và dữ liệu mẫu cho chỉ mục."""
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'WTF_CSRF_ENABLED': False
+        })
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        # Làm sạch bảng trước khi nạp dữ liệu để chỉ mục chỉ chứa đúng dữ liệu của kịch bản test
+        db.drop_all()
+        db.create_all()
+
+        admin = User(username='search_admin', email='admin@test.com', password=generate_password_hash('123'),
+                     role='admin', full_name='Admin')
+        p1 = Product(name='iPhone 15 Pro Max', brand='Apple', price=35000000, category='phone',
+                     description='Titan tự nhiên, chip A17', is_active=True)
+        p2 = Product(name='Samsung Galaxy A05', brand='Samsung', price=3000000, category='phone',
+                     description='Pin trâu giá rẻ', is_active=True)
+        p3 = Product(name='Ốp lưng iPhone 15', brand='Phụ kiện chung', price=500000, category='accessory',
+                     description='Chống sốc', is_active=True)
+        p4 = Product(name='iPhone 11 Cũ', brand='Apple', price=5000000, category='phone',
+                     description='Máy ẩn', is_active=False)
+        db.session.add_all([admin, p1, p2, p3, p4])
+        db.session.commit()
+        self.p1_id, self.p2_id, self.p3_id, self.p4_id = p1.id, p2.id, p3.id, p4.id
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_catalog_index_hard_filters(self):
+        """Kiểm tra chỉ mục RAM tái hiện đúng bộ lọc SQL cũ (ilike hãng, category, giá, is_active)."""
+        print("\n[Search Test 1] Testing Catalog Index Hard Filters...")
+        index = get_catalog_index()
+
+        all_ids = [d.id for d in index.filter_candidates()]
+        self.assertEqual(all_ids, [self.p1_id, self.p2_id, self.p3_id])  # Sản phẩm ẩn bị loại
+
+        apple_ids = [d.id for d in index.filter_candidates(brand='apple')]
+        self.assertEqual(apple_ids, [self.p1_id])
+
+        # Tìm phụ kiện theo hãng -> được phép kèm các hãng 'Phụ kiện chung'
+        acc_ids = [d.id for d in index.filter_candidates(brand='Apple', category='accessory',
+                                                         include_accessory_brand=True)]
+        self.assertEqual(acc_ids, [self.p3_id])
+
+        cheap_ids = [d.id for d in index.filter_candidates(max_price=4000000)]
+        self.assertEqual(cheap_ids, [self.p2_id, self.p3_id])
+
+    def test_bm25_tokenizer_and_rrf_fusion(self):
+        """Kiểm tra Tokenizer tiếng Việt, điểm BM25 theo trường và hợp nhất RRF với Vector."""
+        print("\n[Search Test 2] Testing BM25 Ranking & Reciprocal Rank Fusion...")
+        tokens = tokenize_vietnamese('Tai nghe S24+')
+        self.assertIn('tai_nghe', tokens)
+        self.assertIn('s24', tokens)
+        self.assertIn('24', tokens)
+        self.assertIn('plus', tokens)
+        self.assertIn('dien', tokenize_vietnamese('Điện thoại'))
+
+        index = get_catalog_index()
+        scores = index.bm25_scores('iphone 15')
+        self.assertEqual(set(scores), {self.p1_id, self.p3_id})
+        # Gõ không dấu vẫn khớp mô tả có dấu
+        self.assertEqual(set(index.bm25_scores('pin trau')), {self.p2_id})
+        self.assertEqual(index.bm25_scores('nokia'), {})
+
+        # Sản phẩm chỉ có trong Vector DB vẫn được đưa vào kết quả, nhưng xếp sau khớp từ khóa
+        ranked = hybrid_rank(index, '15 pro', phrase='15 pro', vector_ids=[str(self.p2_id), 'abc'])
+        self.assertEqual([pid for pid, _ in ranked], [self.p1_id, self.p3_id, self.p2_id])
+
+        # Bộ lọc cứng loại cả kết quả Vector nằm ngoài tập ứng viên
+        ranked = hybrid_rank(index, '15 pro', vector_ids=[str(self.p2_id)], candidate_ids={self.p3_id})
+        self.assertEqual([pid for pid, _ in ranked], [self.p3_id])
+
+    @patch('app.routes.main.search_vector_db', return_value=[])
+    @patch('app.routes.main.analyze_search_intents', return_value=None)
+    def test_home_search_ranking_and_admin_sync(self, mock_intent, mock_vector):
+        """Kiểm tra Route Home xếp hạng theo điểm và chỉ mục tự cập nhật sau thao tác Admin."""
+        print("\n[Search Test 3] Testing Home Ranking & Admin Index Sync...")
+        res = self.client.get('/?q=15 pro')
+        html = res.data.decode('utf-8')
+        self.assertEqual(res.status_code, 200)
+        # Khớp cả cụm "15 pro" trong tên phải đứng trên sản phẩm chỉ khớp số "15"
+        self.assertLess(html.index('iPhone 15 Pro Max'), html.index('Ốp lưng iPhone 15'))
+        self.assertNotIn('Samsung Galaxy A05', html)
+
+        # Admin thêm sản phẩm mới -> Chỉ mục phải thấy ngay mà không cần nạp lại toàn bộ
+        self.client.post('/login', data=dict(username='search_admin', password='123'))
+        self.client.post('/admin/product/add', data=dict(
+            name='Xiaomi 14 Ultra', brand='Xiaomi', price=25000000, category='phone',
+            description='Camera Leica', is_active='on'))
+        new_p = Product.query.filter_by(name='Xiaomi 14 Ultra').first()
+        self.assertIsNotNone(get_catalog_index().get(new_p.id))
+
+        # Admin xóa sản phẩm -> Chỉ mục gỡ bỏ ngay
+        self.client.get(f'/admin/product/delete/{self.p2_id}')
+        self.assertIsNone(get_catalog_index().get(self.p2_id))
+
+    def test_catalog_index_follows_shared_version_across_workers(self):
+        """2 Worker dùng chung 1 DB: Worker A thấy thay đổi kho do Worker B ghi mà không cần khởi động lại."""
+        print("\n[Search Test 3b] Testing Shared Catalog Version Across Workers...")
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'shop.db')}",
+                      'CATALOG_VERSION_CHECK_INTERVAL': 0}
+            worker_a, worker_b = create_app(dict(config)), create_app(dict(config))
+            with worker_a.app_context():
+                db.create_all()
+                product = Product(name='Pixel 8', brand='Google', price=15000000, category='phone', is_active=True)
+                db.session.add(product)
+                db.session.commit()
+                product_id = product.id
+                self.assertEqual(get_catalog_index().ensure_built().get(product_id).price, 15000000)
+                get_search_result_cache().set('pixel', '', '', [product_id], None)
+                self.assertIsNotNone(get_search_result_cache().get('pixel'))
+
+            with worker_b.app_context():
+                index_b = get_catalog_index().ensure_built()
+                product = db.session.get(Product, product_id)
+                product.price = 12000000
+                db.session.commit()
+                sync_product_to_search_index(product)
+                # Worker tự sửa kho đã cập nhật chỉ mục tăng dần -> Không phải nạp lại toàn bộ
+                self.assertIs(get_catalog_index(), index_b)
+                self.assertTrue(index_b._built)
+                self.assertEqual(index_b.get(product_id).price, 12000000)
+
+            with worker_a.app_context():
+                self.assertEqual(get_catalog_index().ensure_built().get(product_id).price, 12000000)
+                # Kết quả tìm kiếm cache theo giá cũ cũng bị bỏ
+                self.assertIsNone(get_search_result_cache().get('pixel'))
+                self.assertEqual(get_search_result_cache().version, 1)
+                db.session.remove()
+                db.drop_all()
+            with worker_b.app_context():
+                db.session.remove()
+                db.engine.dispose()
+            with worker_a.app_context():
+                db.engine.dispose()
+
+    @patch('app.routes.main.search_vector_db', return_value=[])
+    @patch('app.routes.main.analyze_search_intents', return_value=None)
+    def test_search_result_cache_and_version_invalidation(self, mock_intent, mock_vector):
+        """Kiểm tra câu hỏi lặp lại dùng Cache, và Cache bị vô hiệu khi Admin sửa kho."""
+        print("\n[Search Test 4] Testing Search Result Cache & Catalog Version...")
+        self.client.get('/?q=15 pro')
+        self.client.get('/?q=  15  PRO ')  # Cùng khóa sau khi chuẩn hóa
+        self.assertEqual(mock_vector.call_count, 1)
+
+        # Đổi kiểu sắp xếp là một khóa khác
+        self.client.get('/?q=15 pro&sort=price_asc')
+        self.assertEqual(mock_vector.call_count, 2)
+
+        # Admin sửa sản phẩm -> Phiên bản kho tăng -> Câu hỏi cũ phải tính lại
+        self.client.post('/login', data=dict(username='search_admin', password='123'))
+        self.client.post(f'/admin/product/edit/{self.p3_id}', data=dict(
+            name='Ốp lưng iPhone 15 MagSafe', brand='Phụ kiện chung', price=600000,
+            description='Chống sốc', is_active='on'))
+        html = self.client.get('/?q=15 pro').data.decode('utf-8')
+        self.assertEqual(mock_vector.call_count, 3)
+        self.assertIn('MagSafe', html)
+
+        stats = self.client.get('/admin/api/cache-stats').get_json()['search_results']
+        self.assertEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['catalog_version'], 1)
+
+    @patch('app.routes.main.search_vector_db')
+    @patch('app.routes.main.analyze_search_intents')
+    def test_local_first_intent_with_background_enrichment(self, mock_intent, mock_vector):
+        """Kiểm tra Regex trả lời ngay, Gemini chỉ chạy ngầm cho câu hỏi khó và được dùng ở lượt sau."""
+        print("\n[Search Test 5] Testing Local-First Intent & Background LLM Enrichment...")
+        mock_vector.return_value = [str(self.p2_id)]
+        mock_intent.return_value = {'brand': None, 'category': 'phone', 'min_price': None, 'max_price': None,
+                                    'keyword': '', 'semantic_query': 'pin trâu', 'sort': None}
+
+        # Câu gõ đúng tên máy -> Tự tin cao -> Không đụng tới Gemini
+        self.client.get('/?q=iphone 15 pro')
+        get_search_intent_resolver().wait_pending(timeout=5)
+        self.assertEqual(mock_intent.call_count, 0)
+
+        # Câu hỏi "lóng" -> Trả lời ngay bằng Local, Gemini được xếp hàng chạy ngầm
+        html = self.client.get('/?q=máy cho người già').data.decode('utf-8')
+        self.assertIn('Smart Search', html)
+        get_search_intent_resolver().wait_pending(timeout=5)
+        self.assertEqual(mock_intent.call_count, 1)
+
+        # Lượt kế tiếp dùng kết quả Gemini đã lưu Cache (không gọi lại Gemini)
+        html = self.client.get('/?q=máy cho người già').data.decode('utf-8')
+        self.assertIn('Hybrid AI Search', html)
+        self.assertEqual(mock_vector.call_args[0][0], 'pin trâu')
+        self.assertEqual(mock_intent.call_count, 1)
+    @patch('app.routes.main.search_vector_db')
+    def test_prefiltered_vector_search_with_adaptive_overfetch(self, mock_vector):
+        """Kiểm tra Vector Search mang cùng bộ lọc Hãng/Loại/Giá và chỉ hỏi lại khi thiếu kết quả hợp lệ."""
+        print("\n[Search Test 6] Testing Pre-filtered Vector Search...")
+        pool = get_catalog_index().filter_candidates(brand='apple', category='phone', max_price=40000000)
+        brands = {doc.brand for doc in pool}
+        self.assertEqual(build_chroma_filter({'brand': 'apple', 'category': 'phone', 'max_price': '40000000'}, brands),
+                         {"$and": [{"category": "phone"}, {"brand": {"$in": ["Apple"]}},
+                                   {"price": {"$lte": 40000000}}]})
+        self.assertIsNone(build_chroma_filter({'brand': None, 'category': None}))
+
+        # Vector DB trả đủ kết quả trong tập ứng viên -> Chỉ 1 truy vấn
+        pool_ids = {self.p1_id, self.p2_id}
+        mock_vector.return_value = [str(self.p2_id), str(self.p1_id)]
+        self.assertEqual(semantic_search_in_pool('pin trâu', pool_ids, {"category": "phone"}, n_results=2),
+                         [str(self.p2_id), str(self.p1_id)])
+        self.assertEqual(mock_vector.call_args.kwargs['metadata_filters'], {"category": "phone"})
+        self.assertEqual(mock_vector.call_count, 1)
+
+        # Kết quả lọt ngoài tập ứng viên (Metadata cũ) -> Over-fetch tăng dần tới khi đủ
+        mock_vector.reset_mock()
+        mock_vector.side_effect = lambda q, n_results, metadata_filters: (
+            ['999', str(self.p4_id)] if n_results == 2 else ['999', str(self.p4_id), str(self.p1_id), str(self.p2_id)])
+        self.assertEqual(semantic_search_in_pool('pin trâu', pool_ids, None, n_results=2),
+                         [str(self.p1_id), str(self.p2_id)])
+        self.assertEqual([c.kwargs['n_results'] for c in mock_vector.call_args_list], [2, 8])
+
+        # Tập ứng viên rỗng -> Không gọi Vector DB
+        mock_vector.reset_mock()
+        self.assertEqual(semantic_search_in_pool('pin trâu', set(), None), [])
+        mock_vector.assert_not_called()
+
+    def test_model_fingerprint_index_strict_matching(self):
+        """Kiểm tra tên máy AI đọc được khớp đúng biến thể / thế hệ qua Postings dấu vân tay."""
+        print("\n[Search Test 7] Testing Model Fingerprint Index...")
+        extra = [Product(name='iPhone 15 Pro 256GB', brand='Apple', price=28000000, category='phone',
+                         description='', is_active=True),
+                 Product(name='Samsung Galaxy S24+ 5G', brand='Samsung', price=22000000, category='phone',
+                         description='', is_active=True),
+                 Product(name='Samsung Galaxy A24', brand='Samsung', price=5000000, category='phone',
+                         description='', is_active=True)]
+        db.session.add_all(extra)
+        db.session.commit()
+        pro, s24_plus, a24 = (p.id for p in extra)
+        index = get_catalog_index()
+        index.invalidate()
+
+        fp = model_fingerprint('Galaxy S24+ 12GB')
+        self.assertEqual((fp.modifiers, fp.numbers), ({'s', 'plus'}, {'24'}))
+
+        # Biến thể phải khớp 2 chiều: "15 Pro" không ra "15 Pro Max", dung lượng không làm nhiễu số thế hệ
+        self.assertEqual(index.match_model('iPhone 15 Pro', brand='Apple', keywords=['iPhone', '15', 'Pro']), [pro])
+        self.assertEqual(index.match_model('iPhone 15 Pro Max 1TB', brand='Apple', keywords=['iPhone', '15', 'Pro', 'Max']),
+                         [self.p1_id])
+        self.assertEqual(index.match_model('Galaxy S24 Plus', brand='Samsung', keywords=['Galaxy', 'S24']), [s24_plus])
+        self.assertEqual(index.match_model('Galaxy A24', brand='Samsung', keywords=['Samsung', 'Galaxy']), [a24])
+        # Sai hãng / máy ngừng bán / không phải điện thoại -> Không khớp
+        self.assertEqual(index.match_model('Galaxy A24', brand='Apple'), [])
+        self.assertEqual(index.match_model('iPhone 11', brand='Apple'), [])
+        self.assertEqual(index.match_model('iPhone 15', keywords=['iPhone', '15']), [])
+
+        # Admin sửa tên -> Dấu vân tay cập nhật ngay theo chỉ mục tăng dần
+        product = db.session.get(Product, a24)
+        product.name = 'Samsung Galaxy A25'
+        db.session.commit()
+        index.upsert(product)
+        self.assertEqual(index.match_model('Galaxy A24', brand='Samsung'), [])
+        self.assertEqual(index.match_model('Galaxy A25', brand='Samsung'), [a24])
+
+    def test_parallel_visual_search_tiers_with_deadline(self):
+        """Kiểm tra Gemini và CLIP khởi động cùng lúc, Gemini quá hạn chót -> Trả ngay kết quả CLIP đã tính sẵn."""
+        print("\n[Search Test 8] Testing Parallel Visual Search Tiers...")
+        self.app.config['VISUAL_SEARCH_DEADLINE_SECONDS'] = 0.3
+        release_gemini = threading.Event()
+        clip_started = threading.Event()
+
+        def slow_gemini(image_file):
+            # Tầng CLIP phải được khởi động trước khi Gemini trả lời (không chạy nối tiếp)
+            self.assertTrue(clip_started.wait(1))
+            release_gemini.wait(2)
+            return {'brand': 'Apple', 'model': 'iPhone 15 Pro Max', 'confidence': 95}
+
+        def fast_clip(image_file, n_results=5):
+            clip_started.set()
+            # 2 tầng nhận chung 1 ảnh đã giải mã sẵn
+            self.assertIsInstance(image_file, PreparedImage)
+            self.assertEqual(image_file.image.size, (320, 240))
+            return [str(self.p2_id)]
+
+        def upload(payload=make_photo()):
+            return self.client.post('/search/image', data={
+                'visual_image': (io.BytesIO(payload), 'phone.jpg')
+            }, content_type='multipart/form-data')
+
+        runner = get_visual_search_runner()
+        with patch('app.routes.main.identify_phone_by_gemini', side_effect=slow_gemini), \
+                patch('app.routes.main.search_image_vector_db', side_effect=fast_clip):
+            started = time.monotonic()
+            res = upload()
+            elapsed = time.monotonic() - started
+            release_gemini.set()
+
+        html = res.data.decode('utf-8')
+        self.assertEqual(res.status_code, 200)
+        self.assertLess(elapsed, 1.5)
+        self.assertIn('Samsung Galaxy A05', html)
+        self.assertNotIn('iPhone 15 Pro Max', html)
+        self.assertEqual(runner.stats()['gemini_timeouts'], 1)
+
+        # Gemini kịp hạn chót và tự tin -> Bộ so khớp chính xác thắng, kết quả CLIP bị bỏ qua
+        self.app.config['VISUAL_SEARCH_DEADLINE_SECONDS'] = 5
+        with patch('app.routes.main.identify_phone_by_gemini',
+                   return_value={'brand': 'Apple', 'model': 'iPhone 15 Pro Max', 'confidence': 95,
+                                 'search_keywords': ['iPhone', '15', 'Pro', 'Max']}), \
+                patch('app.routes.main.search_image_vector_db', return_value=[str(self.p2_id)]):
+            html = upload(make_photo(seed=1)).data.decode('utf-8')
+        self.assertIn('iPhone 15 Pro Max', html)
+        self.assertNotIn('Samsung Galaxy A05', html)
+        self.assertEqual(runner.stats()['jobs'], 2)
+
+    @patch('app.routes.main.search_image_vector_db')
+    @patch('app.routes.main.identify_phone_by_gemini')
+    def test_visual_search_upload_hash_cache(self, mock_gemini, mock_clip):
+        """Kiểm tra ảnh gửi lại (kể cả đã nén lại / đổi kích thước) không gọi lại Gemini, CLIP theo Phiên bản Kho."""
+        print("\n[Search Test 9] Testing Visual Search Upload-hash Cache...")
+        mock_gemini.return_value = {'brand': 'Apple', 'model': 'iPhone 15 Pro Max', 'confidence': 20}
+        mock_clip.return_value = [str(self.p2_id)]
+        runner = get_visual_search_runner()
+
+        original, recompressed = io.BytesIO(make_photo()), io.BytesIO()
+        Image.open(original).resize((200, 150)).save(recompressed, format='JPEG', quality=70)
+
+        def upload(payload):
+            res = self.client.post('/search/image', data={
+                'visual_image': (io.BytesIO(payload), 'phone.png')
+            }, content_type='multipart/form-data')
+            return res.data.decode('utf-8')
+
+        # Lượt 1: Gemini không tự tin -> Rơi xuống CLIP, cả 2 kết quả được ghi vào Cache
+        self.assertIn('Samsung Galaxy A05', upload(original.getvalue()))
+        # Lượt 2 (cùng byte) và Lượt 3 (ảnh đã nén lại JPEG nhỏ hơn): Không gọi lại Model nào
+        self.assertIn('Samsung Galaxy A05', upload(original.getvalue()))
+        self.assertIn('Samsung Galaxy A05', upload(recompressed.getvalue()))
+        self.assertEqual((mock_gemini.call_count, mock_clip.call_count), (1, 1))
+        cache_stats = runner.stats()['cache']
+        self.assertEqual((cache_stats['exact_hits'], cache_stats['perceptual_hits']), (1, 1))
+
+        # Admin sửa kho -> Kết quả CLIP mất hiệu lực, JSON Gemini vẫn dùng lại được
+        bump_catalog_version()
+        upload(original.getvalue())
+        self.assertEqual((mock_gemini.call_count, mock_clip.call_count), (1, 2))
+        self.assertEqual(runner.stats()['gemini_calls_saved'], 3)
+
+    def test_single_decode_upload_pipeline(self):
+        """Kiểm tra ảnh được thu nhỏ ngay khi giải mã, và ảnh khai báo quá nhiều Megapixel bị chặn từ Header."""
+        print("\n[Search Test 10] Testing Single-decode Upload Pipeline...")
+        prepared = prepare_upload(make_photo((3000, 2000), fmt='JPEG', quality=90))
+        self.assertEqual((prepared.format, prepared.original_size), ('JPEG', (3000, 2000)))
+        self.assertEqual(prepared.image.size, (1024, 683))
+        self.assertEqual(Image.open(io.BytesIO(prepared.gemini_jpeg)).size, (1024, 683))
+        self.assertIs(prepared.gemini_jpeg, prepared.gemini_jpeg)
+
+        # PNG chỉ vài chục byte nhưng Header khai báo hàng chục / hàng trăm Megapixel -> Từ chối mà không giải mã điểm ảnh
+        def png_header_only(width, height):
+            def chunk(kind, data):
+                return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+            return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+                    + chunk(b'IDAT', b'') + chunk(b'IEND', b''))
+
+        bomb = png_header_only(8000, 6000)
+        for payload in (bomb, png_header_only(20000, 20000)):
+            with self.assertRaisesRegex(InvalidUploadImageError, 'Ảnh quá lớn'):
+                prepare_upload(payload)
+        with self.assertRaises(InvalidUploadImageError):
+            prepare_upload(b'not-an-image')
+        # Định dạng ngoài danh sách (GIF) -> Thông báo đúng các định dạng được nhận
+        gif = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(gif, format='GIF')
+        with self.assertRaisesRegex(InvalidUploadImageError, 'Chỉ nhận: JPG, PNG, WEBP'):
+            prepare_upload(gif.getvalue())
+
+        with patch('app.routes.main.identify_phone_by_gemini') as mock_gemini:
+            res = self.client.post('/search/image', data={'visual_image': (io.BytesIO(bomb), 'bomb.png')},
+                                   content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 302)
+        with self.client.session_transaction() as sess:
+            self.assertIn('Ảnh quá lớn', sess['_flashes'][-1][1])
+        mock_gemini.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
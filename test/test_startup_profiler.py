@@ -0,0 +1,54 @@
+import sys
+import os
+
+# Thêm thư mục gốc vào đường dẫn hệ thống để Python tìm thấy 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import unittest
+from app.startup_profiler import StartupProfiler, module_subsystem
+
+
+class StartupProfilerTestCase(unittest.TestCase):
+    """
+    Test Suite cho Bộ đo khởi động (STARTUP_PROFILE):
+    1. Đo từng giai đoạn + thời gian import gom theo phân hệ, ghi báo cáo JSON
+    2. Khi tắt: không cài Hook import, không ghi file
+    """
+
+    def test_profiler_records_phases_and_imports(self):
+        print("\n[Startup Test 1] Testing Startup Profiler Report...")
+        with tempfile.TemporaryDirectory() as tmp:
+            report_path = os.path.join(tmp, 'profile.json')
+            profiler = StartupProfiler(report_path)
+            sys.modules.pop('wave', None)
+            with profiler.phase('import_wave'):
+                import wave  # noqa: F401 - Module chuẩn nhỏ, chắc chắn chưa được nạp
+            report = profiler.finish()
+
+            self.assertEqual([p['name'] for p in report['phases']], ['import_wave'])
+            self.assertIn('wave', [m['module'] for m in report['imports']['slowest_modules']])
+            self.assertIn('wave', [g['subsystem'] for g in report['imports']['by_subsystem']])
+            with open(report_path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['phases'][0]['name'], 'import_wave')
+
+            # Chỉ ghi báo cáo 1 lần, các lần create_app() sau không đo nữa
+            self.assertIsNone(profiler.finish())
+        self.assertEqual(module_subsystem('app.routes.main'), 'app.routes')
+        self.assertEqual(module_subsystem('sqlalchemy.orm.session'), 'sqlalchemy')
+
+    def test_disabled_profiler_is_noop(self):
+        print("\n[Startup Test 2] Testing Disabled Startup Profiler...")
+        import builtins
+        original_import = builtins.__import__
+        profiler = StartupProfiler(None)
+        with profiler.phase('anything'):
+            pass
+        self.assertIs(builtins.__import__, original_import)
+        self.assertEqual(profiler.phases, [])
+        self.assertIsNone(profiler.finish())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,467 @@
+import sys
+import os
+
+# Thêm thư mục gốc vào đường dẫn hệ thống để Python tìm thấy 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import tempfile
+import threading
+import multiprocessing
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+from app.ai_resources import ClipRuntime, clip_backend_name, _load_clip
+from app.embedding_store import EmbeddingStore
+from app.utils import ImageFetch, get_image_embedding, embed_pixel_values
+from app.visual_indexer import bulk_sync_product_images
+from app.text_indexer import (
+    bulk_sync_products_to_vector_db,
+    incremental_sync_products_to_vector_db,
+    _indexed_content_hashes
+)
+from app.utils import product_semantic_text, product_vector_metadata
+from app.vector_backends import NumpyVectorBackend, ChromaVectorBackend, vector_backend_name
+from app.image_fetcher import ImageFetcher, FetchResult
+from app.custom_exceptions import RemoteImageFetchError
+import requests
+
+
+def make_fake_clip(encode=None):
+    """CLIP giả lập, không cần cài PyTorch để chạy Test."""
+    return ClipRuntime(backend='fake', processor=None, encode=encode, device='cpu')
+
+
+def _fill_embedding_store(directory, worker, count):
+    """Tiến trình con ghi `count` Vector vào cùng 1 Kho (giả lập nhiều Worker Gunicorn / Script CLI)."""
+    store = EmbeddingStore(directory, dim=3, autosave_every=4)
+    for i in range(count):
+        store.put(f'w{worker}-{i}', [float(worker), float(i), 1.0])
+        store.remember_url(f'http://cdn/{worker}/{i}.jpg', f'w{worker}-{i}')
+    store.save()
+
+
+class VectorIndexingTestCase(unittest.TestCase):
+    """
+    Test Suite cho pipeline đồng bộ Vector DB hàng loạt:
+    1. Bulk CLIP Indexer: tải ảnh song song, nhúng theo lô, Upsert theo lô
+    2. Kho Vector Ảnh theo nội dung: SHA-256 + ETag, ảnh không đổi thì không chạy lại CLIP, ghi an toàn đa tiến trình
+    3. Backend CLIP (torch / int8 / onnx): chọn qua biến môi trường, đầu ra chuẩn hóa thống nhất
+    4. Bulk Text Indexer: nhúng MiniLM + Upsert văn bản sản phẩm theo lô
+    5. Đồng bộ tăng dần: chỉ nhúng lại sản phẩm đổi nội dung, xóa Vector sản phẩm ngừng bán / đã xóa
+    6. Backend Vector hoán đổi: NumPy (memmap, Top-K chính xác, lọc Metadata) và ChromaDB
+    7. Bộ tải ảnh từ xa: Session dùng chung, giới hạn đồng thời theo máy chủ, chặn dung lượng + hạn chót, thử lại
+    """
+
+    def test_bulk_image_sync_batches_forward_and_upsert(self):
+        print("\n[Indexing Test 1] Testing Bulk CLIP Image Indexer...")
+        products = [SimpleNamespace(id=i, name=f"Phone {i}", brand="Apple", image_url=f"http://img/{i}.jpg")
+                    for i in range(1, 7)]
+        products.append(SimpleNamespace(id=99, name="No image", brand="Apple", image_url=None))
+        collection = MagicMock()
+
+        def fake_fetch(url):
+            if url.endswith('/3.jpg'):
+                return None  # Ảnh số 3 là link chết (404)
+            if url.endswith('/6.jpg'):
+                return ImageFetch('sha-6', [6.0], None)  # Ảnh số 6 đã có Vector trong Kho
+            return ImageFetch(f"sha-{url}", None, url)
+
+        def fake_preprocess(img, clip):
+            return np.full((1, 3), int(img.rsplit('/', 1)[1].split('.')[0]), dtype=np.float32)
+
+        forward_batches = []
+
+        def fake_embed(pixel_values, clip):
+            forward_batches.append(len(pixel_values))
+            return [[float(row[0])] for row in pixel_values]
+
+        with patch('app.visual_indexer.get_product_image_collection', return_value=collection), \
+                patch('app.visual_indexer.get_clip_runtime', return_value=make_fake_clip()), \
+                patch('app.visual_indexer.fetch_image_with_cache', side_effect=fake_fetch), \
+                patch('app.visual_indexer.remember_image_embeddings') as mock_remember, \
+                patch('app.visual_indexer.preprocess_images', side_effect=fake_preprocess), \
+                patch('app.visual_indexer.embed_pixel_values', side_effect=fake_embed):
+            stats = bulk_sync_product_images(products, batch_size=2, workers=3)
+
+        self.assertEqual((stats['indexed'], stats['reused'], stats['failed'], stats['skipped']), (5, 1, 1, 1))
+        # 5 ảnh hợp lệ -> Lô 2 + 2 + 1, chỉ 4 ảnh cần chạy CLIP (ảnh số 6 dùng lại Vector)
+        self.assertEqual(sum(forward_batches), 4)
+        self.assertEqual(collection.upsert.call_count, 3)
+        remembered = [pair for c in mock_remember.call_args_list for pair in c.args[0]]
+        self.assertEqual(len(remembered), 4)
+        upserted = {}
+        for c in collection.upsert.call_args_list:
+            for pid, vec in zip(c.kwargs['ids'], c.kwargs['embeddings']):
+                upserted[pid] = vec
+        # Vector được ghép đúng với ID sản phẩm dù ảnh tải xong theo thứ tự bất kỳ
+        self.assertEqual(upserted, {'1': [1.0], '2': [2.0], '4': [4.0], '5': [5.0], '6': [6.0]})
+
+        # CLIP không khả dụng -> Bỏ qua toàn bộ, không lỗi
+        with patch('app.visual_indexer.get_clip_runtime', return_value=None), \
+                patch('app.visual_indexer.get_product_image_collection', return_value=collection):
+            self.assertEqual(bulk_sync_product_images(products)['skipped'], len(products))
+
+    def test_content_addressed_embedding_store(self):
+        print("\n[Indexing Test 2] Testing Content-addressed Embedding Store...")
+        with tempfile.TemporaryDirectory() as tmp:
+            store = EmbeddingStore(tmp, dim=3, autosave_every=100)
+            responses = []
+
+            def fake_fetch(url, headers=None):
+                responses.append((headers or {}).get('If-None-Match'))
+                if (headers or {}).get('If-None-Match') == '"v1"':
+                    return FetchResult(304, b'', {})
+                return FetchResult(200, b'same-image-bytes',
+                                   {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+            fake_clip = make_fake_clip()
+            with patch('app.utils.get_image_embedding_store', return_value=store), \
+                    patch('app.utils.get_clip_runtime', return_value=fake_clip), \
+                    patch('app.utils.get_image_fetcher', return_value=MagicMock(fetch=fake_fetch)), \
+                    patch('app.utils.Image.open') as mock_open, \
+                    patch('app.utils.preprocess_images', return_value=np.zeros((1, 3))), \
+                    patch('app.utils.embed_pixel_values', return_value=[[0.6, 0.8, 0.0]]) as mock_clip:
+                self.assertEqual(get_image_embedding('http://cdn/a.jpg'), [0.6, 0.8, 0.0])
+                # Lần 2: Request có điều kiện -> 304 -> Không tải file, không chạy CLIP
+                np.testing.assert_allclose(get_image_embedding('http://cdn/a.jpg'), [0.6, 0.8, 0.0], rtol=1e-6)
+                self.assertEqual(responses, [None, '"v1"'])
+                # URL khác nhưng cùng nội dung ảnh -> Dùng lại Vector theo SHA-256
+                self.assertAlmostEqual(get_image_embedding('http://mirror/a.jpg')[1], 0.8, places=5)
+                self.assertEqual(mock_clip.call_count, 1)
+                self.assertEqual(mock_open.call_count, 1)
+
+            # Khởi động lại: Kho đọc lại từ đĩa (memmap) không cần nhúng lại
+            reopened = EmbeddingStore(tmp, dim=3)
+            digest = reopened.lookup_url('http://cdn/a.jpg')['sha256']
+            self.assertAlmostEqual(reopened.get(digest)[0], 0.6, places=5)
+            self.assertEqual(reopened.stats()['vectors'], 1)
+
+            # Đổi Model (khác số chiều) -> Bỏ dữ liệu cũ
+            self.assertEqual(EmbeddingStore(tmp, dim=4).stats()['vectors'], 0)
+
+        # Nhiều tiến trình cùng ghi 1 Kho: không trùng dòng, không mất bản ghi, không lệch hàng
+        with tempfile.TemporaryDirectory() as tmp:
+            live = EmbeddingStore(tmp, dim=3, autosave_every=1000)
+            live.put('parent', [9.0, 9.0, 9.0])
+            # Dòng ghi dở từ 1 lần tắt đột ngột trước đó
+            with open(os.path.join(tmp, 'vectors.f32'), 'ab') as f:
+                f.write(b'\x00' * 5)
+            workers = [multiprocessing.Process(target=_fill_embedding_store, args=(tmp, w, 15)) for w in range(4)]
+            for p in workers:
+                p.start()
+            for p in workers:
+                p.join(timeout=30)
+                self.assertEqual(p.exitcode, 0)
+            live.save()
+
+            reopened = EmbeddingStore(tmp, dim=3)
+            self.assertEqual(reopened.stats()['vectors'], 61)
+            self.assertEqual(len(set(reopened.rows.values())), 61)
+            self.assertEqual(reopened.get('parent'), [9.0, 9.0, 9.0])
+            for w in range(4):
+                for i in range(15):
+                    self.assertEqual(reopened.get(f'w{w}-{i}'), [float(w), float(i), 1.0])
+                    self.assertEqual(reopened.lookup_url(f'http://cdn/{w}/{i}.jpg')['sha256'], f'w{w}-{i}')
+            # Tiến trình đang chạy thấy Vector do tiến trình khác vừa nhúng
+            self.assertEqual(live.get('w3-14'), [3.0, 14.0, 1.0])
+
+    def test_clip_backend_selection_and_normalization(self):
+        print("\n[Indexing Test 3] Testing CLIP Backend Selection...")
+        for value, expected in (('onnx', 'onnx'), ('INT8', 'int8'), ('tensorrt', 'torch'), ('', 'torch')):
+            with patch.dict(os.environ, {'CLIP_BACKEND': value}):
+                self.assertEqual(clip_backend_name(), expected)
+
+        # Export ONNX / lượng tử hóa lỗi lúc chạy (không chỉ ImportError) -> Quay về PyTorch, không tắt hẳn CLIP
+        torch_runtime = make_fake_clip()
+        for backend, error in (('onnx', RuntimeError('export failed')), ('int8', OSError('disk full'))):
+            with patch.dict(os.environ, {'CLIP_BACKEND': backend}), \
+                    patch('app.ai_resources.build_clip_runtime', side_effect=[error, torch_runtime]) as mock_build:
+                self.assertIs(_load_clip(), torch_runtime)
+                self.assertEqual([c.args[0] for c in mock_build.call_args_list], [backend, 'torch'])
+
+        # Mọi Backend chỉ cần trả về đặc trưng thô, bước chuẩn hóa L2 dùng chung
+        clip = make_fake_clip(encode=lambda pv: pv.reshape(len(pv), -1)[:, :2])
+        vectors = embed_pixel_values(np.array([[[3.0, 4.0]], [[0.0, 0.0]]], dtype=np.float32), clip)
+        np.testing.assert_allclose(vectors, [[0.6, 0.8], [0.0, 0.0]], atol=1e-6)
+
+    def test_bulk_text_sync_embeds_and_upserts_in_chunks(self):
+        print("\n[Indexing Test 4] Testing Bulk Text Indexer...")
+        products = [SimpleNamespace(id=i, name=f"Phone {i}", brand="Samsung", category="phone",
+                                    description="Pin\n5000mAh", price=1000 * i) for i in range(1, 6)]
+        collection = MagicMock()
+        embed_calls = []
+
+        def fake_embedder(texts):
+            embed_calls.append(len(texts))
+            return [[float(len(t))] for t in texts]
+
+        with patch('app.text_indexer.get_product_collection', return_value=collection), \
+                patch('app.text_indexer.get_text_embedder', return_value=fake_embedder):
+            # Nhận cả Generator (rag_sync lọc sản phẩm đang hoạt động theo kiểu lười)
+            stats = bulk_sync_products_to_vector_db((p for p in products + products[:1]), batch_size=2)
+
+        self.assertEqual((stats['indexed'], stats['failed']), (5, 0))
+        self.assertEqual(embed_calls, [2, 2, 1])
+        self.assertEqual(collection.upsert.call_count, 3)
+        first = collection.upsert.call_args_list[0].kwargs
+        self.assertEqual(first['ids'], ['1', '2'])
+        self.assertIn("Cấu hình/Tính năng: Pin 5000mAh", first['documents'][0])
+        self.assertEqual({k: first['metadatas'][1][k] for k in ('price', 'brand', 'category')},
+                         {"price": 2000, "brand": "Samsung", "category": "phone"})
+        self.assertEqual(len(first['metadatas'][1]['content_hash']), 40)
+        self.assertEqual(len(first['embeddings']), 2)
+
+        # Không có Vector DB -> Bỏ qua, không lỗi
+        with patch('app.text_indexer.get_product_collection', return_value=None):
+            self.assertEqual(bulk_sync_products_to_vector_db(products)['indexed'], 0)
+
+    def test_incremental_text_sync_only_touches_changes(self):
+        print("\n[Indexing Test 5] Testing Incremental Text Vector Sync...")
+
+        def make(pid, price=1000, active=True):
+            return SimpleNamespace(id=pid, name=f"Phone {pid}", brand="Oppo", category="phone",
+                                   description="Camera 50MP", price=price, is_active=active)
+
+        unchanged, repriced, new, inactive = make(1), make(2, price=2500), make(3), make(4, active=False)
+        old_hash = product_vector_metadata(make(2))['content_hash']
+        # Vector DB hiện có: #1 (không đổi), #2 (giá cũ), #4 (vừa ngừng bán), #9 (đã bị xóa khỏi SQL)
+        indexed = {'1': product_vector_metadata(unchanged)['content_hash'], '2': old_hash, '4': 'x', '9': 'y'}
+        collection = MagicMock()
+        collection.get.side_effect = lambda include, limit, offset: {
+            'ids': list(indexed)[offset:offset + limit],
+            'metadatas': [{'content_hash': h} for h in list(indexed.values())[offset:offset + limit]]
+        }
+        embedded = []
+
+        def fake_embedder(texts):
+            embedded.extend(texts)
+            return [[1.0] for _ in texts]
+
+        with patch('app.text_indexer.get_product_collection', return_value=collection), \
+                patch('app.text_indexer.get_text_embedder', return_value=fake_embedder):
+            stats = incremental_sync_products_to_vector_db([unchanged, repriced, new, inactive])
+            self.assertEqual((stats['added'], stats['updated'], stats['deleted'], stats['skipped'], stats['failed']),
+                             (1, 1, 2, 1, 0))
+            # Chỉ 2 sản phẩm đổi nội dung được nhúng lại
+            self.assertEqual(embedded, [product_semantic_text(repriced), product_semantic_text(new)])
+            self.assertEqual(sorted(collection.delete.call_args.kwargs['ids']), ['4', '9'])
+            # Metadata quét theo trang (4 Vector / trang 3 -> 2 lượt đọc)
+            collection.get.reset_mock()
+            self.assertEqual(_indexed_content_hashes(collection, page_size=3), indexed)
+            self.assertEqual(collection.get.call_count, 2)
+
+            # --full: nhúng lại mọi sản phẩm đang bán dù nội dung không đổi
+            embedded.clear()
+            stats = incremental_sync_products_to_vector_db([unchanged, repriced, new, inactive], force=True)
+            self.assertEqual((stats['skipped'], len(embedded)), (0, 3))
+
+        # Admin xóa sản phẩm -> Xóa cả Vector Văn bản lẫn Vector Ảnh
+        text_col, image_col = MagicMock(), MagicMock()
+        with patch('app.utils.get_product_collection', return_value=text_col), \
+                patch('app.utils.get_product_image_collection', return_value=image_col):
+            from app.utils import remove_product_from_vector_db
+            remove_product_from_vector_db(7)
+        text_col.delete.assert_called_once_with(ids=['7'])
+        image_col.delete.assert_called_once_with(ids=['7'])
+
+    def test_numpy_vector_backend_matches_chroma_interface(self):
+        print("\n[Indexing Test 6] Testing NumPy Vector Backend...")
+        with patch.dict(os.environ, {'VECTOR_BACKEND': 'NumPy'}):
+            self.assertEqual(vector_backend_name(), 'numpy')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = NumpyVectorBackend(tmp, dim=3, embedding_function=lambda texts: [[1.0, 0.0, 0.0]] * len(texts),
+                                       initial_capacity=2)
+            # Kho rỗng -> Kết quả rỗng thay vì lỗi
+            self.assertEqual(store.query(query_texts=['iphone'], n_results=5)['ids'], [[]])
+
+            store.upsert(ids=['1', '2', '3'], embeddings=[[3, 0, 0], [0, 2, 0], [1, 1, 0]],
+                         metadatas=[{'category': 'phone', 'price': 10}, {'category': 'tablet', 'price': 20},
+                                    {'category': 'phone', 'price': 30}])
+            result = store.query(query_texts=['iphone'], n_results=10)
+            # Vượt sức chứa ban đầu (2) vẫn đúng; n_results tự thu nhỏ về số Vector đang có
+            self.assertEqual(result['ids'], [['1', '3', '2']])
+            self.assertAlmostEqual(result['distances'][0][0], 0.0, places=5)
+            self.assertEqual(store.query(query_embeddings=[[1, 0, 0]], n_results=5,
+                                         where={'category': 'phone'})['ids'], [['1', '3']])
+            self.assertEqual(store.query(query_embeddings=[[1, 0, 0]], n_results=5,
+                                         where={'$and': [{'price': {'$gte': 15}},
+                                                         {'category': {'$in': ['phone', 'tablet']}}]})['ids'],
+                             [['3', '2']])
+
+            # Xóa -> Dòng được tái sử dụng; mở lại từ đĩa giữ nguyên dữ liệu
+            store.delete(ids=['1'])
+            store.upsert(ids=['4'], embeddings=[[0, 0, 5]], metadatas=[{'category': 'phone', 'price': 40}])
+            reopened = NumpyVectorBackend(tmp, dim=3)
+            self.assertEqual(reopened.count(), 3)
+            self.assertEqual(reopened.stats()['free_rows'], 0)
+            page = reopened.get(include=['metadatas'], limit=2, offset=0)
+            self.assertEqual(len(page['ids']), 2)
+            self.assertEqual(reopened.query(query_embeddings=[[0, 0, 1]], n_results=1)['ids'], [['4']])
+
+            # 2 tiến trình cùng ghi 1 thư mục: bản đang giữ dữ liệu cũ tự nạp lại trước khi cấp dòng
+            store.upsert(ids=['5'], embeddings=[[0, 1, 1]], metadatas=[{'category': 'phone', 'price': 50}])
+            reopened.upsert(ids=['6'], embeddings=[[1, 0, 1]], metadatas=[{'category': 'tablet', 'price': 60}])
+            store.delete(ids=['2'])
+            for handle in (store, reopened, NumpyVectorBackend(tmp, dim=3)):
+                self.assertEqual(handle.count(), 4)
+                self.assertEqual(sorted(handle.get(include=[])['ids']), ['3', '4', '5', '6'])
+                self.assertEqual(handle.query(query_embeddings=[[1, 0, 1]], n_results=1)['ids'], [['6']])
+
+        # ChromaDB: nhớ tạm count() giữa các truy vấn, làm mới sau khi ghi
+        collection = MagicMock()
+        collection.count.return_value = 3
+        chroma = ChromaVectorBackend(collection)
+        chroma.query(query_texts=['a'], n_results=10)
+        chroma.query(query_texts=['b'], n_results=10, where={'category': 'phone'})
+        self.assertEqual(collection.count.call_count, 1)
+        self.assertEqual(collection.query.call_args.kwargs['n_results'], 3)
+        chroma.upsert(ids=['9'], embeddings=[[0.0]])
+        chroma.query(query_texts=['c'])
+        self.assertEqual(collection.count.call_count, 2)
+
+    def test_remote_image_fetcher_limits_and_retries(self):
+        print("\n[Indexing Test 7] Testing Remote Image Fetcher...")
+
+        class FakeResponse:
+            def __init__(self, status_code, body=b'', headers=None):
+                self.status_code, self.body, self.headers = status_code, body, headers or {}
+
+            def iter_content(self, chunk_size):
+                for i in range(0, len(self.body), chunk_size):
+                    yield self.body[i:i + chunk_size]
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        fetcher = ImageFetcher(max_concurrency=3, per_host_concurrency=2, max_bytes=100, retries=2, backoff=0)
+
+        # 503 rồi lỗi mạng -> Tự thử lại, lượt 3 thành công; 404 trả về bình thường cho nơi gọi xử lý
+        with patch.object(fetcher.session, 'get', side_effect=[
+                FakeResponse(503), requests.exceptions.ConnectionError('reset'), FakeResponse(200, b'img')]):
+            self.assertEqual(fetcher.fetch('http://cdn-a/1.jpg').content, b'img')
+        with patch.object(fetcher.session, 'get', return_value=FakeResponse(404)):
+            self.assertEqual(fetcher.fetch('http://cdn-a/dead.jpg').status_code, 404)
+        # Hết lượt thử lại / lỗi không thể thử lại (403) -> Văng lỗi ngay
+        with patch.object(fetcher.session, 'get', side_effect=requests.exceptions.Timeout('slow')) as mock_get:
+            with self.assertRaises(RemoteImageFetchError):
+                fetcher.fetch('http://cdn-a/slow.jpg')
+            self.assertEqual(mock_get.call_count, 3)
+        with patch.object(fetcher.session, 'get', return_value=FakeResponse(403)) as mock_get:
+            with self.assertRaises(RemoteImageFetchError):
+                fetcher.fetch('http://cdn-a/private.jpg')
+            self.assertEqual(mock_get.call_count, 1)
+
+        # Vượt dung lượng: chặn theo Content-Length, và cả khi máy chủ không khai báo (đếm trong lúc Stream)
+        for response in (FakeResponse(200, b'x' * 10, {'Content-Length': '5000'}), FakeResponse(200, b'x' * 101)):
+            with patch.object(fetcher.session, 'get', return_value=response):
+                with self.assertRaisesRegex(RemoteImageFetchError, 'giới hạn'):
+                    fetcher.fetch('http://cdn-a/huge.jpg')
+        # CDN nhỏ giọt: từng khối đều về kịp trước Read Timeout nhưng cả lượt tải vượt hạn chót -> Cắt ngay
+        class TrickleResponse(FakeResponse):
+            def iter_content(self, chunk_size):
+                for _ in range(50):
+                    time.sleep(0.01)
+                    yield b'x'
+
+        fetcher.total_timeout = 0.05
+        with patch.object(fetcher.session, 'get', return_value=TrickleResponse(200)) as mock_get:
+            with self.assertRaisesRegex(RemoteImageFetchError, 'giây'):
+                fetcher.fetch('http://cdn-a/trickle.jpg')
+            self.assertEqual(mock_get.call_count, 1)
+        fetcher.total_timeout = 20
+        stats = fetcher.stats()
+        self.assertEqual((stats['retries'], stats['too_large'], stats['too_slow'], stats['failures']), (4, 2, 1, 5))
+
+        # Giới hạn đồng thời: tối đa 2 lượt / máy chủ và 3 lượt toàn hệ thống
+        lock = threading.Lock()
+        active, peaks = {}, {'total': 0}
+
+        def slow_get(url, **kwargs):
+            host = url.split('/')[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peaks[host] = max(peaks.get(host, 0), active[host])
+                peaks['total'] = max(peaks['total'], sum(active.values()))
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+            return FakeResponse(200, b'ok')
+
+        with patch.object(fetcher.session, 'get', side_effect=slow_get):
+            threads = [threading.Thread(target=fetcher.fetch, args=(f'http://cdn-{h}/{i}.jpg',))
+                       for h in 'abc' for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertLessEqual(max(peaks[f'cdn-{h}'] for h in 'abc'), 2)
+        self.assertLessEqual(peaks['total'], 3)
+
+    def test_remote_image_fetcher_deadline_spans_retries(self):
+        print("\n[Indexing Test 7b] Testing Remote Image Fetcher deadline across retries...")
+        hits = []
+
+        class DripHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                hits.append(self.path)
+                # Lượt đầu: CDN ì ạch rồi trả 503; các lượt sau: nhỏ giọt từng byte (mỗi gói vẫn kịp Read Timeout)
+                if self.path == '/always-503.jpg' or len(hits) == 1:
+                    time.sleep(0.3)
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for _ in range(100):
+                        time.sleep(0.02)
+                        self.wfile.write(b'1\r\nx\r\n')
+                        self.wfile.flush()
+                    self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), DripHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        fetcher = ImageFetcher(retries=5, backoff=0.01, timeout=(1, 1), total_timeout=0.5)
+        try:
+            # 503 chậm rồi nhỏ giọt: hạn chót tính từ đầu fetch(), lượt thử lại không được thêm 0.5 giây mới
+            started = time.monotonic()
+            with self.assertRaisesRegex(RemoteImageFetchError, 'giây'):
+                fetcher.fetch(f'{base}/drip.jpg')
+            self.assertLess(time.monotonic() - started, 0.75)
+            self.assertEqual(len(hits), 2)
+
+            # 503 chậm liên tục: hết ngân sách thời gian thì dừng thử lại dù còn lượt
+            started = time.monotonic()
+            with self.assertRaisesRegex(RemoteImageFetchError, 'giây'):
+                fetcher.fetch(f'{base}/always-503.jpg')
+            self.assertLess(time.monotonic() - started, 0.75)
+            self.assertLess(hits.count('/always-503.jpg'), 6)
+        finally:
+            fetcher.session.close()
+            server.shutdown()
+            server.server_close()
+        stats = fetcher.stats()
+        self.assertEqual((stats['too_slow'], stats['failures']), (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
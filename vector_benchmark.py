@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+# =========================================================================
+# Ép Terminal của Windows đọc được Emoji và Màu sắc UTF-8
+# =========================================================================
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+    except Exception:
+        pass
+
+
+class Colors:
+    HEADER = '\033[95m'
+    BLUE = '\033[94m'
+    CYAN = '\033[96m'
+    GREEN = '\033[92m'
+    WARNING = '\033[93m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+
+
+CATEGORIES = ('phone', 'tablet', 'accessory')
+UPSERT_CHUNK = 5000
+
+
+def current_rss_kb():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return None
+
+
+def make_dataset(size, dim, queries, seed=7):
+    """
+    Vector giả lập có cấu trúc cụm (giống Embedding thật hơn nhiễu đều) + Metadata 'category'.
+    Cố định Seed để mọi Backend đo trên cùng 1 bộ dữ liệu.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((64, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    probes = centers[rng.integers(0, 64, queries)] + 0.6 * rng.standard_normal((queries, dim)).astype(np.float32)
+    categories = [CATEGORIES[i % len(CATEGORIES)] for i in range(size)]
+    return vectors, probes, categories
+
+
+def exact_top_k(vectors, probes, k, allowed=None):
+    """Đáp án chuẩn (Ground truth) theo Cosine, tính bằng float64."""
+    v = vectors.astype(np.float64)
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+    q = probes.astype(np.float64)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    scores = q @ v.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def build_backend(backend, directory, dim):
+    from app.vector_backends import ChromaVectorBackend, NumpyVectorBackend
+    if backend == 'numpy':
+        return NumpyVectorBackend(directory, dim=dim)
+    import chromadb
+    client = chromadb.PersistentClient(path=directory, settings=chromadb.Settings(anonymized_telemetry=False))
+    return ChromaVectorBackend(client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"}))
+
+
+def run_single(backend, size, dim, queries, k, output_dir):
+    """Chạy trong tiến trình con riêng để đo RSS của từng (Backend, kích thước) một cách độc lập."""
+    vectors, probes, categories = make_dataset(size, dim, queries)
+    import app.vector_backends  # noqa: F401 - Không tính chi phí import Flask/app vào RSS của chỉ mục
+    rss_start = current_rss_kb()
+
+    build_started = time.perf_counter()
+    store = build_backend(backend, output_dir, dim)
+    for i in range(0, size, UPSERT_CHUNK):
+        store.upsert(ids=[str(j) for j in range(i, min(size, i + UPSERT_CHUNK))],
+                     embeddings=vectors[i:i + UPSERT_CHUNK].tolist(),
+                     metadatas=[{'category': c} for c in categories[i:i + UPSERT_CHUNK]])
+    build_seconds = time.perf_counter() - build_started
+    rss_built = current_rss_kb()
+
+    def measure(where=None):
+        store.query(query_embeddings=[probes[0].tolist()], n_results=k, where=where)  # Warm-up
+        latencies, found = [], []
+        for probe in probes:
+            started = time.perf_counter()
+            result = store.query(query_embeddings=[probe.tolist()], n_results=k, where=where)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append({int(i) for i in result['ids'][0]})
+        return latencies, found
+
+    latencies, found = measure()
+    truth = exact_top_k(vectors, probes, k)
+    recall = np.mean([len(f & t) / k for f, t in zip(found, truth)])
+
+    filtered_latencies, filtered_found = measure({'category': 'tablet'})
+    allowed = np.array([c == 'tablet' for c in categories])
+    filtered_truth = exact_top_k(vectors, probes, k, allowed)
+    filtered_recall = np.mean([len(f & t) / k for f, t in zip(filtered_found, filtered_truth)])
+
+    return {
+        'backend': backend,
+        'size': size,
+        'build_seconds': round(build_seconds, 2),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'latency_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'recall_at_k': round(float(recall), 4),
+        'filtered_latency_p50_ms': round(float(np.percentile(filtered_latencies, 50)), 3),
+        'filtered_recall_at_k': round(float(filtered_recall), 4),
+        'rss_index_kb': (rss_built - rss_start) if None not in (rss_built, rss_start) else None
+    }
+
+
+def compare(backends, sizes, dim, queries, k):
+    report = []
+    print(f"\n{Colors.HEADER}{Colors.BOLD}📊 VECTOR BACKEND BENCHMARK (dim={dim}, top-{k}, {queries} truy vấn){Colors.ENDC}")
+    print(f"{'Backend':<8} {'N':>7} {'Build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'Recall':>7} "
+          f"{'Lọc p50':>8} {'Lọc Rc':>7} {'RSS MB':>8}")
+    for size in sizes:
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as tmp:
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--worker', backend, '--sizes', str(size),
+                     '--dim', str(dim), '--queries', str(queries), '--k', str(k), '--output', tmp],
+                    capture_output=True, text=True
+                )
+            if proc.returncode != 0:
+                print(f"{Colors.WARNING}⚠️ Backend [{backend}] N={size} lỗi:{Colors.ENDC}\n{proc.stderr[-800:]}")
+                continue
+            m = json.loads(proc.stdout.strip().splitlines()[-1])
+            rss_mb = round(m['rss_index_kb'] / 1024, 1) if m['rss_index_kb'] is not None else None
+            print(f"{backend:<8} {size:>7} {m['build_seconds']:>8} {m['latency_p50_ms']:>8} {m['latency_p95_ms']:>8} "
+                  f"{m['recall_at_k']:>7} {m['filtered_latency_p50_ms']:>8} {m['filtered_recall_at_k']:>7} {str(rss_mb):>8}")
+            report.append(m)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh Backend Vector (ChromaDB HNSW / NumPy Brute-force): độ trễ, Recall và bộ nhớ.")
+    parser.add_argument('--backends', default='numpy,chroma')
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Các kích thước kho Vector cần đo")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--report', default=None, help="Ghi kết quả ra file JSON")
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--output', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    if args.worker:
+        print(json.dumps(run_single(args.worker, sizes[0], args.dim, args.queries, args.k, args.output)))
+        return
+
+    report = compare([b.strip() for b in args.backends.split(',') if b.strip()], sizes, args.dim, args.queries, args.k)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n{Colors.GREEN}✅ Đã ghi báo cáo: {args.report}{Colors.ENDC}")
+
+
+if __name__ == "__main__":
+    main()